@@ -1,32 +1,55 @@
 from django.contrib import admin
+from . import search
+from .forms import HallLayoutForm, PromoCodeForm
 from .models import (
-    Genre, Movie, Hall, Session, Ticket, Employee,
-    PromoCode, Review, News, FAQ, CompanyInfo, Vacancy
+    Genre, Movie, Hall, HallLayout, Session, Ticket, Booking,
+    PricingRule, PromoCode, PromoRedemption, Review, News, FAQ, CompanyInfo, Vacancy
 )
 
+class FullTextSearchMixin:
+    """
+    Answers changelist searches from the full-text index instead of icontains scans.
+    """
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search.matching_ids(self.search_kind, search_term)), False
+
 @admin.register(Genre)
 class GenreAdmin(admin.ModelAdmin):
     list_display = ('name', 'description')
     search_fields = ('name',)
 
 @admin.register(Movie)
-class MovieAdmin(admin.ModelAdmin):
+class MovieAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('title', 'country', 'duration', 'rating', 'release_date')
     list_filter = ('genres', 'country', 'release_date')
     search_fields = ('title', 'description')
+    search_kind = 'movie'
     filter_horizontal = ('genres',)
 
+class HallLayoutInline(admin.StackedInline):
+    model = HallLayout
+    form = HallLayoutForm
+    can_delete = True
+
 @admin.register(Hall)
 class HallAdmin(admin.ModelAdmin):
     list_display = ('name', 'capacity')
     search_fields = ('name',)
+    inlines = (HallLayoutInline,)
 
 @admin.register(Session)
 class SessionAdmin(admin.ModelAdmin):
     list_display = ('movie', 'hall', 'start_time', 'end_time', 'price', 'is_active')
+    readonly_fields = ('end_time',)
     list_filter = ('is_active', 'start_time', 'movie')
     search_fields = ('movie__title', 'hall__name')
     date_hierarchy = 'start_time'
+    list_select_related = ('movie', 'hall')
+    autocomplete_fields = ('movie', 'hall')
 
 @admin.register(Ticket)
 class TicketAdmin(admin.ModelAdmin):
@@ -34,18 +57,48 @@ class TicketAdmin(admin.ModelAdmin):
     list_filter = ('is_used', 'purchase_date')
     search_fields = ('user__username', 'session__movie__title')
     date_hierarchy = 'purchase_date'
+    list_select_related = ('session__movie', 'user')
+    autocomplete_fields = ('session',)
+    raw_id_fields = ('user',)
 
-@admin.register(Employee)
-class EmployeeAdmin(admin.ModelAdmin):
-    list_display = ('user', 'position', 'phone', 'birth_date', 'hire_date', 'is_active')
-    list_filter = ('position', 'is_active')
-    search_fields = ('user__username', 'user__first_name', 'user__last_name')
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+    list_display = ('session', 'user', 'seat_number', 'booking_date', 'expiry_date', 'price', 'is_active')
+    list_filter = ('is_active', 'booking_date')
+    search_fields = ('user__username', 'session__movie__title')
+    date_hierarchy = 'booking_date'
+    list_select_related = ('session__movie', 'user')
+    autocomplete_fields = ('session',)
+    raw_id_fields = ('user',)
 
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
-    list_display = ('code', 'discount', 'start_date', 'end_date', 'is_active')
-    list_filter = ('is_active', 'start_date', 'end_date')
+    form = PromoCodeForm
+    list_display = ('code', 'discount_percent', 'expiry_date', 'used_count', 'max_uses', 'max_uses_per_user', 'is_active')
+    list_filter = ('is_active', 'expiry_date')
     search_fields = ('code',)
+    readonly_fields = ('used_count',)
+
+@admin.register(PromoRedemption)
+class PromoRedemptionAdmin(admin.ModelAdmin):
+    list_display = ('promo', 'user', 'session', 'action', 'seats', 'amount', 'discount', 'created_at')
+    list_filter = ('action', 'created_at')
+    search_fields = ('promo__code', 'user__username')
+    date_hierarchy = 'created_at'
+    list_select_related = ('promo', 'user', 'session__movie')
+    raw_id_fields = ('user', 'session')
+
+    def has_change_permission(self, request, obj=None):
+        # The ledger is append-only
+        return False
+
+@admin.register(PricingRule)
+class PricingRuleAdmin(admin.ModelAdmin):
+    list_display = (
+        'name', 'percent', 'weekdays', 'time_from', 'time_to', 'seat_category', 'min_occupancy', 'priority', 'is_active'
+    )
+    list_filter = ('is_active', 'seat_category')
+    search_fields = ('name',)
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
@@ -53,6 +106,9 @@ class ReviewAdmin(admin.ModelAdmin):
     list_filter = ('rating', 'created_at')
     search_fields = ('user__username', 'movie__title', 'text')
     date_hierarchy = 'created_at'
+    list_select_related = ('user', 'movie')
+    autocomplete_fields = ('movie',)
+    raw_id_fields = ('user',)
 
 @admin.register(News)
 class NewsAdmin(admin.ModelAdmin):
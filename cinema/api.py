@@ -0,0 +1,186 @@
+"""
+Read-only JSON API for kiosks and the mobile app.
+Responses are built from values() rows rather than model instances, and
+every endpoint answers conditional GETs: the ETag and Last-Modified come
+from one cheap query over the rows' updated_at (and, for the schedule and
+seat maps, the seat counters), so a client polling an unchanged resource
+gets 304 Not Modified without the payload being built.
+"""
+import hashlib
+from datetime import datetime, time as day_time, timedelta
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from . import caching, layouts, seating
+from .models import Genre, Movie, Session
+
+API_VERSION = 1
+
+MOVIE_FIELDS = ('id', 'title', 'country', 'duration', 'rating', 'release_date', 'poster')
+MOVIE_DETAIL_FIELDS = MOVIE_FIELDS + ('description',)
+
+
+def _etag(*parts):
+    return hashlib.sha1(repr((API_VERSION,) + parts).encode()).hexdigest()
+
+
+def fingerprint(queryset, *extra, required=False):
+    """
+    Returns (etag, last_modified) for the rows of a queryset. The row count
+    is part of the ETag so that deleting a row changes it too. With required,
+    returns None when there are no rows.
+    """
+    state = queryset.order_by().aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+    if required and not state['count']:
+        return None
+    return _etag(state['count'], state['last_modified'], *extra), state['last_modified']
+
+
+def conditional(state_func):
+    """
+    Decorator answering conditional GETs for a view. state_func(request, *args, **kwargs)
+    returns (etag, last_modified), or None when the resource does not exist; it is
+    called once per request however many validators Django asks for.
+    """
+    def state(request, *args, **kwargs):
+        if not hasattr(request, '_api_state'):
+            request._api_state = state_func(request, *args, **kwargs) or (None, None)
+        return request._api_state
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: state(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: state(request, *args, **kwargs)[1],
+    )
+
+
+def _poster_url(name):
+    return Movie._meta.get_field('poster').storage.url(name) if name else None
+
+
+def movie_queryset(params):
+    queryset = Movie.objects.all()
+    if params.get('genre', '').isdigit():
+        queryset = queryset.filter(genres=params['genre'])
+    return queryset
+
+
+def movie_rows(queryset, fields=MOVIE_FIELDS):
+    """
+    Serializes movies with their genre ids, in two queries.
+    """
+    rows = list(queryset.order_by('-release_date', '-pk').values(*fields))
+    genres = {}
+    links = Movie.genres.through.objects.filter(movie_id__in=[row['id'] for row in rows])
+    for movie_id, genre_id in links.values_list('movie_id', 'genre_id'):
+        genres.setdefault(movie_id, []).append(genre_id)
+    for row in rows:
+        row['poster'] = _poster_url(row['poster'])
+        row['genres'] = genres.get(row['id'], [])
+    return rows
+
+
+def movies_state(request):
+    # Genre links change without touching Movie.updated_at but bump the Movie cache version
+    return fingerprint(movie_queryset(request.GET), caching.version(Movie), request.GET.get('genre'))
+
+
+def movie_state(request, pk):
+    return fingerprint(Movie.objects.filter(pk=pk), caching.version(Movie), required=True)
+
+
+def genre_rows():
+    return list(Genre.objects.order_by('name').values('id', 'name', 'description'))
+
+
+def genres_state(request):
+    return fingerprint(Genre.objects.all())
+
+
+def session_queryset(params):
+    """
+    Active sessions of one day (?date=YYYY-MM-DD, today by default),
+    optionally of one hall (?hall=) or movie (?movie=). Returns None for a malformed date.
+    """
+    try:
+        day = datetime.strptime(params['date'], '%Y-%m-%d').date() if params.get('date') else timezone.localdate()
+    except ValueError:
+        return None
+    # A range on start_time rather than __date, so the start_time index is used
+    start = timezone.make_aware(datetime.combine(day, day_time.min))
+    queryset = Session.objects.filter(is_active=True, start_time__gte=start, start_time__lt=start + timedelta(days=1))
+    for param in ('hall', 'movie'):
+        if params.get(param, '').isdigit():
+            queryset = queryset.filter(**{f'{param}_id': params[param]})
+    return queryset
+
+
+def session_rows(queryset):
+    rows = queryset.order_by('start_time', 'pk').values(
+        'id', 'movie_id', 'movie__title', 'hall_id', 'hall__name', 'start_time', 'price',
+        'total_seats', 'sold_count', 'held_count'
+    )
+    return [
+        {
+            'id': row['id'],
+            'movie': {'id': row['movie_id'], 'title': row['movie__title']},
+            'hall': {'id': row['hall_id'], 'name': row['hall__name']},
+            'start_time': row['start_time'],
+            'price': row['price'],
+            'total_seats': row['total_seats'],
+            'free_seats': max(row['total_seats'] - row['sold_count'] - row['held_count'], 0),
+        }
+        for row in rows
+    ]
+
+
+def sessions_state(request):
+    """
+    Every seat sold, held or released stamps its session's updated_at along
+    with the seat counters, so the sessions' own rows tell whether the
+    schedule changed.
+    """
+    queryset = session_queryset(request.GET)
+    if queryset is None:
+        return None
+    rows = list(queryset.order_by('pk').values_list('pk', 'sold_count', 'held_count', 'updated_at'))
+    last_modified = max((row[3] for row in rows), default=None)
+    # The movie titles in the payload follow Movie changes
+    return _etag(rows, caching.version(Movie), request.GET.urlencode()), last_modified
+
+
+def seat_map_state(request, pk):
+    """
+    The ETag hashes the seat bitmap itself; Last-Modified is the session's
+    updated_at, which every seat change stamps.
+    """
+    session = Session.objects.filter(pk=pk).only('id', 'total_seats', 'updated_at').first()
+    if session is None:
+        return None
+    request._api_session = session
+    seat_map = seating.get_seat_map(session)
+    return _etag(session.pk, session.total_seats, bytes(seat_map.bits)), session.updated_at
+
+
+def seat_map_data(session):
+    seat_map = seating.get_seat_map(session)
+    taken = [seat for seat in range(1, seat_map.total_seats + 1) if seat_map.is_taken(seat)]
+    return {
+        'session': session.pk,
+        'total_seats': seat_map.total_seats,
+        'free_seats': seat_map.total_seats - len(taken),
+        'taken': taken,
+    }
+
+
+def best_seats_data(session, count, categories):
+    """
+    The best free run of count adjacent seats, with row and place when the hall has a layout.
+    """
+    plan, has_layout = layouts.plan_for_session(session)
+    seats = plan.best_seats(seating.get_seat_map(session), count, categories)
+    return {
+        'session': session.pk,
+        'seats': [plan.seat(seat) if has_layout else {'seat': seat} for seat in seats],
+    }
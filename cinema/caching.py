@@ -0,0 +1,133 @@
+"""
+Response and template fragment caching for the catalog pages.
+Cache keys embed a version number per model; the signal handlers bump the
+version when a row is saved or deleted, so stale entries are never read
+again and simply age out of the cache.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+
+CACHE_TIMEOUT = getattr(settings, 'CINEMA_CACHE_TIMEOUT', 300)
+
+
+def _version_key(model):
+    return f'cinema:version:{model._meta.label_lower}'
+
+
+def bump(model):
+    """
+    Invalidates every cached response and fragment built from the model.
+    """
+    key = _version_key(model)
+    if not cache.add(key, 2, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The key was evicted between add() and incr()
+            cache.set(key, 2, timeout=None)
+
+
+def version(*models):
+    """
+    Returns a string identifying the current versions of the given models.
+    """
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    return '.'.join(str(versions.get(key, 1)) for key in keys)
+
+
+async def aversion(*models):
+    """
+    Async counterpart of version().
+    """
+    keys = [_version_key(model) for model in models]
+    versions = await cache.aget_many(keys)
+    return '.'.join(str(versions.get(key, 1)) for key in keys)
+
+
+def fragment_context(*models):
+    """
+    Context for {% cache cache_timeout <name> ... cache_version %} fragments.
+    """
+    return {'cache_timeout': CACHE_TIMEOUT, 'cache_version': version(*models)}
+
+
+async def afragment_context(*models):
+    return {'cache_timeout': CACHE_TIMEOUT, 'cache_version': await aversion(*models)}
+
+
+def _cacheable(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+def _response_key(request, model_version):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'cinema:view:{path}:{model_version}'
+
+
+def cache_anonymous(*models, timeout=None):
+    """
+    Decorator caching the whole response for anonymous visitors, keyed by
+    the full path and the versions of the models the view renders.
+    Signed-in users, pending messages and responses that need a CSRF cookie
+    always go through the view. Works on sync and async views.
+    """
+    timeout = CACHE_TIMEOUT if timeout is None else timeout
+
+    def storer(request, key):
+        def store(response):
+            if response.status_code == 200 and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                cache.set(key, response, timeout)
+        return store
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapped(request, *args, **kwargs):
+                # The user and the messages may need the session, which is loaded synchronously
+                if not await sync_to_async(_cacheable)(request):
+                    return await view(request, *args, **kwargs)
+
+                key = _response_key(request, await aversion(*models))
+                response = await cache.aget(key)
+                if response is not None:
+                    return response
+
+                response = await view(request, *args, **kwargs)
+                store = storer(request, key)
+                if hasattr(response, 'render') and callable(response.render):
+                    # Template responses are rendered, and stored, in a worker thread
+                    response.add_post_render_callback(store)
+                else:
+                    await sync_to_async(store)(response)
+                return response
+            return async_wrapped
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key = _response_key(request, version(*models))
+            response = cache.get(key)
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            store = storer(request, key)
+            if hasattr(response, 'render') and callable(response.render):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,121 @@
+"""
+Streaming data exports for staff.
+Rows are read with values_list() through a server-side iterator and encoded
+one at a time, so an export runs in constant memory whatever its size. CSV
+text cells that a spreadsheet would run as formulas are escaped.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import statistics
+from .models import Booking, PromoRedemption, Review, Ticket
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+# Leading characters that make spreadsheets read a text cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+
+def _tickets(start_date, end_date):
+    return Ticket.objects.filter(purchase_date__range=[start_date, end_date]).order_by('pk'), (
+        'id', 'session_id', 'session__movie__title', 'session__hall__name',
+        'user__username', 'seat_number', 'price', 'purchase_date', 'is_used'
+    )
+
+
+def _bookings(start_date, end_date):
+    return Booking.objects.filter(booking_date__range=[start_date, end_date]).order_by('pk'), (
+        'id', 'session_id', 'session__movie__title', 'session__hall__name',
+        'user__username', 'seat_number', 'price', 'booking_date', 'expiry_date', 'is_active'
+    )
+
+
+def _reviews(start_date, end_date):
+    return Review.objects.filter(created_at__range=[start_date, end_date]).order_by('pk'), (
+        'id', 'movie_id', 'movie__title', 'user__username', 'rating', 'text', 'created_at'
+    )
+
+
+def _promo_redemptions(start_date, end_date):
+    return PromoRedemption.objects.filter(created_at__range=[start_date, end_date]).order_by('pk'), (
+        'id', 'promo__code', 'user__username', 'session_id', 'session__movie__title',
+        'action', 'seats', 'amount', 'discount', 'created_at'
+    )
+
+
+def _movies(start_date, end_date):
+    return statistics.movie_statistics(start_date, end_date), (
+        'id', 'title', 'tickets_sold', 'revenue', 'active_bookings', 'avg_rating'
+    )
+
+
+def _sessions(start_date, end_date):
+    return statistics.session_statistics(start_date, end_date), (
+        'id', 'movie__title', 'hall__name', 'start_time', 'price',
+        'total_seats', 'sold_count', 'held_count'
+    )
+
+
+def _users(start_date, end_date):
+    return statistics.user_activity(start_date, end_date), (
+        'id', 'username', 'tickets_bought', 'active_bookings', 'total_spent', 'reviews_count'
+    )
+
+
+DATASETS = {
+    'tickets': _tickets,
+    'bookings': _bookings,
+    'reviews': _reviews,
+    'promo_redemptions': _promo_redemptions,
+    'movies': _movies,
+    'sessions': _sessions,
+    'users': _users,
+}
+
+
+class _Echo:
+    """
+    File-like object whose write() hands the encoded line back to the caller.
+    """
+    def write(self, value):
+        return value
+
+
+def export_rows(dataset, start_date, end_date):
+    """
+    Returns the column names and a lazy iterator over the dataset rows as tuples.
+    """
+    queryset, columns = DATASETS[dataset](start_date, end_date)
+    return columns, queryset.values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _csv_cell(value):
+    """
+    Escapes text that a spreadsheet would evaluate as a formula with a leading quote.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream(dataset, export_format, start_date, end_date):
+    """
+    Yields the dataset encoded as CSV (with a header row) or JSON lines.
+    """
+    columns, rows = export_rows(dataset, start_date, end_date)
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_csv_cell(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
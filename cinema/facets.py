@@ -0,0 +1,182 @@
+"""
+Faceted movie catalog.
+Keeps a per-process index mapping every facet value to the set of movie
+ids that have it, so any combination of filters is answered by set unions
+and intersections, and the counts next to each option come for free.
+The index is rebuilt when the Movie, Genre or Session cache versions move
+(see cinema.caching) and at least every FACET_INDEX_TTL seconds, since
+"sessions this week" also depends on the clock.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import caching
+from .models import Genre, Movie, Session
+
+FACET_INDEX_TTL = getattr(settings, 'FACET_INDEX_TTL', 300)
+
+RATING_BANDS = (
+    ('9+', 'от 9', 9, None),
+    ('7-9', '7–9', 7, 9),
+    ('5-7', '5–7', 5, 7),
+    ('0-5', 'до 5', None, 5),
+)
+
+DURATION_BANDS = (
+    ('short', 'до 90 мин', None, 90),
+    ('medium', '90–120 мин', 90, 121),
+    ('long', 'больше 2 ч', 121, None),
+)
+
+# Request parameter -> heading, in display order
+FACETS = {
+    'genre': 'Жанр',
+    'country': 'Страна',
+    'rating': 'Рейтинг',
+    'duration': 'Длительность',
+    'this_week': 'Сеансы',
+}
+
+_BAND_ORDER = {
+    'rating': [band[0] for band in RATING_BANDS],
+    'duration': [band[0] for band in DURATION_BANDS],
+}
+
+
+@dataclass
+class FacetIndex:
+    """
+    Movie ids per facet value, plus every movie id in catalog order.
+    """
+    version: str
+    built_at: float
+    order: list
+    values: dict = field(default_factory=dict)
+    labels: dict = field(default_factory=dict)
+
+    def add(self, facet, value, label, movie_id):
+        self.values.setdefault(facet, {}).setdefault(value, set()).add(movie_id)
+        self.labels.setdefault(facet, {})[value] = label
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _band(bands, number):
+    for value, label, low, high in bands:
+        if (low is None or number >= low) and (high is None or number < high):
+            return value, label
+    return None
+
+
+def _build(version):
+    now = timezone.now()
+    movies = Movie.objects.order_by('-release_date', '-pk').values_list('pk', 'country', 'rating', 'duration')
+    index = FacetIndex(version=version, built_at=time.monotonic(), order=[])
+    # Bands are listed even when no movie falls into them
+    for facet, bands in (('rating', RATING_BANDS), ('duration', DURATION_BANDS)):
+        index.values[facet] = {value: set() for value, _, _, _ in bands}
+        index.labels[facet] = {value: label for value, label, _, _ in bands}
+    for movie_id, country, rating, duration in movies.iterator(chunk_size=2000):
+        index.order.append(movie_id)
+        index.add('country', country, country, movie_id)
+        index.add('rating', *_band(RATING_BANDS, rating), movie_id)
+        index.add('duration', *_band(DURATION_BANDS, duration), movie_id)
+
+    genre_names = dict(Genre.objects.values_list('pk', 'name'))
+    for movie_id, genre_id in Movie.genres.through.objects.values_list('movie_id', 'genre_id').iterator(chunk_size=2000):
+        index.add('genre', str(genre_id), genre_names[genre_id], movie_id)
+
+    showing = Session.objects.filter(
+        is_active=True,
+        start_time__range=[now, now + timezone.timedelta(days=7)]
+    ).values_list('movie_id', flat=True).distinct()
+    index.values['this_week'] = {'1': set(showing)}
+    index.labels['this_week'] = {'1': 'Есть сеансы на этой неделе'}
+    return index
+
+
+def get_index():
+    """
+    Returns the current facet index, rebuilding it if the catalog changed or it is too old.
+    """
+    global _index
+    version = caching.version(Movie, Genre, Session)
+    index = _index
+    if index is None or index.version != version or time.monotonic() - index.built_at > FACET_INDEX_TTL:
+        with _lock:
+            index = _index
+            if index is None or index.version != version or time.monotonic() - index.built_at > FACET_INDEX_TTL:
+                index = _index = _build(version)
+    return index
+
+
+def invalidate():
+    global _index
+    _index = None
+
+
+def parse_selection(params):
+    """
+    Reads the selected facet values from a QueryDict. Genres may be given by id or by name.
+    """
+    selection = {}
+    for facet in FACETS:
+        values = {value for value in params.getlist(facet) if value}
+        if facet == 'genre' and any(not value.isdigit() for value in values):
+            names = {value for value in values if not value.isdigit()}
+            values = (values - names) | {
+                str(pk) for pk in Genre.objects.filter(name__in=names).values_list('pk', flat=True)
+            }
+        if values:
+            selection[facet] = values
+    return selection
+
+
+def _matches(index, facet, values):
+    facet_values = index.values.get(facet, {})
+    return set().union(*(facet_values.get(value, ()) for value in values))
+
+
+def browse(selection):
+    """
+    Applies a selection {facet: {values}}: values of one facet are alternatives,
+    different facets must all match. Returns the matching movie ids in catalog
+    order and the counts per facet option, each counted with the other facets applied.
+    """
+    index = get_index()
+    matched = {facet: _matches(index, facet, values) for facet, values in selection.items()}
+    every = set(index.order)
+
+    def restricted(excluded=None):
+        ids = every
+        for facet, facet_ids in matched.items():
+            if facet != excluded:
+                ids = ids & facet_ids
+        return ids
+
+    result = restricted()
+    counts = {}
+    for facet in FACETS:
+        base = restricted(excluded=facet) if facet in matched else result
+        options = [
+            {
+                'value': value,
+                'label': index.labels[facet][value],
+                'count': len(ids & base),
+                'selected': value in selection.get(facet, ()),
+            }
+            for value, ids in index.values.get(facet, {}).items()
+        ]
+        if facet in _BAND_ORDER:
+            options.sort(key=lambda option: _BAND_ORDER[facet].index(option['value']))
+        else:
+            options.sort(key=lambda option: (-option['count'], option['label']))
+        counts[facet] = options
+
+    return [movie_id for movie_id in index.order if movie_id in result], counts
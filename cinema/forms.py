@@ -1,7 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
-from .models import Review, PromoCode
+from . import promos
+from .models import HallLayout, Review, PromoCode
 import re
 
 User = get_user_model()
@@ -69,19 +70,20 @@ class PromoCodeForm(forms.ModelForm):
     """
     class Meta:
         model = PromoCode
-        fields = ['code', 'discount_percent', 'expiry_date']
+        fields = ['code', 'discount_percent', 'expiry_date', 'max_uses', 'max_uses_per_user']
         widgets = {
             'expiry_date': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
         }
 
     def clean_code(self):
         """
-        Validates that the promo code is unique and properly formatted.
+        Validates that the promo code is unique, ignoring case, and properly formatted.
+        Uniqueness is checked against the in-memory promo code index.
         """
         code = self.cleaned_data.get('code')
         if not code.isalnum():
             raise forms.ValidationError('Promo code must contain only letters and numbers.')
-        if PromoCode.objects.filter(code=code).exists():
+        if promos.code_exists(code, exclude_pk=self.instance.pk):
             raise forms.ValidationError('This promo code already exists.')
         return code
 
@@ -92,4 +94,38 @@ class PromoCodeForm(forms.ModelForm):
         discount = self.cleaned_data.get('discount_percent')
         if discount < 0 or discount > 100:
             raise forms.ValidationError('Discount must be between 0 and 100 percent.')
-        return discount 
\ No newline at end of file
+        return discount
+
+class HallLayoutForm(forms.ModelForm):
+    """
+    Form for editing a hall layout as a text plan.
+    One line per row, one symbol per cell: S standard, V VIP, A accessible,
+    X blocked seat, . aisle.
+    """
+    plan = forms.CharField(
+        widget=forms.Textarea(attrs={'rows': 12, 'style': 'font-family: monospace'}),
+        help_text='One line per row: S standard, V VIP, A accessible, X blocked seat, . aisle.'
+    )
+
+    class Meta:
+        model = HallLayout
+        fields = ['plan']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial.setdefault('plan', self.instance.plan)
+
+    def clean_plan(self):
+        """
+        Validates the plan and converts it into the layout grid.
+        """
+        try:
+            self.grid = HallLayout.parse_plan(self.cleaned_data.get('plan', ''))
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+        return self.cleaned_data['plan']
+
+    def save(self, commit=True):
+        self.instance.rows, self.instance.columns, self.instance.cells = self.grid
+        return super().save(commit)
@@ -0,0 +1,90 @@
+"""
+Idempotent checkouts.
+The buy page issues a fresh key with every form it renders, and API
+clients send one in an Idempotency-Key header. cinema.seating stores the
+key with the claimed tickets or bookings in the claim's transaction, so a
+repeated request with the same key (a double click or a browser retry)
+gets the original objects back without touching the seat tables. Keys are
+remembered for CHECKOUT_KEY_TTL.
+"""
+import re
+import secrets
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Booking, CheckoutKey, Ticket
+
+CHECKOUT_KEY_TTL = timezone.timedelta(seconds=getattr(settings, 'CHECKOUT_KEY_TTL', 3600))
+
+_KEY_RE = re.compile(r'[A-Za-z0-9_-]{8,64}')
+
+
+class InvalidCheckoutKey(Exception):
+    """
+    Raised when a key is malformed or was already used for a different checkout.
+    """
+
+
+def new_key():
+    return secrets.token_urlsafe(24)
+
+
+def check_key(key):
+    if not isinstance(key, str) or not _KEY_RE.fullmatch(key):
+        raise InvalidCheckoutKey('Invalid checkout key.')
+
+
+def replay(key, user, session, action, seat_numbers, now=None):
+    """
+    Returns the tickets or bookings claimed by an earlier checkout with the
+    key, ordered by seat number, or None if the key is new or has expired.
+    The key is also treated as expired when any of those objects is gone,
+    or for bookings when any of the holds has since ended.
+
+    Raises:
+        InvalidCheckoutKey: if the key came with another session, action or seats
+    """
+    now = now or timezone.now()
+    record = CheckoutKey.objects.filter(user=user, key=key, created_at__gt=now - CHECKOUT_KEY_TTL).first()
+    if record is None:
+        return None
+    if (record.session_id, record.action, record.seat_numbers) != (session.pk, action, list(seat_numbers)):
+        raise InvalidCheckoutKey('This checkout was already submitted with other seats.')
+    claimed = (Ticket if action == 'buy' else Booking).objects.filter(
+        pk__in=record.object_ids,
+        user_id=user.pk,
+        session_id=session.pk,
+        seat_number__in=record.seat_numbers
+    )
+    if action == 'book':
+        # A released or bought hold is not handed out again
+        claimed = claimed.filter(is_active=True)
+    claimed = list(claimed.order_by('seat_number'))
+    if len(claimed) != len(record.object_ids):
+        return None
+    return claimed
+
+
+def remember(key, user, session, action, seat_numbers, claimed):
+    """
+    Stores the result of a checkout under its key.
+    """
+    # An expired row with the same key may still be waiting to be pruned
+    CheckoutKey.objects.filter(user=user, key=key).delete()
+    CheckoutKey.objects.create(
+        key=key,
+        user=user,
+        session=session,
+        action=action,
+        seat_numbers=list(seat_numbers),
+        object_ids=[obj.pk for obj in claimed]
+    )
+
+
+def prune(now=None):
+    """
+    Deletes keys older than CHECKOUT_KEY_TTL. Returns the number deleted.
+    """
+    now = now or timezone.now()
+    return CheckoutKey.objects.filter(created_at__lt=now - CHECKOUT_KEY_TTL).delete()[0]
@@ -0,0 +1,131 @@
+"""
+Resized image variants for posters and news/company pictures.
+Each uploaded image gets JPEG and WebP copies at a few widths, stored next
+to the original under names containing a hash of its content. The names are
+recorded in a JSON manifest on the model, which the {% responsive_image %}
+tag turns into srcset attributes without touching the storage.
+"""
+import hashlib
+import os
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import CompanyInfo, Movie, News
+
+VARIANT_WIDTHS = getattr(settings, 'IMAGE_VARIANT_WIDTHS', (320, 640, 960))
+VARIANT_QUALITY = getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'method': 4}),
+    'jpeg': ('JPEG', {'optimize': True, 'progressive': True}),
+}
+
+# (model, image field, manifest field)
+IMAGE_FIELDS = (
+    (Movie, 'poster', 'poster_variants'),
+    (News, 'image', 'image_variants'),
+    (CompanyInfo, 'image', 'image_variants'),
+)
+
+# MEDIA_ROOT directories walked by the process_media command
+MEDIA_DIRS = getattr(settings, 'MEDIA_SCAN_DIRS', (
+    'movie_posters', 'posters', 'news', 'news_images', 'company_images'
+))
+
+VARIANT_NAME = re.compile(r'\.[0-9a-f]{12}\.\d+\.(%s)$' % '|'.join(VARIANT_FORMATS))
+
+
+def content_hash(storage, name):
+    """
+    Returns the short content hash used in variant names.
+    """
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as source:
+        for chunk in iter(lambda: source.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def generate_variants(storage, name, verify=False, digest=None):
+    """
+    Writes the variants of a stored image that do not exist yet and
+    returns the manifest: {'source': name, 'hash': ..., 'width': ...,
+    'height': ..., 'variants': {format: {width: name}}}.
+    With verify, the file is fully checked for corruption first.
+    """
+    stem, _ = os.path.splitext(name)
+    digest = digest or content_hash(storage, name)
+
+    if verify:
+        with storage.open(name, 'rb') as source:
+            Image.open(source).verify()
+    with storage.open(name, 'rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    # Never upscale; an image narrower than every width gets one variant at its own size
+    widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+    variants = {variant_format: {} for variant_format in VARIANT_FORMATS}
+    for width in widths:
+        resized = None
+        for variant_format, (pil_format, options) in VARIANT_FORMATS.items():
+            variant_name = f'{stem}.{digest}.{width}.{variant_format}'
+            if not storage.exists(variant_name):
+                if resized is None:
+                    height = round(image.height * width / image.width)
+                    resized = image.resize((width, height), Image.LANCZOS)
+                buffer = BytesIO()
+                resized.save(buffer, pil_format, quality=VARIANT_QUALITY, **options)
+                variant_name = storage.save(variant_name, ContentFile(buffer.getvalue()))
+            variants[variant_format][str(width)] = variant_name
+
+    return {
+        'source': name,
+        'hash': digest,
+        'width': image.width,
+        'height': image.height,
+        'variants': variants,
+    }
+
+
+def variant_names(manifest):
+    """
+    Returns the set of variant file names recorded in a manifest.
+    """
+    return {name for sizes in manifest.get('variants', {}).values() for name in sizes.values()}
+
+
+def delete_stale(storage, old_manifest, new_manifest):
+    """
+    Deletes the variants of the old manifest that the new one no longer uses.
+    """
+    for name in variant_names(old_manifest) - variant_names(new_manifest):
+        storage.delete(name)
+
+
+def refresh_variants(instance, image_field, manifest_field, force=False):
+    """
+    Regenerates the variants of one object when its image changed since the
+    manifest was written (or always with force) and saves the manifest with
+    a queryset update. Returns True if anything was regenerated.
+    """
+    field_file = getattr(instance, image_field)
+    manifest = getattr(instance, manifest_field) or {}
+    if not field_file:
+        new_manifest = {}
+    elif not force and manifest.get('source') == field_file.name:
+        return False
+    else:
+        new_manifest = generate_variants(field_file.storage, field_file.name)
+    if new_manifest == manifest:
+        return False
+
+    delete_stale(field_file.storage, manifest, new_manifest)
+    type(instance).objects.filter(pk=instance.pk).update(**{manifest_field: new_manifest})
+    setattr(instance, manifest_field, new_manifest)
+    return True
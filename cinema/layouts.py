@@ -0,0 +1,234 @@
+"""
+Hall seat plans and best-available seat selection.
+A HallLayout is compiled once into grids of cell codes, seat numbers and
+seat quality scores and kept per process, as is the plan of each hall
+until the layouts change. Picking the best N adjacent
+seats then scores every window of N cells in the hall in one vectorized
+pass over those grids and the session's occupancy bitmap. NumPy is used
+when installed; without it the same search runs row by row in Python.
+"""
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+from . import caching
+from .models import HallLayout
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without NumPy
+    np = None
+
+# Categories offered when the buyer does not ask for one; accessible seats
+# are only picked on request
+DEFAULT_CATEGORIES = (HallLayout.STANDARD, HallLayout.VIP)
+
+CATEGORY_NAMES = {
+    HallLayout.STANDARD: 'standard',
+    HallLayout.VIP: 'vip',
+    HallLayout.ACCESSIBLE: 'accessible',
+}
+
+# Weight of the distance from the best row against the distance from the centre line
+ROW_WEIGHT = 0.5
+
+# Seconds a hall's plan is trusted without checking the layout version again
+HALL_PLAN_TTL = getattr(settings, 'HALL_PLAN_TTL', 60)
+
+_plans = {}
+# Hall ID -> (layout version, loaded at, plan or None); one entry per hall
+_hall_plans = {}
+_lock = threading.Lock()
+
+
+class SeatPlan:
+    """
+    A layout compiled for seat selection. codes and numbers are rows x columns
+    grids (nested lists without NumPy); numbers holds 0 for aisles and blocked
+    seats. positions maps a seat number to its (row, place) counted from 1.
+    """
+    def __init__(self, rows, columns, cells):
+        self.rows = rows
+        self.columns = columns
+        self.positions = [None]
+        self.categories = [None]
+        numbers = []
+        for row in range(rows):
+            line = []
+            place = 0
+            for column in range(columns):
+                code = cells[row * columns + column]
+                if code in (HallLayout.AISLE, HallLayout.BLOCKED):
+                    line.append(0)
+                    continue
+                place += 1
+                self.positions.append((row + 1, place))
+                self.categories.append(code)
+                line.append(len(self.positions) - 1)
+            numbers.append(line)
+        self.seat_count = len(self.positions) - 1
+        self.cells = cells
+
+        # Seats near the centre line, about two thirds of the way back, score best (lowest)
+        centre = (columns - 1) / 2
+        best_row = (rows - 1) * 2 / 3
+        scores = [
+            [((column - centre) / columns) ** 2 + ROW_WEIGHT * ((row - best_row) / rows) ** 2 for column in range(columns)]
+            for row in range(rows)
+        ]
+        if np is not None:
+            self.codes = np.frombuffer(cells, dtype=np.uint8).reshape(rows, columns)
+            self.numbers = np.array(numbers, dtype=np.int32)
+            self.scores = np.array(scores)
+        else:
+            self.codes = [list(cells[row * columns:(row + 1) * columns]) for row in range(rows)]
+            self.numbers = numbers
+            self.scores = scores
+
+    def seat(self, number):
+        row, place = self.positions[number]
+        return {
+            'seat': number,
+            'row': row,
+            'place': place,
+            'category': CATEGORY_NAMES[self.categories[number]],
+        }
+
+    def grid(self, seat_map):
+        """
+        Returns the plan as rows of cells for rendering: each cell has its code,
+        seat number (None for aisles and blocked seats) and whether it is free.
+        """
+        grid = []
+        for row in range(self.rows):
+            line = []
+            for column in range(self.columns):
+                code = self.cells[row * self.columns + column]
+                number = int(self.numbers[row][column]) or None
+                line.append({
+                    'code': code,
+                    'seat': number,
+                    'place': self.positions[number][1] if number else None,
+                    'category': CATEGORY_NAMES.get(code),
+                    'blocked': code == HallLayout.BLOCKED,
+                    'free': bool(number) and not seat_map.is_taken(number),
+                })
+            grid.append(line)
+        return grid
+
+    def best_seats(self, seat_map, count, categories=DEFAULT_CATEGORIES):
+        """
+        Returns the seat numbers of the best-scoring free run of count adjacent
+        seats in one row, all of the given categories, or [] if there is none.
+        """
+        if count < 1 or count > self.columns:
+            return []
+        if np is None:
+            return self._best_seats_python(seat_map, count, categories)
+
+        # Occupancy of every seat number from the session's bitmap, bit N for seat N
+        taken = np.unpackbits(np.frombuffer(bytes(seat_map.bits), dtype=np.uint8), bitorder='little').astype(bool)
+        if len(taken) <= self.seat_count:
+            taken = np.pad(taken, (0, self.seat_count + 1 - len(taken)))
+        free = (self.numbers > 0) & np.isin(self.codes, categories) & ~taken[self.numbers]
+
+        # Sums over every window of count cells in a row, from running totals
+        zeros = np.zeros((self.rows, 1))
+        free_totals = np.cumsum(np.hstack((zeros, free)), axis=1)
+        score_totals = np.cumsum(np.hstack((zeros, self.scores)), axis=1)
+        window_free = free_totals[:, count:] - free_totals[:, :-count]
+        window_score = score_totals[:, count:] - score_totals[:, :-count]
+        window_score[window_free < count] = np.inf
+        row, start = np.unravel_index(np.argmin(window_score), window_score.shape)
+        if not np.isfinite(window_score[row, start]):
+            return []
+        return [int(number) for number in self.numbers[row, start:start + count]]
+
+    def _best_seats_python(self, seat_map, count, categories):
+        best = None
+        for row in range(self.rows):
+            numbers = self.numbers[row]
+            run = 0
+            for column in range(self.columns):
+                number = numbers[column]
+                if number and self.codes[row][column] in categories and not seat_map.is_taken(number):
+                    run += 1
+                else:
+                    run = 0
+                if run >= count:
+                    start = column - count + 1
+                    score = sum(self.scores[row][start:column + 1])
+                    if best is None or score < best[0]:
+                        best = (score, numbers[start:column + 1])
+        return [int(number) for number in best[1]] if best else []
+
+
+def get_plan(layout):
+    """
+    Returns the compiled plan of a layout, rebuilt when the layout is saved.
+    """
+    key = (layout.pk, layout.updated_at)
+    with _lock:
+        plan = _plans.get(layout.pk)
+    if plan is not None and plan[0] == key:
+        return plan[1]
+    compiled = SeatPlan(layout.rows, layout.columns, bytes(layout.cells))
+    with _lock:
+        _plans[layout.pk] = (key, compiled)
+    return compiled
+
+
+@lru_cache(maxsize=32)
+def single_row_plan(total_seats):
+    """
+    Plan for a session without a usable layout: its seats in one row of
+    standard seats, so that best-seat selection still prefers the middle.
+    """
+    return SeatPlan(1, total_seats, bytes([HallLayout.STANDARD]) * total_seats)
+
+
+def hall_plan(hall_id):
+    """
+    Returns the compiled plan of the hall's layout, or None if the hall has
+    none. The layout is read again only when a layout is saved or deleted.
+    """
+    version = caching.version(HallLayout)
+    entry = _hall_plans.get(hall_id)
+    if entry is None or entry[0] != version or time.monotonic() - entry[1] > HALL_PLAN_TTL:
+        layout = HallLayout.objects.filter(hall_id=hall_id).first()
+        entry = (version, time.monotonic(), get_plan(layout) if layout is not None else None)
+        with _lock:
+            _hall_plans[hall_id] = entry
+    return entry[2]
+
+
+def plan_for_session(session):
+    """
+    Returns (plan, has_layout). A layout describes a session only while its
+    seat count matches the session's; otherwise a single row plan is used.
+    """
+    plan = hall_plan(session.hall_id)
+    if plan is not None and plan.seat_count == session.total_seats:
+        return plan, True
+    return single_row_plan(session.total_seats), False
+
+
+def invalidate():
+    """
+    Drops this process's hall plans.
+    """
+    with _lock:
+        _hall_plans.clear()
+
+
+def parse_categories(value):
+    """
+    Maps a category name from a request to the category codes to search,
+    None for an unknown name.
+    """
+    if not value:
+        return DEFAULT_CATEGORIES
+    codes = [code for code, name in CATEGORY_NAMES.items() if name == value]
+    return tuple(codes) or None
@@ -0,0 +1,210 @@
+"""
+Live seat maps over Server-Sent Events.
+A stream first sends the seats taken right now (or, when the browser
+reconnects with Last-Event-ID, the events it missed) and then every seat
+claim and release logged in SeatEvent for the session. New events are
+picked up with an index range read on (session, id) every
+SEAT_STREAM_POLL seconds, which works across processes and for holds
+released by the expire_bookings command. Streams end after
+SEAT_STREAM_LIFETIME seconds; EventSource reconnects and resumes from
+the last event id.
+Streams are only served under ASGI, where a stream is an async iterator
+and holds no worker thread while idle, and all streams of a session in
+the process share one SessionFeed, so a session costs one read per poll
+however many browsers follow it. Under WSGI the buy page polls the JSON
+seat map instead.
+"""
+import asyncio
+import json
+import time
+import weakref
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+from . import seating
+from .models import SeatEvent
+
+SEAT_STREAM_POLL = getattr(settings, 'SEAT_STREAM_POLL', 1.0)
+SEAT_STREAM_LIFETIME = getattr(settings, 'SEAT_STREAM_LIFETIME', 300)
+SEAT_STREAM_KEEPALIVE = 15
+
+# Browsers wait this long (ms) before reconnecting a closed stream
+RECONNECT_DELAY = 2000
+
+# Upper bound on the events sent in one message
+MAX_EVENTS_PER_MESSAGE = 500
+
+# Events kept by a session feed for streams that are behind
+FEED_BUFFER_SIZE = 2000
+
+# Session feeds of each running event loop, by session id
+_feeds = weakref.WeakKeyDictionary()
+
+
+def _message(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {json.dumps(data, separators=(",", ":"))}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def _read_events(session_id, after):
+    """
+    Returns (id, seat number, kind) of the session's events logged after the given id.
+    """
+    return list(
+        SeatEvent.objects.filter(session_id=session_id, id__gt=after)
+        .order_by('id').values_list('id', 'seat_number', 'kind')[:MAX_EVENTS_PER_MESSAGE]
+    )
+
+
+def _seats_message(events):
+    # Only the latest state of each seat matters to the page
+    seats = {}
+    for _, seat_number, kind in events:
+        seats[seat_number] = kind
+    return _message('seats', {
+        'taken': sorted(seat for seat, kind in seats.items() if kind == SeatEvent.TAKEN),
+        'released': sorted(seat for seat, kind in seats.items() if kind == SeatEvent.RELEASED),
+    }, events[-1][0])
+
+
+class SessionFeed:
+    """
+    Reads one session's new seat events every SEAT_STREAM_POLL seconds for
+    all the async streams following the session in this event loop, and
+    keeps the latest FEED_BUFFER_SIZE of them. floor is the id after which
+    the buffer holds every event of the session.
+    """
+    def __init__(self, session_id, after):
+        self.session_id = session_id
+        self.floor = self.last_event_id = after
+        self.events = deque(maxlen=FEED_BUFFER_SIZE)
+        self.streams = 0
+        self.task = None
+
+    @classmethod
+    def follow(cls, session_id, after):
+        """
+        Returns the running loop's feed of the session, started from the
+        given event id if there is none yet, and counts one more stream on it.
+        """
+        feeds = _feeds.setdefault(asyncio.get_running_loop(), {})
+        feed = feeds.get(session_id)
+        if feed is None:
+            feed = feeds[session_id] = cls(session_id, after)
+            feed.task = asyncio.get_running_loop().create_task(feed.run())
+        feed.streams += 1
+        return feed
+
+    def unfollow(self):
+        """
+        Counts one stream less, stopping the feed after the last one.
+        """
+        self.streams -= 1
+        if self.streams == 0:
+            del _feeds[asyncio.get_running_loop()][self.session_id]
+            self.task.cancel()
+
+    def add(self, events):
+        overflow = len(self.events) + len(events) - self.events.maxlen
+        if overflow > 0:
+            # Events about to fall out of the buffer can no longer be served from it
+            self.floor = (list(self.events) + events)[overflow - 1][0]
+        self.events.extend(events)
+        self.last_event_id = events[-1][0]
+
+    def since(self, event_id):
+        """
+        Returns up to MAX_EVENTS_PER_MESSAGE buffered events after the id, or
+        None if some of them are no longer in the buffer.
+        """
+        if event_id < self.floor:
+            return None
+        return [event for event in self.events if event[0] > event_id][:MAX_EVENTS_PER_MESSAGE]
+
+    async def run(self):
+        # Off the shared sync thread, so that sessions are polled in parallel
+        read = sync_to_async(_read_events, thread_sensitive=False)
+        while True:
+            await asyncio.sleep(SEAT_STREAM_POLL)
+            try:
+                events = await read(self.session_id, self.last_event_id)
+            except DatabaseError:
+                # Retried on the next poll; the streams only fall behind meanwhile
+                continue
+            if events:
+                self.add(events)
+
+
+class SeatEventStream:
+    """
+    Server-Sent Events stream of one session's seat changes. Iterate it with
+    async for under ASGI or with for under WSGI.
+    """
+    def __init__(self, session, last_event_id=None, lifetime=None):
+        self.session = session
+        self.last_event_id = last_event_id
+        self.lifetime = SEAT_STREAM_LIFETIME if lifetime is None else lifetime
+
+    def start(self):
+        """
+        Returns the opening messages: the missed events when resuming from an
+        id that is still in the log, otherwise a snapshot of the taken seats.
+        """
+        messages = [f'retry: {RECONNECT_DELAY}\n\n']
+        if self.last_event_id is not None:
+            # Pruning removes the oldest events first, so nothing after the
+            # client's id is gone while an event at or below it is still kept
+            oldest = SeatEvent.objects.order_by('id').values_list('id', flat=True).first()
+            if oldest is not None and oldest <= self.last_event_id:
+                return messages + self.poll()
+
+        # The snapshot is taken from the cached seat map; the events logged
+        # since the map was loaded are sent by the first poll
+        seat_map = seating.get_seat_map(self.session)
+        self.last_event_id = seat_map.event_id
+        taken = [seat for seat in range(1, seat_map.total_seats + 1) if seat_map.is_taken(seat)]
+        return messages + [_message('snapshot', {
+            'total_seats': seat_map.total_seats,
+            'taken': taken,
+        }, self.last_event_id)]
+
+    def poll(self):
+        """
+        Returns a message with the events logged since the last one sent, or nothing.
+        """
+        return self.send(_read_events(self.session.pk, self.last_event_id))
+
+    def send(self, events):
+        if not events:
+            return []
+        self.last_event_id = events[-1][0]
+        return [_seats_message(events)]
+
+    async def __aiter__(self):
+        started = idle_since = time.monotonic()
+        for message in await sync_to_async(self.start)():
+            yield message
+        feed = SessionFeed.follow(self.session.pk, self.last_event_id)
+        try:
+            while time.monotonic() - started < self.lifetime:
+                await asyncio.sleep(SEAT_STREAM_POLL)
+                events = feed.since(self.last_event_id)
+                if events is None:
+                    # Further behind than the feed's buffer reaches
+                    events = await sync_to_async(_read_events, thread_sensitive=False)(
+                        self.session.pk, self.last_event_id
+                    )
+                messages = self.send(events)
+                if messages:
+                    idle_since = time.monotonic()
+                    for message in messages:
+                        yield message
+                elif time.monotonic() - idle_since >= SEAT_STREAM_KEEPALIVE:
+                    idle_since = time.monotonic()
+                    yield ': keepalive\n\n'
+        finally:
+            feed.unfollow()
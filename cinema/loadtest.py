@@ -0,0 +1,335 @@
+"""
+Synthetic data and simulated traffic for load testing the booking funnel.
+seed() fills an empty scratch database with a catalog of realistic size in
+batched bulk inserts; run() drives concurrent simulated users through
+browse -> hold -> buy with the test client, one thread and client per
+user, and reports latency percentiles, queries per request and seat
+conflict rates per endpoint.
+Both write to the configured database; point CINEMA_DB_NAME at a scratch
+copy before using them.
+"""
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import caching, facets, idempotency, rollups, search
+from .models import Booking, Genre, Hall, Movie, Session, Ticket, User
+from .profiling import percentile
+from .scheduling import session_end
+
+USERNAME_PREFIX = 'loadtest-'
+STAFF_USERNAME = 'loadtest-staff'
+BATCH_SIZE = 5000
+
+COUNTRIES = ('Беларусь', 'Россия', 'США', 'Франция', 'Германия', 'Япония', 'Корея', 'Индия')
+GENRES = ('Драма', 'Комедия', 'Боевик', 'Триллер', 'Фантастика', 'Мультфильм', 'Ужасы', 'Документальный')
+WORDS = (
+    'ночь', 'город', 'тайна', 'последний', 'дом', 'море', 'путь', 'звезда', 'война', 'любовь',
+    'тень', 'зима', 'остров', 'охота', 'время', 'огонь', 'сердце', 'дорога', 'small', 'big'
+)
+
+# Endpoints whose non-redirect answers to a POST mean the seat was already taken;
+# a buy_retry repeats a buy with its idempotency key and should always redirect
+CLAIM_ENDPOINTS = ('hold', 'buy', 'buy_retry')
+
+# Share of purchases submitted twice, like a double click
+DOUBLE_SUBMIT_RATE = 0.1
+
+
+def _batched(objects, size=BATCH_SIZE):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bulk_insert(model, objects, size=BATCH_SIZE):
+    count = 0
+    for batch in _batched(objects, size):
+        model.objects.bulk_create(batch, batch_size=size)
+        count += len(batch)
+    return count
+
+
+def seed(movies=2000, sessions=20000, tickets=1000000, users=5000, halls=12, rng=None, log=None):
+    """
+    Inserts a synthetic catalog: genres, halls, movies, sessions spread over
+    the past and the next 30 days, users and tickets filling the sessions to
+    varying degrees. Bulk inserts send no signals, so the seat counters are
+    written directly and the search index, sales rollup and caches are
+    rebuilt at the end. Returns the number of rows created per model.
+    """
+    rng = rng or random.Random()
+    log = log or (lambda message: None)
+    now = timezone.now()
+    created = {}
+
+    genre_ids = [genre.pk for genre in Genre.objects.bulk_create(Genre(name=name) for name in GENRES)]
+    hall_rows = [
+        (hall.pk, hall.capacity)
+        for hall in Hall.objects.bulk_create(
+            Hall(name=f'Зал {i + 1}', capacity=rng.choice((60, 90, 120, 150, 200, 250))) for i in range(halls)
+        )
+    ]
+    created.update(genres=len(genre_ids), halls=len(hall_rows))
+
+    first_movie = (Movie.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+    created['movies'] = _bulk_insert(Movie, (
+        Movie(
+            title=' '.join(rng.sample(WORDS, 3)).capitalize() + f' {first_movie + i}',
+            country=rng.choice(COUNTRIES),
+            duration=rng.randint(75, 180),
+            budget=Decimal(rng.randint(1, 300)) * 1000000,
+            description=' '.join(rng.choices(WORDS, k=40)),
+            rating=Decimal(rng.randint(10, 99)) / 10,
+            release_date=now - timedelta(days=rng.randint(-60, 3650)),
+        )
+        for i in range(movies)
+    ))
+    durations = dict(Movie.objects.filter(pk__gte=first_movie).values_list('pk', 'duration'))
+    movie_ids = list(durations)
+    _bulk_insert(Movie.genres.through, (
+        Movie.genres.through(movie_id=movie_id, genre_id=genre_id)
+        for movie_id in movie_ids
+        for genre_id in rng.sample(genre_ids, rng.randint(1, 3))
+    ))
+    log(f'{len(movie_ids)} movies')
+
+    # Tickets are shared out with random weights, capped by each hall's size
+    plan = []
+    weights = [rng.random() for _ in range(sessions)]
+    scale = tickets / (sum(weights) or 1)
+    for weight in weights:
+        hall_id, capacity = rng.choice(hall_rows)
+        plan.append((hall_id, capacity, min(capacity, round(weight * scale))))
+    first_session = (Session.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+
+    def make_session(hall_id, capacity, sold):
+        # Random start times may overlap in a hall; the load test does not care
+        movie_id = rng.choice(movie_ids)
+        start_time = now + timedelta(minutes=rng.randint(-30 * 24 * 60, 30 * 24 * 60))
+        return Session(
+            movie_id=movie_id,
+            hall_id=hall_id,
+            start_time=start_time,
+            end_time=session_end(start_time, durations[movie_id]),
+            price=Decimal(rng.choice((8, 10, 12, 15))),
+            total_seats=capacity,
+            sold_count=sold,
+        )
+
+    created['sessions'] = _bulk_insert(Session, (make_session(*row) for row in plan))
+    session_rows = list(
+        Session.objects.filter(pk__gte=first_session).order_by('pk').values_list('pk', 'price')
+    )
+    log(f'{len(session_rows)} sessions')
+
+    password = make_password(None)
+    first_user = (User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+    created['users'] = _bulk_insert(User, (
+        User(username=f'{USERNAME_PREFIX}{first_user + i}', password=password) for i in range(users)
+    ))
+    User.objects.get_or_create(username=STAFF_USERNAME, defaults={'is_staff': True, 'password': password})
+    user_ids = list(
+        User.objects.filter(pk__gte=first_user, username__startswith=USERNAME_PREFIX, is_staff=False)
+        .values_list('pk', flat=True)
+    )
+    log(f'{len(user_ids)} users')
+
+    created['tickets'] = _bulk_insert(Ticket, (
+        Ticket(session_id=session_id, user_id=rng.choice(user_ids), seat_number=seat, price=price)
+        for (session_id, price), (_, _, sold) in zip(session_rows, plan)
+        for seat in range(1, sold + 1)
+    ))
+    log(f"{created['tickets']} tickets")
+
+    search.rebuild()
+    rollups.rebuild()
+    for model in (Genre, Hall, Movie, Session, Ticket, Booking, User):
+        caching.bump(model)
+    facets.invalidate()
+    return created
+
+
+class Recorder:
+    """
+    Collects the samples of all simulated users, per endpoint.
+    """
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, queries, status, conflict=False, error=None):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((seconds, queries, status, conflict, error))
+
+    def report(self):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(seconds * 1000 for seconds, _, _, _, _ in samples)
+            queries = [count for _, count, _, _, _ in samples]
+            errors = Counter(
+                error or f'HTTP {status}' for _, _, status, _, error in samples if error or status >= 500
+            )
+            row = {
+                'requests': len(samples),
+                'errors': sum(errors.values()),
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'p99_ms': round(percentile(latencies, 0.99), 2),
+                'mean_ms': round(statistics.mean(latencies), 2),
+                'queries_mean': round(statistics.mean(queries), 2),
+                'queries_max': max(queries),
+            }
+            if errors:
+                row['error_types'] = dict(errors.most_common())
+            if endpoint in CLAIM_ENDPOINTS:
+                row['conflicts'] = sum(conflict for _, _, _, conflict, _ in samples)
+                row['conflict_rate'] = round(row['conflicts'] / len(samples), 4)
+            endpoints[endpoint] = row
+        return endpoints
+
+
+class SimulatedUser(threading.Thread):
+    """
+    One visitor walking through the funnel with its own test client and
+    database connection: browse the schedule, open a session, hold a free
+    seat, check the bookings and buy the held seat, now and then submitting
+    the purchase twice. A staff visitor opens
+    the dashboards instead.
+    """
+    def __init__(self, user, session_ids, recorder, iterations, rng, staff=False, double_submit_rate=DOUBLE_SUBMIT_RATE):
+        super().__init__(daemon=True)
+        self.user = user
+        self.session_ids = session_ids
+        self.recorder = recorder
+        self.iterations = iterations
+        self.rng = rng
+        self.staff = staff
+        self.double_submit_rate = double_submit_rate
+        self.client = Client()
+
+    def request(self, endpoint, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            try:
+                response = getattr(self.client, method)(url, data)
+            except Exception as exc:
+                # Unhandled exceptions (database is locked under SQLite, say) are errors of the endpoint
+                self.recorder.add(endpoint, time.perf_counter() - started, len(queries), 500, error=type(exc).__name__)
+                return None
+            elapsed = time.perf_counter() - started
+        conflict = endpoint in CLAIM_ENDPOINTS and response.status_code == 200
+        self.recorder.add(endpoint, elapsed, len(queries), response.status_code, conflict)
+        return response
+
+    def funnel(self):
+        self.request('session_list', 'get', reverse('cinema:session_list'))
+        session_id = self.rng.choice(self.session_ids)
+        self.request('buy_ticket', 'get', reverse('cinema:buy_ticket', args=[session_id]))
+        response = self.request('seat_map', 'get', reverse('cinema:api_seat_map', args=[session_id]))
+        if response is None or response.status_code != 200:
+            return
+        seat_map = response.json()
+        free = sorted(set(range(1, seat_map['total_seats'] + 1)) - set(seat_map['taken']))
+        if not free:
+            return
+        seat = self.rng.choice(free)
+        url = reverse('cinema:buy_ticket', args=[session_id])
+        # Success redirects; a taken seat re-renders the page with an error
+        response = self.request(
+            'hold', 'post', url, {'action': 'book', 'seat_numbers': [seat], 'idempotency_key': idempotency.new_key()}
+        )
+        self.request('booking_list', 'get', reverse('cinema:booking_list'))
+        if response is not None and response.status_code == 302:
+            data = {'action': 'buy', 'seat_numbers': [seat], 'idempotency_key': idempotency.new_key()}
+            self.request('buy', 'post', url, data)
+            if self.rng.random() < self.double_submit_rate:
+                self.request('buy_retry', 'post', url, data)
+
+    def dashboards(self):
+        for name in ('admin_dashboard', 'admin_statistics', 'user_statistics'):
+            self.request(name, 'get', reverse(f'cinema:{name}'))
+
+    def run(self):
+        self.client.force_login(self.user)
+        try:
+            for _ in range(self.iterations):
+                if self.staff:
+                    self.dashboards()
+                else:
+                    self.funnel()
+        finally:
+            connections.close_all()
+
+
+def run(users=20, iterations=10, sessions=10, staff=1, rng=None):
+    """
+    Runs the simulated users against the most open upcoming sessions and
+    returns the report. Fewer sessions means more users racing for the same seats.
+    """
+    rng = rng or random.Random()
+    session_ids = list(
+        Session.objects.filter(is_active=True, start_time__gt=timezone.now() + timedelta(hours=1))
+        .order_by('sold_count', 'start_time').values_list('pk', flat=True)[:sessions]
+    )
+    visitors = list(User.objects.filter(username__startswith=USERNAME_PREFIX, is_staff=False).order_by('?')[:users])
+    if not session_ids or len(visitors) < users:
+        raise ValueError('Not enough upcoming sessions or load test users; run seed_loadtest first.')
+    managers = list(User.objects.filter(username=STAFF_USERNAME)) * staff
+
+    recorder = Recorder()
+    threads = [
+        SimulatedUser(user, session_ids, recorder, iterations, random.Random(rng.random()))
+        for user in visitors
+    ] + [
+        SimulatedUser(user, session_ids, recorder, iterations, random.Random(rng.random()), staff=True)
+        for user in managers
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    endpoints = recorder.report()
+    total = sum(row['requests'] for row in endpoints.values())
+    return {
+        'database': connection.vendor,
+        'users': users,
+        'staff': len(managers),
+        'iterations': iterations,
+        'sessions': len(session_ids),
+        'duration_s': round(elapsed, 3),
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+        'endpoints': endpoints,
+    }
+
+
+def compare(report, baseline):
+    """
+    Adds the p95 change against a previous report to every endpoint both have.
+    """
+    for endpoint, row in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if previous and previous.get('p95_ms'):
+            row['baseline_p95_ms'] = previous['p95_ms']
+            row['p95_change'] = round(row['p95_ms'] / previous['p95_ms'] - 1, 4)
+    return report
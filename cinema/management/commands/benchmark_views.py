@@ -0,0 +1,100 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from cinema.models import Movie, News
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares requests/sec of the read-heavy pages served through the WSGI handler '
+        '(a thread per concurrent request) and the ASGI handler (one event loop), in process'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Paths to request (default: the async catalog pages)')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per path and handler (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once (default: 20)')
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help='Disable the response cache so that every request runs the view'
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.default_paths()
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if options['no_cache']:
+            overrides['CACHES'] = NO_CACHE
+        # The test clients send Host: testserver
+        with override_settings(**overrides):
+            self.run(paths, options)
+
+    def default_paths(self):
+        movie = Movie.objects.order_by('pk').values_list('pk', flat=True).first()
+        news = News.objects.order_by('pk').values_list('pk', flat=True).first()
+        if movie is None or news is None:
+            raise CommandError('The benchmark needs at least one movie and one news item.')
+        return [
+            reverse('cinema:home'),
+            reverse('cinema:movie_detail', args=[movie]),
+            reverse('cinema:session_list'),
+            reverse('cinema:news_list'),
+            reverse('cinema:news_detail', args=[news]),
+            reverse('cinema:faq_list'),
+        ]
+
+    def run(self, paths, options):
+        self.stdout.write(f"{'path':<32} {'handler':<6} {'req/s':>8} {'mean ms':>8} {'p95 ms':>8} {'errors':>6}")
+        for path in paths:
+            for handler, bench in (('wsgi', self.bench_wsgi), ('asgi', self.bench_asgi)):
+                # One warm-up request fills the caches both handlers share
+                bench(path, 1, 1)
+                elapsed, latencies, errors = bench(path, options['requests'], options['concurrency'])
+                latencies.sort()
+                self.stdout.write(
+                    f"{path:<32} {handler:<6} {len(latencies) / elapsed:>8.1f} "
+                    f"{statistics.mean(latencies) * 1000:>8.1f} "
+                    f"{latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0] * 1000:>8.1f} {errors:>6}"
+                )
+
+    def bench_wsgi(self, path, requests, concurrency):
+        def fetch(_):
+            client = Client()
+            started = time.perf_counter()
+            status = client.get(path).status_code
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - started
+        # Worker threads opened their own connections
+        connections.close_all()
+        return elapsed, [latency for latency, _ in results], sum(status != 200 for _, status in results)
+
+    def bench_asgi(self, path, requests, concurrency):
+        async def run():
+            client = AsyncClient()
+            limit = asyncio.Semaphore(concurrency)
+
+            async def fetch():
+                async with limit:
+                    started = time.perf_counter()
+                    status = (await client.get(path)).status_code
+                    return time.perf_counter() - started, status
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(fetch() for _ in range(requests)))
+            return time.perf_counter() - started, results
+
+        elapsed, results = asyncio.run(run())
+        return elapsed, [latency for latency, _ in results], sum(status != 200 for _, status in results)
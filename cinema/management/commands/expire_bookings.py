@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cinema.idempotency import prune as prune_checkout_keys
+from cinema.seating import expire_holds, prune_seat_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Deactivates expired bookings in batches, frees their seats and prunes old seat events '
+        'and checkout keys'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of bookings expired per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running and sweep every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=15.0,
+            help='Seconds between sweeps in --loop mode (default: 15)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            self.report(self.sweep(options['batch_size']))
+            return
+
+        totals = {'expired': 0, 'batches': 0, 'seconds': 0.0, 'pruned': 0, 'pruned_keys': 0}
+        sweeps = 0
+        try:
+            while True:
+                stats = self.sweep(options['batch_size'])
+                sweeps += 1
+                for key in totals:
+                    totals[key] += stats[key]
+                if stats['expired'] or options['verbosity'] > 1:
+                    self.report(stats)
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(f'Stopped after {sweeps} sweep(s).')
+            self.report(totals)
+
+    def sweep(self, batch_size):
+        stats = expire_holds(batch_size)
+        stats['pruned'] = prune_seat_events()
+        stats['pruned_keys'] = prune_checkout_keys()
+        return stats
+
+    def report(self, stats):
+        rate = stats['expired'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(
+            f"Expired {stats['expired']} booking(s) in {stats['batches']} batch(es), "
+            f"{stats['seconds']:.3f}s ({rate:.0f} bookings/s); pruned {stats['pruned']} seat event(s) "
+            f"and {stats['pruned_keys']} checkout key(s)"
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema import exports, statistics
+
+
+class Command(BaseCommand):
+    help = 'Streams tickets, bookings, reviews or statistics tables for a date range as CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument(
+            '--format', dest='export_format', choices=sorted(exports.FORMATS), default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument('--start', dest='start_date', help='First day, YYYY-MM-DD (default: 30 days ago)')
+        parser.add_argument('--end', dest='end_date', help='Last day, YYYY-MM-DD (default: today)')
+        parser.add_argument('--output', '-o', help='File to write to (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            start_date, end_date = statistics.date_range(options['start_date'], options['end_date'])
+        except ValueError:
+            raise CommandError('Dates must be given as YYYY-MM-DD')
+
+        chunks = exports.stream(options['dataset'], options['export_format'], start_date, end_date)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from cinema import caching
+from cinema.images import IMAGE_FIELDS, refresh_variants
+
+
+class Command(BaseCommand):
+    help = 'Generates the resized JPEG/WebP variants of posters and news/company images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', dest='models',
+            choices=[model._meta.model_name for model, _, _ in IMAGE_FIELDS],
+            help='Only process the given model (may be repeated)'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate variants even when the manifest is up to date'
+        )
+
+    def handle(self, *args, **options):
+        for model, image_field, manifest_field in IMAGE_FIELDS:
+            if options['models'] and model._meta.model_name not in options['models']:
+                continue
+            generated = failed = 0
+            objects = model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True})
+            for instance in objects.only('pk', image_field, manifest_field).iterator(chunk_size=200):
+                try:
+                    generated += refresh_variants(instance, image_field, manifest_field, force=options['force'])
+                except (OSError, ValueError, Image.DecompressionBombError) as error:
+                    failed += 1
+                    self.stderr.write(f'{model._meta.label} {instance.pk}: {error}')
+            if generated:
+                caching.bump(model)
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: {generated} updated, {failed} failed.'
+            ))
@@ -0,0 +1,82 @@
+import json
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cinema import scheduling
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a week of sessions from a JSON template or from another week, '
+        'refusing the whole week if any session overlaps the hall schedules'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--week',
+            help='First of the seven days to fill, YYYY-MM-DD (default: next Monday)'
+        )
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument(
+            '--template',
+            help='JSON file with a list of {"weekday", "time", "hall", "movie", "price"} slots'
+        )
+        source.add_argument(
+            '--copy-from',
+            help='Repeat the active sessions of the seven days starting on this day, YYYY-MM-DD'
+        )
+        parser.add_argument('--halls', type=int, nargs='+', help='Only generate sessions in these halls')
+        parser.add_argument('--dry-run', action='store_true', help='Check the week without creating sessions')
+
+    def handle(self, *args, **options):
+        if options['week']:
+            week_start = _parse_date(options['week'])
+        else:
+            today = timezone.localdate()
+            week_start = today + timedelta(days=7 - today.weekday())
+
+        try:
+            if options['template']:
+                with open(options['template'], encoding='utf-8') as template:
+                    slots = [scheduling.Slot.from_dict(item) for item in json.load(template)]
+                if options['halls']:
+                    slots = [slot for slot in slots if slot.hall_id in options['halls']]
+            else:
+                slots = scheduling.week_template(_parse_date(options['copy_from']), options['halls'])
+            sessions = scheduling.build_sessions(slots, week_start)
+        except (OSError, json.JSONDecodeError, ValueError) as e:
+            raise CommandError(str(e))
+        if not sessions:
+            raise CommandError('The template has no sessions.')
+
+        if options['dry_run']:
+            conflicts = scheduling.find_conflicts(sessions)
+        else:
+            try:
+                scheduling.create_sessions(sessions)
+                conflicts = []
+            except scheduling.ScheduleConflict as e:
+                conflicts = e.conflicts
+
+        for session, other in conflicts:
+            self.stderr.write(
+                f'Hall {session.hall_id}: {timezone.localtime(session.start_time):%Y-%m-%d %H:%M}-'
+                f'{timezone.localtime(session.end_time):%H:%M} overlaps session {other.pk or "in the template"} '
+                f'({timezone.localtime(other.start_time):%Y-%m-%d %H:%M}-{timezone.localtime(other.end_time):%H:%M}).'
+            )
+        if conflicts:
+            raise CommandError(f'{len(conflicts)} session(s) overlap the schedule; nothing was created.')
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(sessions)} sessions for the week of {week_start:%Y-%m-%d}.'
+        ))
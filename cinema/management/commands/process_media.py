@@ -0,0 +1,190 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+from PIL import Image
+
+from cinema import caching
+from cinema.images import IMAGE_FIELDS, MEDIA_DIRS, VARIANT_NAME, content_hash, generate_variants, variant_names
+
+
+def _init_worker():
+    django.setup()
+
+
+def _process_file(name, known_hash, known_variants, verify_only):
+    """
+    Runs in a worker process: verifies one stored image and, unless only
+    verifying, makes sure its variants exist. Takes and returns plain data.
+    """
+    digest = content_hash(default_storage, name)
+    if verify_only:
+        with default_storage.open(name, 'rb') as source:
+            Image.open(source).verify()
+        return {'status': 'verified', 'hash': digest}
+    if digest == known_hash and all(default_storage.exists(variant) for variant in known_variants):
+        return {'status': 'unchanged', 'hash': digest}
+    manifest = generate_variants(default_storage, name, verify=True, digest=digest)
+    return {'status': 'generated', 'hash': digest, 'manifest': manifest}
+
+
+class Command(BaseCommand):
+    help = (
+        'Walks the media directories, verifies images and builds their variants in parallel, '
+        'and reports files no Movie, News or CompanyInfo row references'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of worker processes (default: number of CPUs)'
+        )
+        parser.add_argument(
+            '--state', default=os.path.join(settings.MEDIA_ROOT, '.process_media_state.json'),
+            help='Progress file used to resume and to skip unchanged files'
+        )
+        parser.add_argument(
+            '--verify-only', action='store_true',
+            help='Only decode and verify the images, without writing variants'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore the progress file and check every file again'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        state = {} if options['restart'] else self.load_state(options['state'])
+        references = self.load_references()
+        known_variants = set()
+        for rows in references.values():
+            for _, _, _, manifest in rows:
+                known_variants |= variant_names(manifest)
+
+        pending, orphans, variants_on_disk, seen = [], [], set(), set()
+        for name, size, mtime in self.walk():
+            seen.add(name)
+            if VARIANT_NAME.search(name):
+                variants_on_disk.add(name)
+            elif name not in references:
+                orphans.append(name)
+            else:
+                entry = state.get(name, {})
+                manifests = [manifest for _, _, _, manifest in references[name]]
+                if (
+                    entry.get('size') == size and entry.get('mtime') == mtime
+                    and (options['verify_only'] or all(m.get('hash') == entry.get('hash') for m in manifests))
+                ):
+                    continue
+                # Rows that disagree are all rewritten from a fresh manifest
+                shared = manifests[0] if all(m == manifests[0] for m in manifests) else {}
+                pending.append((name, size, mtime, shared))
+
+        missing = [name for name in references if name not in seen and not default_storage.exists(name)]
+
+        results = {'generated': 0, 'unchanged': 0, 'verified': 0, 'failed': 0}
+        failures, updated_models, processed_bytes = [], set(), 0
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+            futures = {
+                executor.submit(
+                    _process_file, name, manifest.get('hash'),
+                    sorted(variant_names(manifest)), options['verify_only']
+                ): (name, size, mtime)
+                for name, size, mtime, manifest in pending
+            }
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    name, size, mtime = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        results['failed'] += 1
+                        failures.append((name, error))
+                        continue
+                    results[result['status']] += 1
+                    processed_bytes += size
+                    state[name] = {'size': size, 'mtime': mtime, 'hash': result['hash']}
+                    if 'manifest' in result:
+                        updated_models |= self.save_manifest(references[name], result['manifest'])
+                        known_variants |= variant_names(result['manifest'])
+                    if done % 50 == 0:
+                        self.save_state(options['state'], state)
+            finally:
+                self.save_state(options['state'], state)
+
+        for model in updated_models:
+            caching.bump(model)
+        self.report(results, failures, missing, orphans, variants_on_disk - known_variants, processed_bytes, started)
+
+    def walk(self):
+        """
+        Yields (name, size, mtime) for every file in the media directories.
+        """
+        for directory in MEDIA_DIRS:
+            root = os.path.join(settings.MEDIA_ROOT, directory)
+            for path, _, files in os.walk(root):
+                for filename in files:
+                    full_path = os.path.join(path, filename)
+                    stat = os.stat(full_path)
+                    name = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                    yield name, stat.st_size, stat.st_mtime_ns
+
+    def load_references(self):
+        """
+        Maps every referenced file name to its (model, pk, manifest field, manifest) rows.
+        """
+        references = {}
+        for model, image_field, manifest_field in IMAGE_FIELDS:
+            rows = model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True})
+            for pk, name, manifest in rows.values_list('pk', image_field, manifest_field).iterator(chunk_size=2000):
+                references.setdefault(name, []).append((model, pk, manifest_field, manifest or {}))
+        return references
+
+    def save_manifest(self, rows, manifest):
+        updated = set()
+        for model, pk, manifest_field, current in rows:
+            if current != manifest:
+                model.objects.filter(pk=pk).update(**{manifest_field: manifest})
+                updated.add(model)
+        return updated
+
+    def load_state(self, path):
+        try:
+            with open(path, encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_state(self, path, state):
+        # Written to a temporary file first so an interrupted run never leaves a truncated state
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as state_file:
+            json.dump(state, state_file)
+        os.replace(f'{path}.tmp', path)
+
+    def report(self, results, failures, missing, orphans, stale_variants, processed_bytes, started):
+        elapsed = time.monotonic() - started
+        processed = sum(results.values())
+        for name, error in failures:
+            self.stderr.write(f'Failed: {name}: {error}')
+        for name in sorted(missing):
+            self.stderr.write(f'Missing file: {name}')
+        for name in sorted(orphans):
+            self.stdout.write(f'Orphaned file: {name}')
+        for name in sorted(stale_variants):
+            self.stdout.write(f'Orphaned variant: {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{processed} file(s) checked in {elapsed:.1f}s "
+            f"({processed / elapsed if elapsed else 0:.1f} files/s, "
+            f"{processed_bytes / (1 << 20) / elapsed if elapsed else 0:.2f} MB/s): "
+            f"{results['generated']} generated, {results['unchanged']} unchanged, "
+            f"{results['verified']} verified, {results['failed']} failed, {len(missing)} missing; "
+            f"{len(orphans)} orphaned file(s), {len(stale_variants)} orphaned variant(s)."
+        ))
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales rollup from tickets and bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start', dest='start_date',
+            help='First day to rebuild, YYYY-MM-DD (default: the whole history)'
+        )
+        parser.add_argument(
+            '--end', dest='end_date',
+            help='Last day to rebuild, YYYY-MM-DD (default: the whole history)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start_date, end_date = (
+                datetime.strptime(options[key], '%Y-%m-%d').date() if options[key] else None
+                for key in ('start_date', 'end_date')
+            )
+        except ValueError:
+            raise CommandError('Dates must be given as YYYY-MM-DD')
+
+        rows = rebuild(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup row(s).'))
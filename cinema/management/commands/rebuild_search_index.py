@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cinema import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of movies, news and reviews'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write('The database has no full-text index; search uses icontains lookups.')
+            return
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} document(s).'))
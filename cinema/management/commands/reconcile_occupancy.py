@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from cinema.models import Session
+from cinema.seating import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Session.sold_count and held_count from tickets and active bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--session', type=int, action='append', dest='session_ids',
+            help='Only reconcile the given session id (may be repeated)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drifted counters without fixing them'
+        )
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.all()
+        if options['session_ids']:
+            sessions = sessions.filter(pk__in=options['session_ids'])
+
+        drifted = reconcile_counters(sessions, dry_run=options['dry_run'])
+        for session in drifted:
+            self.stdout.write(
+                f"Session {session.pk}: sold {session.sold_count} -> {session.actual_sold}, "
+                f"held {session.held_count} -> {session.actual_held}"
+            )
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted)} session(s) have drifted counters.')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {len(drifted)} session(s).'))
@@ -0,0 +1,59 @@
+import json
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from cinema import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives concurrent simulated users through browse -> hold -> buy and reports '
+        'latency percentiles, queries per request and conflict rates per endpoint as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Concurrent simulated users (default: 20)')
+        parser.add_argument('--iterations', type=int, default=10, help='Funnel runs per user (default: 10)')
+        parser.add_argument(
+            '--sessions', type=int, default=10,
+            help='Sessions the users compete for; fewer means more seat conflicts (default: 10)'
+        )
+        parser.add_argument('--staff', type=int, default=1, help='Staff users loading the dashboards (default: 1)')
+        parser.add_argument('--seed', type=int, help='Random seed for the users\' choices')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='Previous JSON report to compare the p95 latencies with')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read the baseline report: {exc}')
+
+        # The test client sends Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            try:
+                report = loadtest.run(
+                    users=options['users'],
+                    iterations=options['iterations'],
+                    sessions=options['sessions'],
+                    staff=options['staff'],
+                    rng=random.Random(options['seed']),
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc))
+        if baseline is not None:
+            loadtest.compare(report, baseline)
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote the report for {report['requests']} request(s) to {options['output']}."))
+        else:
+            self.stdout.write(output)
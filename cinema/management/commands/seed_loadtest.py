@@ -0,0 +1,47 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema import loadtest
+from cinema.models import Ticket
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills an empty scratch database with a synthetic catalog for load tests '
+        '(set CINEMA_DB_NAME to the scratch database and migrate it first)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=2000, help='Number of movies (default: 2000)')
+        parser.add_argument('--sessions', type=int, default=20000, help='Number of sessions (default: 20000)')
+        parser.add_argument('--tickets', type=int, default=1000000, help='Approximate number of tickets (default: 1000000)')
+        parser.add_argument('--users', type=int, default=5000, help='Number of users (default: 5000)')
+        parser.add_argument('--halls', type=int, default=12, help='Number of halls (default: 12)')
+        parser.add_argument('--seed', type=int, help='Random seed, for a reproducible dataset')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Add the data even though the database already has tickets'
+        )
+
+    def handle(self, *args, **options):
+        if Ticket.objects.exists() and not options['force']:
+            raise CommandError(
+                'The database already has tickets. Seed an empty scratch database '
+                '(CINEMA_DB_NAME) or pass --force.'
+            )
+        if min(options[key] for key in ('movies', 'sessions', 'users', 'halls')) < 1 or options['tickets'] < 0:
+            raise CommandError('Counts must be positive.')
+
+        created = loadtest.seed(
+            movies=options['movies'],
+            sessions=options['sessions'],
+            tickets=options['tickets'],
+            users=options['users'],
+            halls=options['halls'],
+            rng=random.Random(options['seed']),
+            log=lambda message: self.stdout.write(f'Created {message}.'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded ' + ', '.join(f'{count} {name}' for name, count in created.items()) + '.'
+        ))
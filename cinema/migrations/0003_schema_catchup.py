@@ -0,0 +1,246 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+USER_COLUMNS = (
+    'id, password, last_login, is_superuser, username, first_name, last_name, '
+    'email, is_staff, is_active, date_joined'
+)
+
+
+def copy_auth_users(apps, schema_editor):
+    # Databases created before AUTH_USER_MODEL pointed at cinema.User keep
+    # their accounts in auth_user, which the cinema tables reference by id
+    tables = schema_editor.connection.introspection.table_names()
+    if 'cinema_user' in tables or 'auth_user' not in tables:
+        return
+    schema_editor.create_model(apps.get_model('cinema', 'User'))
+    schema_editor.execute(
+        f'INSERT INTO cinema_user ({USER_COLUMNS}, created_at, updated_at) '
+        f'SELECT {USER_COLUMNS}, date_joined, date_joined FROM auth_user'
+    )
+    schema_editor.execute(
+        'INSERT INTO cinema_user_groups (id, user_id, group_id) '
+        'SELECT id, user_id, group_id FROM auth_user_groups'
+    )
+    schema_editor.execute(
+        'INSERT INTO cinema_user_user_permissions (id, user_id, permission_id) '
+        'SELECT id, user_id, permission_id FROM auth_user_user_permissions'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0003_booking'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_auth_users, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='booking',
+            options={'verbose_name': 'Booking', 'verbose_name_plural': 'Bookings'},
+        ),
+        migrations.AlterModelOptions(
+            name='companyinfo',
+            options={'verbose_name': 'Company Info', 'verbose_name_plural': 'Company Info'},
+        ),
+        migrations.AlterModelOptions(
+            name='faq',
+            options={'verbose_name': 'FAQ', 'verbose_name_plural': 'FAQs'},
+        ),
+        migrations.AlterModelOptions(
+            name='genre',
+            options={'verbose_name': 'Genre', 'verbose_name_plural': 'Genres'},
+        ),
+        migrations.AlterModelOptions(
+            name='hall',
+            options={'verbose_name': 'Hall', 'verbose_name_plural': 'Halls'},
+        ),
+        migrations.AlterModelOptions(
+            name='movie',
+            options={'verbose_name': 'Movie', 'verbose_name_plural': 'Movies'},
+        ),
+        migrations.AlterModelOptions(
+            name='news',
+            options={'verbose_name': 'News', 'verbose_name_plural': 'News'},
+        ),
+        migrations.AlterModelOptions(
+            name='promocode',
+            options={'verbose_name': 'Promo Code', 'verbose_name_plural': 'Promo Codes'},
+        ),
+        migrations.AlterModelOptions(
+            name='review',
+            options={'verbose_name': 'Review', 'verbose_name_plural': 'Reviews'},
+        ),
+        migrations.AlterModelOptions(
+            name='session',
+            options={'verbose_name': 'Session', 'verbose_name_plural': 'Sessions'},
+        ),
+        migrations.AlterModelOptions(
+            name='ticket',
+            options={'verbose_name': 'Ticket', 'verbose_name_plural': 'Tickets'},
+        ),
+        migrations.AlterModelOptions(
+            name='vacancy',
+            options={'verbose_name': 'Vacancy', 'verbose_name_plural': 'Vacancies'},
+        ),
+        migrations.RemoveField(
+            model_name='companyinfo',
+            name='logo',
+        ),
+        migrations.RemoveField(
+            model_name='companyinfo',
+            name='requisites',
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='companyinfo',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='company_images/'),
+        ),
+        migrations.AddField(
+            model_name='companyinfo',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='faq',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='faq',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='hall',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='hall',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='vacancy',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='genre',
+            name='description',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='genre',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='hall',
+            name='description',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='genres',
+            field=models.ManyToManyField(related_name='movies', to='cinema.genre'),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='poster',
+            field=models.ImageField(default='', upload_to='movie_posters/'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='release_date',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='news',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='news_images/'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='cinema.movie'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='session',
+            name='hall',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='cinema.hall'),
+        ),
+        migrations.AlterField(
+            model_name='vacancy',
+            name='salary',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.DeleteModel(
+            name='Employee',
+        ),
+    ]
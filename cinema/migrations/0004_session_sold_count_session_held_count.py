@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Session = apps.get_model('cinema', 'Session')
+    Ticket = apps.get_model('cinema', 'Ticket')
+    Booking = apps.get_model('cinema', 'Booking')
+
+    def count(queryset):
+        return Coalesce(Subquery(
+            queryset.filter(session=OuterRef('pk')).order_by().values('session').annotate(n=Count('pk')).values('n')
+        ), 0)
+
+    Session.objects.update(
+        sold_count=count(Ticket.objects.all()),
+        held_count=count(Booking.objects.filter(is_active=True))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0003_schema_catchup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='sold_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='held_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_rollup(apps, schema_editor):
+    Ticket = apps.get_model('cinema', 'Ticket')
+    Booking = apps.get_model('cinema', 'Booking')
+    DailySalesRollup = apps.get_model('cinema', 'DailySalesRollup')
+
+    rows = {}
+    for date, movie_id, hall_id, count, revenue in Ticket.objects.annotate(
+        date=TruncDate('purchase_date')
+    ).values_list('date', 'session__movie_id', 'session__hall_id').annotate(
+        count=Count('pk'), revenue=Sum('price')
+    ).order_by():
+        rows[date, movie_id, hall_id] = DailySalesRollup(
+            date=date, movie_id=movie_id, hall_id=hall_id, tickets=count, revenue=revenue
+        )
+    for date, movie_id, hall_id, count in Booking.objects.annotate(
+        date=TruncDate('booking_date')
+    ).values_list('date', 'session__movie_id', 'session__hall_id').annotate(
+        count=Count('pk')
+    ).order_by():
+        row = rows.setdefault(
+            (date, movie_id, hall_id),
+            DailySalesRollup(date=date, movie_id=movie_id, hall_id=hall_id)
+        )
+        row.bookings = count
+    DailySalesRollup.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('tickets', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bookings', models.IntegerField(default=0)),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='cinema.hall')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='cinema.movie')),
+            ],
+            options={
+                'verbose_name': 'Daily Sales Rollup',
+                'verbose_name_plural': 'Daily Sales Rollups',
+                'unique_together': {('date', 'movie', 'hall')},
+            },
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
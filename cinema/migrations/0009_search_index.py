@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends use the icontains fallback in cinema.search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE cinema_search USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, title, body, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO cinema_search (kind, object_id, title, body) "
+        "SELECT 'movie', m.id, m.title, m.description || ' ' || m.country || ' ' || COALESCE(("
+        "SELECT group_concat(g.name, ' ') FROM cinema_movie_genres mg "
+        "JOIN cinema_genre g ON g.id = mg.genre_id WHERE mg.movie_id = m.id), '') "
+        "FROM cinema_movie m"
+    )
+    schema_editor.execute(
+        "INSERT INTO cinema_search (kind, object_id, title, body) "
+        "SELECT 'news', id, title, content FROM cinema_news WHERE is_published"
+    )
+    schema_editor.execute(
+        "INSERT INTO cinema_search (kind, object_id, title, body) "
+        "SELECT 'review', id, '', text FROM cinema_review"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS cinema_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0010_review_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_number', models.IntegerField()),
+                ('kind', models.CharField(choices=[('taken', 'Taken'), ('released', 'Released')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_events', to='cinema.session')),
+            ],
+            options={
+                'verbose_name': 'Seat Event',
+                'verbose_name_plural': 'Seat Events',
+                'indexes': [models.Index(fields=['session', 'id'], name='seatevent_session_idx'), models.Index(fields=['created_at'], name='seatevent_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0011_seatevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HallLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rows', models.PositiveSmallIntegerField()),
+                ('columns', models.PositiveSmallIntegerField()),
+                ('cells', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('hall', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='layout', to='cinema.hall')),
+            ],
+            options={
+                'verbose_name': 'Hall Layout',
+                'verbose_name_plural': 'Hall Layouts',
+            },
+        ),
+    ]
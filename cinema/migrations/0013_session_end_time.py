@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def derive_end_times(apps, schema_editor):
+    Session = apps.get_model('cinema', 'Session')
+    buffer = timedelta(minutes=getattr(settings, 'SESSION_CLEANING_MINUTES', 15))
+    sessions = list(Session.objects.select_related('movie').only('id', 'start_time', 'end_time', 'movie__duration'))
+    for session in sessions:
+        session.end_time = session.start_time + timedelta(minutes=session.movie.duration) + buffer
+    Session.objects.bulk_update(sessions, ['end_time'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0012_halllayout'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='end_time',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.RunPython(derive_end_times, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['hall', 'start_time'], name='session_hall_active_start_idx'),
+        ),
+    ]
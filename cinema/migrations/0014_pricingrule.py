@@ -0,0 +1,34 @@
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0013_session_end_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('weekdays', models.CharField(blank=True, help_text='Days of the week the rule applies on, 0 for Monday to 6 for Sunday, e.g. "56"', max_length=7)),
+                ('time_from', models.TimeField(blank=True, null=True)),
+                ('time_to', models.TimeField(blank=True, null=True)),
+                ('seat_category', models.PositiveSmallIntegerField(blank=True, choices=[(1, 'Standard'), (2, 'VIP'), (3, 'Accessible')], null=True)),
+                ('min_occupancy', models.PositiveSmallIntegerField(blank=True, help_text='Percentage of sold and held seats from which the rule applies', null=True, validators=[django.core.validators.MaxValueValidator(100)])),
+                ('percent', models.DecimalField(decimal_places=2, help_text='Price change in percent, negative for a discount', max_digits=5, validators=[django.core.validators.MinValueValidator(-100)])),
+                ('priority', models.PositiveSmallIntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Pricing Rule',
+                'verbose_name_plural': 'Pricing Rules',
+                'ordering': ['priority', 'pk'],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_end_dates(apps, schema_editor):
+    PromoCode = apps.get_model('cinema', 'PromoCode')
+    PromoCode.objects.update(expiry_date=F('end_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0014_pricingrule'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='promocode',
+            old_name='discount',
+            new_name='discount_percent',
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='expiry_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # A code expires when its validity window used to end
+        migrations.RunPython(copy_end_dates, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='promocode',
+            name='start_date',
+        ),
+        migrations.RemoveField(
+            model_name='promocode',
+            name='end_date',
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,69 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0015_promocode_expiry_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses',
+            field=models.PositiveIntegerField(blank=True, help_text='Redemptions allowed in total, empty for no limit', null=True),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='max_uses_per_user',
+            field=models.PositiveIntegerField(blank=True, help_text='Redemptions allowed per user, empty for no limit', null=True),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='used_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['expiry_date'], name='promo_expiry_idx'),
+        ),
+        migrations.CreateModel(
+            name='PromoUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uses', models.PositiveIntegerField(default=0)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='cinema.promocode')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promo_usages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Promo Code Usage',
+                'verbose_name_plural': 'Promo Code Usages',
+                'constraints': [models.UniqueConstraint(fields=('promo', 'user'), name='promo_usage_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PromoRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=4)),
+                ('seats', models.PositiveSmallIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='cinema.promocode')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promo_redemptions', to='cinema.session')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promo_redemptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Promo Code Redemption',
+                'verbose_name_plural': 'Promo Code Redemptions',
+                'indexes': [
+                    models.Index(fields=['promo', 'created_at'], name='promo_redemption_promo_idx'),
+                    models.Index(fields=['created_at'], name='promo_redemption_created_idx'),
+                ],
+            },
+        ),
+    ]
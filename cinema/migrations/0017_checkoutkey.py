@@ -0,0 +1,33 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0016_promo_redemptions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('action', models.CharField(max_length=4)),
+                ('seat_numbers', models.JSONField()),
+                ('object_ids', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkout_keys', to='cinema.session')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkout_keys', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Checkout Key',
+                'verbose_name_plural': 'Checkout Keys',
+                'indexes': [models.Index(fields=['created_at'], name='checkout_key_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'key'), name='checkout_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# cinema.search.KIND_CODES and KIND_SLOTS at the time of this migration
+KIND_CODES = {'movie': 1, 'news': 2, 'review': 3}
+KIND_SLOTS = 4
+
+
+def key_documents_by_rowid(apps, schema_editor):
+    # Documents were written with arbitrary rowids; rewrite them with the
+    # rowid derived from their kind and object id
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT kind, object_id, title, body FROM cinema_search')
+        documents = cursor.fetchall()
+        cursor.execute('DELETE FROM cinema_search')
+        cursor.executemany(
+            'INSERT INTO cinema_search (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)',
+            [
+                (object_id * KIND_SLOTS + KIND_CODES[kind], kind, object_id, title, body)
+                for kind, object_id, title, body in documents
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0017_checkoutkey'),
+    ]
+
+    operations = [
+        migrations.RunPython(key_documents_by_rowid, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_activity(apps, schema_editor):
+    Ticket = apps.get_model('cinema', 'Ticket')
+    Booking = apps.get_model('cinema', 'Booking')
+    DailyUserActivity = apps.get_model('cinema', 'DailyUserActivity')
+
+    rows = {}
+    for date, user_id, count, spent in Ticket.objects.annotate(
+        date=TruncDate('purchase_date')
+    ).values_list('date', 'user_id').annotate(count=Count('pk'), spent=Sum('price')).order_by():
+        rows[date, user_id] = DailyUserActivity(date=date, user_id=user_id, tickets=count, spent=spent)
+    for date, user_id, count in Booking.objects.annotate(
+        date=TruncDate('booking_date')
+    ).values_list('date', 'user_id').annotate(count=Count('pk')).order_by():
+        row = rows.setdefault((date, user_id), DailyUserActivity(date=date, user_id=user_id))
+        row.bookings = count
+    DailyUserActivity.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0018_search_rowids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('tickets', models.IntegerField(default=0)),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bookings', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Daily User Activity',
+                'verbose_name_plural': 'Daily User Activity',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='booking',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('session', 'seat_number'), name='booking_active_seat_uniq'),
+        ),
+        migrations.AddField(
+            model_name='dailyuseractivity',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyuseractivity',
+            unique_together={('date', 'user')},
+        ),
+        migrations.RunPython(populate_activity, migrations.RunPython.noop),
+    ]
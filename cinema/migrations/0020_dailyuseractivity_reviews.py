@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def populate_reviews(apps, schema_editor):
+    Review = apps.get_model('cinema', 'Review')
+    DailyUserActivity = apps.get_model('cinema', 'DailyUserActivity')
+
+    for date, user_id, count in Review.objects.annotate(
+        date=TruncDate('created_at')
+    ).values_list('date', 'user_id').annotate(count=Count('pk')).order_by():
+        DailyUserActivity.objects.update_or_create(date=date, user_id=user_id, defaults={'reviews': count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0019_booking_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyuseractivity',
+            name='reviews',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_reviews, migrations.RunPython.noop),
+    ]
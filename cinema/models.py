@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -50,6 +51,8 @@ class Movie(models.Model):
     duration = models.IntegerField(help_text='Duration in minutes')
     budget = models.DecimalField(max_digits=12, decimal_places=2)
     poster = models.ImageField(upload_to='movie_posters/')
+    # Resized copies of the poster, written by cinema.images
+    poster_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField()
     rating = models.DecimalField(
         max_digits=3,
@@ -63,6 +66,9 @@ class Movie(models.Model):
     class Meta:
         verbose_name = _('Movie')
         verbose_name_plural = _('Movies')
+        indexes = [
+            models.Index(fields=['release_date'], name='movie_release_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -85,6 +91,78 @@ class Hall(models.Model):
     def __str__(self):
         return self.name
 
+class HallLayout(models.Model):
+    """
+    Model representing the seat plan of a hall.
+    The plan is a grid of rows by columns stored as one byte per cell: an
+    aisle, a seat of some category or a blocked seat. Seats are numbered row
+    by row from the left, skipping aisles and blocked seats, so seat numbers
+    run from 1 to seat_count like Session.total_seats.
+    """
+    AISLE = 0
+    STANDARD = 1
+    VIP = 2
+    ACCESSIBLE = 3
+    BLOCKED = 4
+    CELL_CHOICES = [
+        (AISLE, _('Aisle')),
+        (STANDARD, _('Standard')),
+        (VIP, _('VIP')),
+        (ACCESSIBLE, _('Accessible')),
+        (BLOCKED, _('Blocked')),
+    ]
+    # One character per cell in the text form of a plan
+    CELL_SYMBOLS = {AISLE: '.', STANDARD: 'S', VIP: 'V', ACCESSIBLE: 'A', BLOCKED: 'X'}
+
+    hall = models.OneToOneField(Hall, on_delete=models.CASCADE, related_name='layout')
+    rows = models.PositiveSmallIntegerField()
+    columns = models.PositiveSmallIntegerField()
+    cells = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Hall Layout')
+        verbose_name_plural = _('Hall Layouts')
+
+    def __str__(self):
+        return f"{self.hall.name}: {self.rows} x {self.columns}"
+
+    @classmethod
+    def parse_plan(cls, plan):
+        """
+        Converts a text plan, one line per row and one symbol per cell, into
+        (rows, columns, cells). Short rows are padded with aisles.
+
+        Raises:
+            ValueError: if the plan is empty or has an unknown symbol
+        """
+        codes = {symbol: code for code, symbol in cls.CELL_SYMBOLS.items()}
+        lines = [line.strip() for line in plan.strip().splitlines()]
+        if not lines or not any(lines):
+            raise ValueError('The plan has no rows.')
+        columns = max(len(line) for line in lines)
+        cells = bytearray()
+        for line in lines:
+            for symbol in line.ljust(columns, cls.CELL_SYMBOLS[cls.AISLE]).upper():
+                if symbol not in codes:
+                    raise ValueError(f'Unknown seat symbol: {symbol!r}')
+                cells.append(codes[symbol])
+        return len(lines), columns, bytes(cells)
+
+    @property
+    def plan(self):
+        cells = bytes(self.cells)
+        return '\n'.join(
+            ''.join(self.CELL_SYMBOLS[code] for code in cells[row * self.columns:(row + 1) * self.columns])
+            for row in range(self.rows)
+        )
+
+    @property
+    def seat_count(self):
+        cells = bytes(self.cells)
+        return len(cells) - cells.count(self.AISLE) - cells.count(self.BLOCKED)
+
 class Session(models.Model):
     """
     Model representing movie sessions.
@@ -93,7 +171,13 @@ class Session(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='sessions')
     hall = models.ForeignKey(Hall, on_delete=models.CASCADE, related_name='sessions')
     start_time = models.DateTimeField()
+    # When the hall is free again: the movie's duration plus a cleaning buffer, set on save
+    end_time = models.DateTimeField(editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_seats = models.IntegerField(default=100)
+    # Denormalized occupancy counters, maintained by cinema.seating and cinema.signals
+    sold_count = models.IntegerField(default=0)
+    held_count = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -101,19 +185,67 @@ class Session(models.Model):
     class Meta:
         verbose_name = _('Session')
         verbose_name_plural = _('Sessions')
+        indexes = [
+            # Upcoming active sessions, overall and per movie
+            models.Index(fields=['start_time'], condition=models.Q(is_active=True), name='session_active_start_idx'),
+            models.Index(fields=['movie', 'start_time'], condition=models.Q(is_active=True), name='session_movie_active_start_idx'),
+            # Overlap checks within a hall
+            models.Index(fields=['hall', 'start_time'], condition=models.Q(is_active=True), name='session_hall_active_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.movie.title} - {self.start_time}"
 
+    def clean(self):
+        """
+        Rejects a session overlapping another active session in the same hall.
+        """
+        from .scheduling import conflicts_for, session_end
+
+        if not (self.movie_id and self.hall_id and self.start_time) or not self.is_active:
+            return
+        self.end_time = session_end(self.start_time, self.movie.duration)
+        overlapping = conflicts_for(self)
+        if overlapping:
+            other = overlapping[0]
+            raise ValidationError(
+                f'The hall is busy with "{other.movie.title}" from '
+                f'{timezone.localtime(other.start_time):%d.%m.%Y %H:%M} to {timezone.localtime(other.end_time):%H:%M}.'
+            )
+
+    def save(self, *args, **kwargs):
+        """
+        The end time follows the start time and the movie's duration. A new
+        session in a hall with a layout takes its seat count from the layout.
+        """
+        from .scheduling import session_end
+
+        self.end_time = session_end(self.start_time, self.movie.duration)
+        if self._state.adding:
+            layout = HallLayout.objects.filter(hall_id=self.hall_id).only('cells').first()
+            if layout is not None:
+                self.total_seats = layout.seat_count
+        super().save(*args, **kwargs)
+
     @property
     def available_seats(self):
         """
-        Calculates the number of available seats for the session.
-        Takes into account both sold tickets and active bookings.
+        Calculates the number of available seats for the session: its
+        total_seats (the seats of the hall layout, or the hall capacity)
+        less the sold and held ones. Read from the occupancy counters, so it
+        costs no queries; a hold that ran out counts until the expiry
+        sweeper releases it.
         """
-        sold_tickets = self.tickets.count()
-        active_bookings = self.bookings.filter(is_active=True, expiry_date__gt=timezone.now()).count()
-        return self.hall.capacity - sold_tickets - active_bookings
+        return max(self.total_seats - self.sold_count - self.held_count, 0)
+
+    @property
+    def occupancy_rate(self):
+        """
+        Returns the percentage of seats that are sold or held.
+        """
+        if self.total_seats <= 0:
+            return 0
+        return round((self.sold_count + self.held_count) / self.total_seats * 100)
 
 class Ticket(models.Model):
     """
@@ -125,12 +257,18 @@ class Ticket(models.Model):
     seat_number = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     purchase_date = models.DateTimeField(auto_now_add=True)
+    is_used = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = _('Ticket')
         verbose_name_plural = _('Tickets')
+        unique_together = ('session', 'seat_number')
+        indexes = [
+            models.Index(fields=['user', 'purchase_date'], name='ticket_user_purchase_idx'),
+            models.Index(fields=['purchase_date'], name='ticket_purchase_idx'),
+        ]
 
     def __str__(self):
         return f"Ticket for {self.session.movie.title} - Seat {self.seat_number}"
@@ -153,6 +291,19 @@ class Booking(models.Model):
     class Meta:
         verbose_name = _('Booking')
         verbose_name_plural = _('Bookings')
+        constraints = [
+            # One active hold per seat; ended holds stay as the booking history
+            models.UniqueConstraint(
+                fields=['session', 'seat_number'], condition=models.Q(is_active=True), name='booking_active_seat_uniq'
+            ),
+        ]
+        indexes = [
+            # Lets the expiry sweeper walk active holds in expiry order
+            models.Index(fields=['expiry_date'], condition=models.Q(is_active=True), name='booking_active_expiry_idx'),
+            # Active holds per session (seat map) and per user (booking list)
+            models.Index(fields=['session', 'expiry_date'], condition=models.Q(is_active=True), name='booking_session_active_idx'),
+            models.Index(fields=['user', 'expiry_date'], condition=models.Q(is_active=True), name='booking_user_active_idx'),
+        ]
 
     def __str__(self):
         return f"Booking for {self.session.movie.title} - Seat {self.seat_number}"
@@ -171,6 +322,109 @@ class Booking(models.Model):
         """
         return timezone.now() > self.expiry_date
 
+class SeatEvent(models.Model):
+    """
+    Model logging seat claims and releases per session.
+    Written by cinema.seating in the same transaction as the tickets and
+    bookings, and streamed to open seat pages by the seat events endpoint.
+    Old rows are pruned by the expire_bookings command.
+    """
+    TAKEN = 'taken'
+    RELEASED = 'released'
+    KIND_CHOICES = [
+        (TAKEN, _('Taken')),
+        (RELEASED, _('Released')),
+    ]
+
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='seat_events')
+    seat_number = models.IntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Seat Event')
+        verbose_name_plural = _('Seat Events')
+        indexes = [
+            # Streams read the events of one session after the last id they sent
+            models.Index(fields=['session', 'id'], name='seatevent_session_idx'),
+            models.Index(fields=['created_at'], name='seatevent_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Seat {self.seat_number} {self.kind} - {self.session_id}"
+
+
+class CheckoutKey(models.Model):
+    """
+    Model remembering the result of a checkout by its idempotency key, so
+    that a repeated submit of the same buy or book request returns the
+    original tickets or bookings instead of claiming the seats again.
+    Written by cinema.seating in the claim's transaction; rows older than
+    cinema.idempotency.CHECKOUT_KEY_TTL are pruned by the expire_bookings command.
+    """
+    key = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='checkout_keys')
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='checkout_keys')
+    action = models.CharField(max_length=4)
+    seat_numbers = models.JSONField()
+    # Primary keys of the claimed tickets or bookings
+    object_ids = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Checkout Key')
+        verbose_name_plural = _('Checkout Keys')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='checkout_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='checkout_key_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} - {self.action} {self.seat_numbers}"
+
+class DailySalesRollup(models.Model):
+    """
+    Model holding materialized daily sales totals per movie and hall.
+    Maintained incrementally by cinema.rollups and rebuilt with the
+    rebuild_sales_rollup management command.
+    """
+    date = models.DateField()
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='sales_rollups')
+    hall = models.ForeignKey(Hall, on_delete=models.CASCADE, related_name='sales_rollups')
+    tickets = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bookings = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('Daily Sales Rollup')
+        verbose_name_plural = _('Daily Sales Rollups')
+        unique_together = ('date', 'movie', 'hall')
+
+    def __str__(self):
+        return f"{self.date} - {self.movie_id}/{self.hall_id}"
+
+class DailyUserActivity(models.Model):
+    """
+    Model holding materialized daily ticket, booking and review totals per user.
+    Maintained together with DailySalesRollup by cinema.rollups.
+    """
+    date = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_activity')
+    tickets = models.IntegerField(default=0)
+    spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bookings = models.IntegerField(default=0)
+    reviews = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('Daily User Activity')
+        verbose_name_plural = _('Daily User Activity')
+        unique_together = ('date', 'user')
+
+    def __str__(self):
+        return f"{self.date} - {self.user_id}"
+
 class Review(models.Model):
     """
     Model representing user reviews for movies.
@@ -186,6 +440,10 @@ class Review(models.Model):
     class Meta:
         verbose_name = _('Review')
         verbose_name_plural = _('Reviews')
+        indexes = [
+            # Newest-first review listing, paginated by (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='review_created_idx'),
+        ]
 
     def __str__(self):
         return f"Review by {self.user.username} for {self.movie.title}"
@@ -198,6 +456,7 @@ class News(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     image = models.ImageField(upload_to='news_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_published = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -205,6 +464,9 @@ class News(models.Model):
     class Meta:
         verbose_name = _('News')
         verbose_name_plural = _('News')
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(is_published=True), name='news_published_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -235,6 +497,7 @@ class CompanyInfo(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     image = models.ImageField(upload_to='company_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -275,12 +538,24 @@ class PromoCode(models.Model):
     discount_percent = models.IntegerField(validators=[MinValueValidator(0), MaxValueValidator(100)])
     is_active = models.BooleanField(default=True)
     expiry_date = models.DateTimeField()
+    max_uses = models.PositiveIntegerField(
+        null=True, blank=True, help_text=_('Redemptions allowed in total, empty for no limit')
+    )
+    max_uses_per_user = models.PositiveIntegerField(
+        null=True, blank=True, help_text=_('Redemptions allowed per user, empty for no limit')
+    )
+    # Redemption counter, maintained by cinema.promos
+    used_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = _('Promo Code')
         verbose_name_plural = _('Promo Codes')
+        indexes = [
+            # Current and archived codes on the promo page
+            models.Index(fields=['expiry_date'], name='promo_expiry_idx'),
+        ]
 
     def __str__(self):
         return self.code
@@ -291,3 +566,112 @@ class PromoCode(models.Model):
         Checks if the promo code has expired.
         """
         return timezone.now() > self.expiry_date
+
+
+class PromoUsage(models.Model):
+    """
+    Model counting a user's redemptions of a promo code, so that the
+    per-user limit is checked with a conditional update.
+    """
+    promo = models.ForeignKey(PromoCode, on_delete=models.CASCADE, related_name='usages')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='promo_usages')
+    uses = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('Promo Code Usage')
+        verbose_name_plural = _('Promo Code Usages')
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'user'], name='promo_usage_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.promo.code}: {self.user.username} x{self.uses}"
+
+
+class PromoRedemption(models.Model):
+    """
+    Model representing one checkout that used a promo code: the seats it
+    claimed and the discount given. Rows are only ever added.
+    """
+    promo = models.ForeignKey(PromoCode, on_delete=models.CASCADE, related_name='redemptions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='promo_redemptions')
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='promo_redemptions')
+    action = models.CharField(max_length=4)
+    seats = models.PositiveSmallIntegerField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    discount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Promo Code Redemption')
+        verbose_name_plural = _('Promo Code Redemptions')
+        indexes = [
+            models.Index(fields=['promo', 'created_at'], name='promo_redemption_promo_idx'),
+            models.Index(fields=['created_at'], name='promo_redemption_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.promo.code} - {self.user.username} - {self.created_at}"
+
+
+class PricingRule(models.Model):
+    """
+    Model representing a price adjustment for the sessions and seats it matches.
+    Conditions left empty match anything. The start time window may wrap past
+    midnight; min_occupancy makes the rule a surge applied once that share of
+    the session's seats is sold or held. Matching rules adjust the price one
+    after another in priority order.
+    """
+    SEAT_CATEGORY_CHOICES = [
+        (HallLayout.STANDARD, _('Standard')),
+        (HallLayout.VIP, _('VIP')),
+        (HallLayout.ACCESSIBLE, _('Accessible')),
+    ]
+
+    name = models.CharField(max_length=100)
+    weekdays = models.CharField(
+        max_length=7, blank=True,
+        help_text=_('Days of the week the rule applies on, 0 for Monday to 6 for Sunday, e.g. "56"')
+    )
+    time_from = models.TimeField(null=True, blank=True)
+    time_to = models.TimeField(null=True, blank=True)
+    seat_category = models.PositiveSmallIntegerField(choices=SEAT_CATEGORY_CHOICES, null=True, blank=True)
+    min_occupancy = models.PositiveSmallIntegerField(
+        null=True, blank=True, validators=[MaxValueValidator(100)],
+        help_text=_('Percentage of sold and held seats from which the rule applies')
+    )
+    percent = models.DecimalField(
+        max_digits=5, decimal_places=2, validators=[MinValueValidator(-100)],
+        help_text=_('Price change in percent, negative for a discount')
+    )
+    priority = models.PositiveSmallIntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Pricing Rule')
+        verbose_name_plural = _('Pricing Rules')
+        ordering = ['priority', 'pk']
+
+    def __str__(self):
+        return f"{self.name} ({self.percent:+}%)"
+
+    def clean(self):
+        if any(day not in '0123456' for day in self.weekdays) or len(set(self.weekdays)) != len(self.weekdays):
+            raise ValidationError({'weekdays': 'Use each of the digits 0 to 6 at most once.'})
+        if (self.time_from is None) != (self.time_to is None):
+            raise ValidationError('Set both ends of the time window or neither.')
+
+    def matches_start(self, start_time):
+        """
+        Checks the weekday and time of day conditions against a local start time.
+        """
+        if self.weekdays and str(start_time.weekday()) not in self.weekdays:
+            return False
+        if self.time_from is None:
+            return True
+        moment = start_time.time()
+        if self.time_from <= self.time_to:
+            return self.time_from <= moment < self.time_to
+        return moment >= self.time_from or moment < self.time_to
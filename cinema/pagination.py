@@ -0,0 +1,254 @@
+"""
+Keyset (cursor) pagination.
+Instead of a page number, a page is addressed by the sort key of the row
+just before it (?after=) or just after it (?before=), e.g. (start_time, id).
+The next page is then a range read on an index, so deep pages cost the
+same as the first one and no COUNT(*) is needed. Cursors are opaque
+URL-safe strings. The mixins at the bottom serve list views by cursor, as
+JSON feeds and from async handlers.
+"""
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+
+
+def encode_cursor(values):
+    # isoformat() keeps the microseconds that DjangoJSONEncoder would round away
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    data = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """
+    Returns the key values stored in a cursor, converted back to the types
+    of the given model fields. Raises Http404 for a malformed cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError(cursor)
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        raise Http404('Invalid cursor')
+
+
+class CursorPage:
+    """
+    One page of a keyset-paginated listing. Offers the parts of Django's Page
+    that the templates use, with cursors in place of page numbers.
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _beyond(names, values, lookup):
+    """
+    Builds the condition "(names) > (values)" (or < with lookup='lt').
+    The leading bound on its own lets the database range-scan an index on the first column.
+    """
+    condition = Q()
+    for i, name in enumerate(names):
+        condition |= Q(**dict(zip(names[:i], values[:i])), **{f'{name}__{lookup}': values[i]})
+    return Q(**{f'{names[0]}__{lookup}e': values[0]}) & condition
+
+
+def _keyset(queryset, ordering, per_page, after, before):
+    """
+    Returns the queryset reading one page (plus one row to tell whether
+    there is more) and a function turning its rows into the CursorPage.
+    """
+    descending = ordering[0].startswith('-')
+    names = [name.lstrip('-') for name in ordering]
+    if any(name.startswith('-') != descending for name in ordering):
+        raise ValueError('Keyset pagination needs every field sorted in the same direction')
+    fields = [queryset.model._meta.get_field(name) for name in names]
+
+    backwards = before is not None
+    cursor = before if backwards else after
+    # Walking backwards reads the rows in the opposite order and flips them afterwards
+    query_descending = descending != backwards
+    if cursor is not None:
+        queryset = queryset.filter(_beyond(names, decode_cursor(cursor, fields), 'lt' if query_descending else 'gt'))
+    queryset = queryset.order_by(*[f'-{name}' if query_descending else name for name in names])[:per_page + 1]
+
+    def key(row):
+        return encode_cursor(getattr(row, field.attname) for field in fields)
+
+    def make_page(rows):
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows)
+        if backwards:
+            return CursorPage(rows, next_cursor=key(rows[-1]), previous_cursor=key(rows[0]) if more else None)
+        return CursorPage(rows, next_cursor=key(rows[-1]) if more else None,
+                          previous_cursor=key(rows[0]) if cursor is not None else None)
+
+    return queryset, make_page
+
+
+def paginate(queryset, ordering, per_page, after=None, before=None):
+    """
+    Returns the CursorPage of a queryset ordered by the given fields, e.g.
+    ('start_time', 'id') or ('-created_at', '-id'). The last field must be
+    unique and all fields must sort in the same direction.
+    """
+    queryset, make_page = _keyset(queryset, ordering, per_page, after, before)
+    return make_page(list(queryset))
+
+
+async def apaginate(queryset, ordering, per_page, after=None, before=None):
+    """
+    Async counterpart of paginate().
+    """
+    queryset, make_page = _keyset(queryset, ordering, per_page, after, before)
+    return make_page([row async for row in queryset])
+
+
+class _IdKey:
+    to_python = staticmethod(int)
+
+
+def paginate_ids(ids, per_page, after=None, before=None):
+    """
+    Cursor pagination of an already ordered list of ids, keyed by the id itself.
+    """
+    cursor = before if before is not None else after
+    position = 0
+    if cursor is not None:
+        (cursor_id,) = decode_cursor(cursor, [_IdKey])
+        try:
+            position = ids.index(cursor_id)
+        except ValueError:
+            raise Http404('Invalid cursor')
+    if before is not None:
+        start, stop = max(position - per_page, 0), position
+    else:
+        start = position + 1 if after is not None else 0
+        stop = start + per_page
+    rows = ids[start:stop]
+    if not rows:
+        return CursorPage(rows)
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor([rows[-1]]) if stop < len(ids) else None,
+        previous_cursor=encode_cursor([rows[0]]) if start > 0 else None
+    )
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin paginating by cursor when the listing has a keyset ordering.
+    ?page= links keep working through the regular Paginator, and
+    as_view(feed=True) serves the same listing as a JSON feed for infinite
+    scrolling, with the URL of the next page under "next".
+    """
+    keyset_ordering = None
+    feed = False
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        if ordering is None or self.request.GET.get(self.page_kwarg):
+            return super().paginate_queryset(queryset, page_size)
+        after, before = self.request.GET.get('after'), self.request.GET.get('before')
+        if isinstance(queryset, list):
+            page = paginate_ids(queryset, page_size, after=after, before=before)
+        else:
+            page = paginate(queryset, ordering, page_size, after=after, before=before)
+        return None, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        if ordering is None or self.request.GET.get(self.page_kwarg) or isinstance(queryset, list):
+            return await super().apaginate_queryset(queryset, page_size)
+        page = await apaginate(
+            queryset, ordering, page_size,
+            after=self.request.GET.get('after'), before=self.request.GET.get('before')
+        )
+        return None, page, page.object_list, page.has_other_pages()
+
+    def feed_item(self, obj):
+        raise NotImplementedError('Subclasses serving a feed must implement feed_item()')
+
+    def render_to_response(self, context, **response_kwargs):
+        if not self.feed:
+            return super().render_to_response(context, **response_kwargs)
+        page = context['page_obj']
+        next_url = None
+        if page is not None and page.has_next():
+            params = self.request.GET.copy()
+            params.pop('before', None)
+            if isinstance(page, CursorPage):
+                params.pop(self.page_kwarg, None)
+                params['after'] = page.next_cursor
+            else:
+                params[self.page_kwarg] = page.next_page_number()
+            next_url = f'{self.request.path}?{params.urlencode()}'
+        return JsonResponse({
+            'results': [self.feed_item(obj) for obj in context['object_list']],
+            'next': next_url,
+        })
+
+
+class AsyncListMixin:
+    """
+    ListView mixin serving GET from an async handler, so that under ASGI the
+    listing is loaded with the async ORM instead of tying up a worker thread.
+    The page is fully loaded before the template response is built.
+    Combine with KeysetPaginationMixin (listed first) for cursor pagination.
+    """
+    async def apaginate_queryset(self, queryset, page_size):
+        # Page numbers need the Paginator, which only counts synchronously
+        def paginate_page():
+            paginator, page, object_list, is_paginated = self.paginate_queryset(queryset, page_size)
+            return paginator, page, list(object_list), is_paginated
+        return await sync_to_async(paginate_page)()
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        if page_size:
+            paginator, page, object_list, is_paginated = await self.apaginate_queryset(self.object_list, page_size)
+        else:
+            paginator, page, is_paginated = None, None, False
+            object_list = [obj async for obj in self.object_list]
+        context = {
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': is_paginated,
+            'object_list': object_list,
+        }
+        context_object_name = self.get_context_object_name(object_list)
+        if context_object_name is not None:
+            context[context_object_name] = object_list
+        context.update(self.extra_context or {})
+        return self.render_to_response(context)
@@ -0,0 +1,173 @@
+"""
+Session and seat pricing.
+A seat's price is the session's base price adjusted by the active
+PricingRule rows matching the session's weekday and start time, the seat
+category and, for surge rules, the session's occupancy. Instead of
+evaluating the rules at checkout they are compiled once per session into a
+PriceTable with the price of every seat category at every occupancy tier,
+so that pricing a seat is a bisect on the occupancy and a list lookup.
+Tables are kept per process for the most recently priced sessions, like
+the seat maps, and rebuilt when a rule, a hall layout or the session
+changes. Promo code discounts (cinema.promos) are applied last.
+"""
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import caching, layouts
+from .models import HallLayout, PricingRule
+
+# Seconds a price table is trusted without checking the rule versions again
+PRICE_TABLE_TTL = getattr(settings, 'PRICE_TABLE_TTL', 60)
+
+# Price tables kept per process; the least recently used are dropped first
+PRICE_TABLE_CACHE_SIZE = getattr(settings, 'PRICE_TABLE_CACHE_SIZE', 1000)
+
+CENT = Decimal('0.01')
+
+_tables = OrderedDict()
+_rules = None
+_lock = threading.Lock()
+
+
+def _round(price):
+    return max(price, Decimal(0)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def discounted(price, discount_percent):
+    """
+    Applies a promo code discount to a price.
+    """
+    if not discount_percent:
+        return price
+    return _round(price * (100 - discount_percent) / 100)
+
+
+class PriceTable:
+    """
+    Prices of one session. tiers lists the occupancy percentages at which
+    surge rules start, from 0 up; prices maps a seat category code to its
+    price at each tier. categories maps a seat number to its category code.
+    """
+    def __init__(self, tiers, prices, categories):
+        self.tiers = tiers
+        self.prices = prices
+        self.categories = categories
+
+    def tier(self, occupancy):
+        return bisect_right(self.tiers, occupancy) - 1
+
+    def price(self, category, occupancy, discount_percent=0):
+        return discounted(self.prices[category][self.tier(occupancy)], discount_percent)
+
+    def seat_price(self, seat_number, occupancy, discount_percent=0):
+        return self.price(self.categories[seat_number], occupancy, discount_percent)
+
+    def current(self, occupancy, discount_percent=0):
+        """
+        Returns {category name: price} at the given occupancy, cheapest first.
+        """
+        index = self.tier(occupancy)
+        prices = {
+            layouts.CATEGORY_NAMES[category]: discounted(prices[index], discount_percent)
+            for category, prices in self.prices.items()
+        }
+        return dict(sorted(prices.items(), key=lambda item: item[1]))
+
+
+def _versions():
+    return caching.version(PricingRule, HallLayout)
+
+
+def _load_rules():
+    global _rules
+    version = _versions()
+    rules = _rules
+    if rules is None or rules[0] != version or time.monotonic() - rules[1] > PRICE_TABLE_TTL:
+        rules = _rules = (version, time.monotonic(), list(PricingRule.objects.filter(is_active=True)))
+    return rules
+
+
+def active_rules():
+    """
+    Returns the active pricing rules in priority order, loaded once per rule change.
+    """
+    return _load_rules()[2]
+
+
+def build_table(session, rules):
+    """
+    Compiles the rules matching the session into its price table.
+    """
+    plan, has_layout = layouts.plan_for_session(session)
+    start = timezone.localtime(session.start_time)
+    rules = [rule for rule in rules if rule.matches_start(start)]
+    tiers = sorted({0, *(rule.min_occupancy for rule in rules if rule.min_occupancy)})
+    categories = sorted(set(plan.categories[1:])) if has_layout else [HallLayout.STANDARD]
+
+    prices = {}
+    for category in categories:
+        prices[category] = []
+        for tier in tiers:
+            price = Decimal(str(session.price))
+            for rule in rules:
+                if rule.seat_category not in (None, category):
+                    continue
+                if rule.min_occupancy and rule.min_occupancy > tier:
+                    continue
+                price = price * (100 + rule.percent) / 100
+            prices[category].append(_round(price))
+    return PriceTable(tiers, prices, plan.categories)
+
+
+def get_table(session):
+    """
+    Returns the session's price table, rebuilt when the rules, the hall layout
+    or the session's base price, start time or seat count change.
+    """
+    version, _, rules = _load_rules()
+    key = (version, session.price, session.start_time, session.hall_id, session.total_seats)
+    entry = _tables.get(session.pk)
+    if entry is not None and entry[0] == key and time.monotonic() - entry[1] <= PRICE_TABLE_TTL:
+        with _lock:
+            if session.pk in _tables:
+                _tables.move_to_end(session.pk)
+        return entry[2]
+    table = build_table(session, rules)
+    with _lock:
+        _tables[session.pk] = (key, time.monotonic(), table)
+        _tables.move_to_end(session.pk)
+        while len(_tables) > PRICE_TABLE_CACHE_SIZE:
+            _tables.popitem(last=False)
+    return table
+
+
+def seat_prices(session, seat_numbers, occupancy=None, discount_percent=0):
+    """
+    Returns {seat number: price} for the seats at the session's current
+    occupancy (or the given one), after the promo discount.
+    """
+    table = get_table(session)
+    if occupancy is None:
+        occupancy = session.occupancy_rate
+    return {
+        seat_number: table.seat_price(seat_number, occupancy, discount_percent)
+        for seat_number in seat_numbers
+    }
+
+
+def invalidate():
+    """
+    Drops this process's price tables and rules, and the hall plans they
+    were built from.
+    """
+    global _rules
+    with _lock:
+        _tables.clear()
+    _rules = None
+    layouts.invalidate()
@@ -0,0 +1,240 @@
+"""
+Lightweight request profiling for production.
+ProfilingMiddleware times every request and, through a database execute
+wrapper and the ProfiledTemplates backend, the queries it runs and the
+templates it renders. The figures go into a Server-Timing header and an
+in-process ring buffer of the last PROFILING_BUFFER_SIZE requests, which
+the staff profiling page summarizes into the slowest views and the most
+repeated SQL. The buffer is per process, like the other in-process caches.
+"""
+import contextvars
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+PROFILING_ENABLED = getattr(settings, 'PROFILING_ENABLED', True)
+PROFILING_BUFFER_SIZE = getattr(settings, 'PROFILING_BUFFER_SIZE', 2000)
+
+# Longer statements are cut so that the buffer stays small
+MAX_SQL_LENGTH = 500
+
+_current = contextvars.ContextVar('cinema_profile', default=None)
+_buffer = deque(maxlen=PROFILING_BUFFER_SIZE)
+_lock = threading.Lock()
+
+
+@dataclass
+class RequestProfile:
+    """
+    Timings of one request, in seconds.
+    """
+    path: str
+    method: str
+    view: str = ''
+    status: int = 0
+    total: float = 0.0
+    db_time: float = 0.0
+    db_count: int = 0
+    template_time: float = 0.0
+    # SQL text -> [executions, seconds]
+    queries: dict = field(default_factory=dict)
+    started_at: float = field(default_factory=time.time)
+    started: float = 0.0
+    template_depth: int = 0
+
+    def add_query(self, sql, seconds):
+        self.db_count += 1
+        self.db_time += seconds
+        stats = self.queries.setdefault(sql[:MAX_SQL_LENGTH], [0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not values:
+        return None
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """
+    Adds the query timer to every new database connection, whichever thread
+    opens it; queries outside a profiled request pass straight through.
+    """
+    if _record_query not in connection.execute_wrappers:
+        # First in the list, so that execute_wrapper() blocks still pop their own wrapper
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+if PROFILING_ENABLED:
+    connection_created.connect(install_query_wrapper, dispatch_uid='cinema_profiling')
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return self.template.render(context, request)
+        # Templates rendered while rendering another one are already counted
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_time += time.perf_counter() - started
+
+
+class ProfiledTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing the templates rendered during a profiled request.
+    """
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+def server_timing(profile):
+    return ', '.join((
+        f'db;dur={profile.db_time * 1000:.1f};desc="{profile.db_count} queries"',
+        f'tpl;dur={profile.template_time * 1000:.1f}',
+        f'total;dur={profile.total * 1000:.1f}',
+    ))
+
+
+class ProfilingMiddleware:
+    """
+    Profiles every request and adds a Server-Timing header to the response.
+    Place it first so that the time spent in the other middleware is included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not PROFILING_ENABLED:
+            return self.get_response(request)
+        profile, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(profile, request, response)
+
+    async def __acall__(self, request):
+        if not PROFILING_ENABLED:
+            return await self.get_response(request)
+        profile, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(profile, request, response)
+
+    def start(self, request):
+        profile = RequestProfile(path=request.path, method=request.method, started=time.perf_counter())
+        return profile, _current.set(profile)
+
+    def finish(self, profile, request, response):
+        profile.total = time.perf_counter() - profile.started
+        match = request.resolver_match
+        profile.view = match.view_name if match else ''
+        profile.status = response.status_code
+        response['Server-Timing'] = server_timing(profile)
+        with _lock:
+            _buffer.append(profile)
+        return response
+
+
+def profiles():
+    with _lock:
+        return list(_buffer)
+
+
+def clear():
+    with _lock:
+        _buffer.clear()
+
+
+def slowest_views(limit=20):
+    """
+    Per-view latency percentiles and mean database and template cost, slowest p95 first.
+    """
+    views = {}
+    for profile in profiles():
+        views.setdefault(profile.view or profile.path, []).append(profile)
+    rows = []
+    for view, samples in views.items():
+        totals = sorted(profile.total * 1000 for profile in samples)
+        rows.append({
+            'view': view,
+            'requests': len(samples),
+            'p50_ms': percentile(totals, 0.50),
+            'p95_ms': percentile(totals, 0.95),
+            'p99_ms': percentile(totals, 0.99),
+            'db_count': statistics.mean(profile.db_count for profile in samples),
+            'db_ms': statistics.mean(profile.db_time * 1000 for profile in samples),
+            'template_ms': statistics.mean(profile.template_time * 1000 for profile in samples),
+        })
+    rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return rows[:limit]
+
+
+def repeated_queries(limit=20):
+    """
+    SQL statements by executions across the buffered requests. max_per_request
+    well above one points at a query run in a loop.
+    """
+    queries = {}
+    for profile in profiles():
+        for sql, (count, seconds) in profile.queries.items():
+            row = queries.setdefault(sql, {
+                'sql': sql, 'executions': 0, 'total_ms': 0.0, 'requests': 0, 'max_per_request': 0, 'views': set(),
+            })
+            row['executions'] += count
+            row['total_ms'] += seconds * 1000
+            row['requests'] += 1
+            row['max_per_request'] = max(row['max_per_request'], count)
+            row['views'].add(profile.view or profile.path)
+    rows = sorted(queries.values(), key=lambda row: (row['executions'], row['total_ms']), reverse=True)[:limit]
+    for row in rows:
+        row['views'] = sorted(row['views'])
+    return rows
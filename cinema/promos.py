@@ -0,0 +1,161 @@
+"""
+Promo code lookup and redemption.
+Every code is kept in a per-process index keyed by its upper-case text,
+so checking a code at checkout or for uniqueness costs no query. The
+index is rebuilt when a code is saved or deleted (through the
+cinema.caching version bumped by the signal handlers), when the earliest
+code in it expires, or after PROMO_INDEX_TTL seconds.
+Redemptions are counted with conditional UPDATEs in the checkout's
+transaction, so concurrent checkouts can neither lose an increment nor
+go past a code's total or per-user limit, and each one is logged in the
+PromoRedemption ledger.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import caching
+from .models import PromoCode, PromoRedemption, PromoUsage
+
+# Seconds the index is trusted without checking the promo code version again
+PROMO_INDEX_TTL = getattr(settings, 'PROMO_INDEX_TTL', 60)
+
+_index = None
+_lock = threading.Lock()
+
+
+class PromoUnavailable(Exception):
+    """
+    Raised when a promo code cannot be redeemed: unknown, inactive, expired or used up.
+    """
+
+
+@dataclass(frozen=True)
+class Promo:
+    """
+    The fields of a promo code needed at checkout.
+    """
+    pk: int
+    code: str
+    discount_percent: int
+    expiry_date: datetime
+    is_active: bool
+
+    def is_valid(self, now=None):
+        return self.is_active and self.expiry_date > (now or timezone.now())
+
+
+class PromoIndex:
+    """
+    All promo codes by normalized code. next_expiry is the earliest expiry
+    of a code still valid when the index was built.
+    """
+    def __init__(self, version, promos, now):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.codes = {normalize(promo.code): promo for promo in promos}
+        self.next_expiry = min((promo.expiry_date for promo in promos if promo.is_valid(now)), default=None)
+
+    def is_current(self, version, now):
+        return (
+            self.version == version
+            and time.monotonic() - self.built_at <= PROMO_INDEX_TTL
+            and (self.next_expiry is None or self.next_expiry > now)
+        )
+
+
+def normalize(code):
+    return code.strip().upper()
+
+
+def get_index(now=None):
+    """
+    Returns the current promo code index, rebuilding it if a code changed or expired.
+    """
+    global _index
+    now = now or timezone.now()
+    version = caching.version(PromoCode)
+    index = _index
+    if index is None or not index.is_current(version, now):
+        with _lock:
+            index = _index
+            if index is None or not index.is_current(version, now):
+                promos = [
+                    Promo(*row) for row in PromoCode.objects.values_list(
+                        'pk', 'code', 'discount_percent', 'expiry_date', 'is_active'
+                    ).iterator(chunk_size=2000)
+                ]
+                index = _index = PromoIndex(version, promos, now)
+    return index
+
+
+def invalidate():
+    global _index
+    _index = None
+
+
+def code_exists(code, exclude_pk=None):
+    """
+    Tells whether another promo code has the same text, ignoring case.
+    """
+    promo = get_index().codes.get(normalize(code))
+    return promo is not None and promo.pk != exclude_pk
+
+
+def lookup(code, now=None):
+    """
+    Returns the active, unexpired promo code matching the text, ignoring case.
+
+    Raises:
+        PromoUnavailable: if there is no such code
+    """
+    now = now or timezone.now()
+    promo = get_index(now).codes.get(normalize(code))
+    if promo is None or not promo.is_valid(now):
+        raise PromoUnavailable('Invalid or expired promo code.')
+    return promo
+
+
+def redeem(promo, user, session, action, prices, discount):
+    """
+    Counts a checkout by the user against the code's limits and logs it in
+    the ledger with the prices paid per seat and the discount given. Runs
+    inside the checkout's transaction, so a checkout that fails later gives
+    the redemption back.
+
+    Raises:
+        PromoUnavailable: if the code has expired, been disabled or reached a limit
+    """
+    with transaction.atomic():
+        counted = PromoCode.objects.filter(
+            pk=promo.pk,
+            is_active=True,
+            expiry_date__gt=timezone.now()
+        ).filter(
+            Q(max_uses__isnull=True) | Q(used_count__lt=F('max_uses'))
+        ).update(used_count=F('used_count') + 1)
+        if not counted:
+            raise PromoUnavailable('This promo code is no longer available.')
+
+        usage, _ = PromoUsage.objects.get_or_create(promo_id=promo.pk, user=user)
+        counted = PromoUsage.objects.filter(pk=usage.pk).filter(
+            Q(promo__max_uses_per_user__isnull=True) | Q(uses__lt=F('promo__max_uses_per_user'))
+        ).update(uses=F('uses') + 1)
+        if not counted:
+            raise PromoUnavailable('You have already used this promo code.')
+
+        return PromoRedemption.objects.create(
+            promo_id=promo.pk,
+            user=user,
+            session=session,
+            action=action,
+            seats=len(prices),
+            amount=sum(prices.values()),
+            discount=discount
+        )
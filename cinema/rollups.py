@@ -0,0 +1,114 @@
+"""
+Daily sales rollup maintenance.
+Keeps DailySalesRollup rows (per movie and hall) and DailyUserActivity
+rows (per user) in step with ticket sales, bookings and reviews so the
+dashboards aggregate a handful of rows per day instead of the history.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Booking, DailySalesRollup, DailyUserActivity, Review, Ticket
+
+
+def _add(model, keys, amounts):
+    """
+    Adds the amounts to the model's row with the given keys, creating the
+    row on the first change of the day.
+    """
+    row = model.objects.filter(**keys)
+    changes = {field: F(field) + amount for field, amount in amounts.items()}
+    if row.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **amounts)
+    except IntegrityError:
+        # Another request created the row first
+        row.update(**changes)
+
+
+def record_sales(movie_id, hall_id, tickets=0, revenue=0, bookings=0, date=None):
+    """
+    Adds the given amounts to the rollup row for the day, movie and hall,
+    creating the row on the first sale of the day. Negative amounts undo sales.
+    """
+    _add(
+        DailySalesRollup,
+        {'date': date or timezone.localdate(), 'movie_id': movie_id, 'hall_id': hall_id},
+        {'tickets': tickets, 'revenue': revenue, 'bookings': bookings}
+    )
+
+
+def record_activity(user_id, tickets=0, spent=0, bookings=0, reviews=0, date=None):
+    """
+    Adds the given amounts to the user's activity row for the day, like record_sales.
+    """
+    _add(
+        DailyUserActivity,
+        {'date': date or timezone.localdate(), 'user_id': user_id},
+        {'tickets': tickets, 'spent': spent, 'bookings': bookings, 'reviews': reviews}
+    )
+
+
+def rebuild(start_date=None, end_date=None):
+    """
+    Recomputes both rollups from tickets, bookings and reviews for the
+    inclusive date range (the whole history when no bounds are given).
+    Every hold is its own Booking row, so the bookings counted here are the
+    ones recorded when the holds were made.
+    Returns the number of sales rollup rows written.
+    """
+    tickets = Ticket.objects.annotate(date=TruncDate('purchase_date'))
+    bookings = Booking.objects.annotate(date=TruncDate('booking_date'))
+    reviews = Review.objects.annotate(date=TruncDate('created_at'))
+    existing = DailySalesRollup.objects.all()
+    existing_activity = DailyUserActivity.objects.all()
+    if start_date:
+        tickets = tickets.filter(date__gte=start_date)
+        bookings = bookings.filter(date__gte=start_date)
+        reviews = reviews.filter(date__gte=start_date)
+        existing = existing.filter(date__gte=start_date)
+        existing_activity = existing_activity.filter(date__gte=start_date)
+    if end_date:
+        tickets = tickets.filter(date__lte=end_date)
+        bookings = bookings.filter(date__lte=end_date)
+        reviews = reviews.filter(date__lte=end_date)
+        existing = existing.filter(date__lte=end_date)
+        existing_activity = existing_activity.filter(date__lte=end_date)
+
+    rows = {}
+    for date, movie_id, hall_id, count, revenue in tickets.values_list(
+        'date', 'session__movie_id', 'session__hall_id'
+    ).annotate(count=Count('id'), revenue=Sum('price')).order_by():
+        rows[date, movie_id, hall_id] = DailySalesRollup(
+            date=date, movie_id=movie_id, hall_id=hall_id, tickets=count, revenue=revenue
+        )
+    for date, movie_id, hall_id, count in bookings.values_list(
+        'date', 'session__movie_id', 'session__hall_id'
+    ).annotate(count=Count('id')).order_by():
+        row = rows.setdefault(
+            (date, movie_id, hall_id),
+            DailySalesRollup(date=date, movie_id=movie_id, hall_id=hall_id)
+        )
+        row.bookings = count
+
+    activity = {}
+    for date, user_id, count, spent in tickets.values_list('date', 'user_id').annotate(
+        count=Count('id'), spent=Sum('price')
+    ).order_by():
+        activity[date, user_id] = DailyUserActivity(date=date, user_id=user_id, tickets=count, spent=spent)
+    for date, user_id, count in bookings.values_list('date', 'user_id').annotate(count=Count('id')).order_by():
+        row = activity.setdefault((date, user_id), DailyUserActivity(date=date, user_id=user_id))
+        row.bookings = count
+    for date, user_id, count in reviews.values_list('date', 'user_id').annotate(count=Count('id')).order_by():
+        row = activity.setdefault((date, user_id), DailyUserActivity(date=date, user_id=user_id))
+        row.reviews = count
+
+    with transaction.atomic():
+        existing.delete()
+        DailySalesRollup.objects.bulk_create(rows.values(), batch_size=1000)
+        existing_activity.delete()
+        DailyUserActivity.objects.bulk_create(activity.values(), batch_size=1000)
+    return len(rows)
@@ -0,0 +1,228 @@
+"""
+Hall scheduling.
+A session occupies its hall from start_time until the movie ends plus a
+cleaning buffer (Session.end_time). HallSchedule keeps one hall's
+sessions as intervals sorted by start, so that an overlap check is a
+binary search; create_sessions() checks a whole batch of new sessions,
+say a week generated from a template, against the halls' existing
+sessions and each other, and inserts them with one bulk_create only if
+none conflicts.
+"""
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime, time as day_time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, facets
+from .models import Hall, HallLayout, Movie, Session
+
+# Time between the end of a movie and the next session in the hall
+CLEANING_BUFFER = timedelta(minutes=getattr(settings, 'SESSION_CLEANING_MINUTES', 15))
+
+
+def session_end(start_time, duration):
+    """
+    Returns when a session of a movie lasting duration minutes frees its hall.
+    """
+    return start_time + timedelta(minutes=duration) + CLEANING_BUFFER
+
+
+class ScheduleConflict(Exception):
+    """
+    Raised when new sessions overlap each other or existing sessions.
+    conflicts is a list of (new session, overlapped session) pairs.
+    """
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f'{len(conflicts)} session(s) overlap the schedule.')
+
+
+class HallSchedule:
+    """
+    Sessions of one hall as half-open intervals [start, end) sorted by start.
+    max_ends[i] is the latest end among the first i + 1 intervals, so that
+    intervals overlapping each other (legacy data) do not hide a conflict
+    and a conflict is found with two binary searches.
+    """
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.max_ends = []
+        self.sessions = []
+
+    @classmethod
+    def load(cls, hall_id, start, end):
+        """
+        Loads the active sessions of the hall that overlap [start, end).
+        """
+        schedule = cls()
+        queryset = Session.objects.filter(
+            hall_id=hall_id, is_active=True, start_time__lt=end, end_time__gt=start
+        ).only('id', 'movie_id', 'hall_id', 'start_time', 'end_time').order_by('start_time')
+        for session in queryset:
+            schedule.add(session)
+        return schedule
+
+    def conflict(self, start, end):
+        """
+        Returns a session overlapping [start, end), or None.
+        """
+        # Only intervals starting before the end can overlap
+        index = bisect_left(self.starts, end)
+        # max_ends never decreases, and the first interval to raise it past the
+        # start ends after the start itself, so it is an overlapping session
+        position = bisect_right(self.max_ends, start, 0, index)
+        return self.sessions[position] if position < index else None
+
+    def add(self, session):
+        index = bisect_left(self.starts, session.start_time)
+        latest = max(self.max_ends[index - 1], session.end_time) if index else session.end_time
+        self.starts.insert(index, session.start_time)
+        self.ends.insert(index, session.end_time)
+        self.sessions.insert(index, session)
+        self.max_ends.insert(index, latest)
+        # The later maxima only change until one already reaches the new end
+        for position in range(index + 1, len(self.max_ends)):
+            if self.max_ends[position] >= latest:
+                break
+            self.max_ends[position] = latest
+
+
+def conflicts_for(session):
+    """
+    Returns the active sessions in the same hall overlapping the given one.
+    """
+    return list(
+        Session.objects.filter(
+            hall_id=session.hall_id, is_active=True,
+            start_time__lt=session.end_time, end_time__gt=session.start_time
+        ).exclude(pk=session.pk).select_related('movie').order_by('start_time')
+    )
+
+
+@dataclass
+class Slot:
+    """
+    One session of a schedule template: a weekday (0 is Monday), a local
+    start time, the hall, the movie and the price.
+    """
+    weekday: int
+    start: day_time
+    hall_id: int
+    movie_id: int
+    price: Decimal
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Builds a slot from {'weekday', 'time': 'HH:MM', 'hall', 'movie', 'price'}.
+
+        Raises:
+            ValueError: if a value is missing or malformed
+        """
+        try:
+            weekday = int(data['weekday'])
+            if not 0 <= weekday <= 6:
+                raise ValueError
+            return cls(
+                weekday=weekday,
+                start=datetime.strptime(data['time'], '%H:%M').time(),
+                hall_id=int(data['hall']),
+                movie_id=int(data['movie']),
+                price=Decimal(str(data['price'])),
+            )
+        except (KeyError, TypeError, ValueError, ArithmeticError):
+            raise ValueError(f'Invalid schedule slot: {data!r}')
+
+
+def week_template(week_start, hall_ids=None):
+    """
+    Returns the slots of the active sessions in the week starting on
+    week_start, to repeat them in another week.
+    """
+    start = timezone.make_aware(datetime.combine(week_start, day_time.min))
+    queryset = Session.objects.filter(
+        is_active=True, start_time__gte=start, start_time__lt=start + timedelta(days=7)
+    ).order_by('start_time')
+    if hall_ids:
+        queryset = queryset.filter(hall_id__in=hall_ids)
+    slots = []
+    for session in queryset.only('hall_id', 'movie_id', 'start_time', 'price'):
+        local = timezone.localtime(session.start_time)
+        slots.append(Slot(local.weekday(), local.time(), session.hall_id, session.movie_id, session.price))
+    return slots
+
+
+def build_sessions(slots, week_start):
+    """
+    Turns template slots into unsaved sessions in the seven days starting on
+    week_start, each on the day that falls on its slot's weekday, with end
+    times from the movie durations and seat counts from the hall layouts (or
+    hall capacities), in three queries. week_start need not be a Monday.
+    """
+    durations = dict(Movie.objects.filter(pk__in={slot.movie_id for slot in slots}).values_list('pk', 'duration'))
+    halls = dict(Hall.objects.filter(pk__in={slot.hall_id for slot in slots}).values_list('pk', 'capacity'))
+    for layout in HallLayout.objects.filter(hall_id__in=halls).only('hall_id', 'cells'):
+        halls[layout.hall_id] = layout.seat_count
+    sessions = []
+    for slot in slots:
+        if slot.movie_id not in durations or slot.hall_id not in halls:
+            raise ValueError(f'Unknown movie {slot.movie_id} or hall {slot.hall_id} in the template.')
+        day = week_start + timedelta(days=(slot.weekday - week_start.weekday()) % 7)
+        start_time = timezone.make_aware(datetime.combine(day, slot.start))
+        sessions.append(Session(
+            movie_id=slot.movie_id,
+            hall_id=slot.hall_id,
+            start_time=start_time,
+            end_time=session_end(start_time, durations[slot.movie_id]),
+            price=slot.price,
+            total_seats=halls[slot.hall_id],
+        ))
+    return sessions
+
+
+def find_conflicts(sessions):
+    """
+    Returns (new session, overlapped session) pairs for the new sessions that
+    overlap an existing active session or an earlier one of the batch. Each
+    hall's existing sessions in the batch's time range are loaded in one query.
+    """
+    by_hall = {}
+    for session in sessions:
+        by_hall.setdefault(session.hall_id, []).append(session)
+    conflicts = []
+    for hall_id, hall_sessions in by_hall.items():
+        window = (min(s.start_time for s in hall_sessions), max(s.end_time for s in hall_sessions))
+        schedule = HallSchedule.load(hall_id, *window)
+        for session in sorted(hall_sessions, key=lambda s: s.start_time):
+            other = schedule.conflict(session.start_time, session.end_time)
+            if other is not None:
+                conflicts.append((session, other))
+            else:
+                schedule.add(session)
+    return conflicts
+
+
+def create_sessions(sessions):
+    """
+    Inserts the new sessions with one bulk_create if none of them conflicts.
+
+    Raises:
+        ScheduleConflict: if any session overlaps; nothing is inserted
+    """
+    with transaction.atomic():
+        # Serialize schedule changes of the halls involved
+        list(Hall.objects.select_for_update().filter(pk__in={s.hall_id for s in sessions}).values_list('pk'))
+        conflicts = find_conflicts(sessions)
+        if conflicts:
+            raise ScheduleConflict(conflicts)
+        created = Session.objects.bulk_create(sessions)
+    # bulk_create sends no signals
+    caching.bump(Session)
+    facets.invalidate()
+    return created
+
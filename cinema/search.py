@@ -0,0 +1,212 @@
+"""
+Full-text search over movies, news and reviews.
+Documents live in the cinema_search SQLite FTS5 table, which the signal
+handlers keep in step with the models. A document's rowid is derived
+from its kind and object id, so replacing or dropping one object's
+document is a rowid lookup rather than a scan of the UNINDEXED columns.
+The unicode61 tokenizer folds case for Cyrillic as well as Latin text,
+and the prefix indexes make the search-as-you-type queries cheap. Other
+database backends fall back to icontains lookups.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Movie, News, Review
+
+SEARCH_TABLE = 'cinema_search'
+
+KINDS = {
+    'movie': Movie,
+    'news': News,
+    'review': Review,
+}
+
+# Low part of a document's rowid; the rest is the object id
+KIND_CODES = {'movie': 1, 'news': 2, 'review': 3}
+KIND_SLOTS = 4
+
+# bm25() column weights: kind, object_id, title, body
+_WEIGHTS = (0.0, 0.0, 10.0, 1.0)
+
+_WORD = re.compile(r'\w+')
+
+# Control characters mark the matches in snippets until the text is escaped
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def _document(instance):
+    """
+    Returns (kind, title, body) for a model instance, or None if it should not be searchable.
+    """
+    if isinstance(instance, Movie):
+        genres = ' '.join(genre.name for genre in instance.genres.all())
+        return 'movie', instance.title, f'{instance.description} {instance.country} {genres}'
+    if isinstance(instance, News):
+        if not instance.is_published:
+            return None
+        return 'news', instance.title, instance.content
+    if isinstance(instance, Review):
+        return 'review', '', instance.text
+    return None
+
+
+def _kind(model):
+    for kind, kind_model in KINDS.items():
+        if issubclass(model, kind_model):
+            return kind
+    return None
+
+
+def rowid(kind, pk):
+    """
+    Returns the rowid of the document of one object.
+    """
+    return pk * KIND_SLOTS + KIND_CODES[kind]
+
+
+def remove(model, pk):
+    """
+    Drops the document of the given object from the index.
+    """
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [rowid(_kind(model), pk)])
+
+
+def index(instance):
+    """
+    Writes (or removes) the document of one object.
+    """
+    if not is_available():
+        return
+    remove(type(instance), instance.pk)
+    document = _document(instance)
+    if document is None:
+        return
+    kind, title, body = document
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)',
+            [rowid(kind, instance.pk), kind, instance.pk, title, body]
+        )
+
+
+def rebuild():
+    """
+    Rebuilds the whole index from the database. Returns the number of documents.
+    """
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    count = 0
+    for model in KINDS.values():
+        queryset = model.objects.all()
+        if model is Movie:
+            queryset = queryset.prefetch_related('genres')
+        for instance in queryset.iterator(chunk_size=500):
+            index(instance)
+            count += 1
+    return count
+
+
+def match_expression(query, column=None):
+    """
+    Turns free text into an FTS5 MATCH expression: every word must match,
+    and every word also matches as a prefix. Returns '' if there are no words.
+    """
+    words = _WORD.findall(query.lower())
+    prefix = f'{column} : ' if column else ''
+    return ' '.join(f'{prefix}"{word}"*' for word in words)
+
+
+def search(query, kinds=None, limit=20):
+    """
+    Returns up to limit hits as dicts with kind, id and a highlighted snippet,
+    best first.
+    """
+    kinds = list(kinds or KINDS)
+    if not is_available():
+        return _fallback_search(query, kinds, limit)
+    expression = match_expression(query)
+    if not expression:
+        return []
+    placeholders = ', '.join(['%s'] * len(kinds))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT kind, object_id, snippet({SEARCH_TABLE}, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) "
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND kind IN ({placeholders}) '
+            f'ORDER BY bm25({SEARCH_TABLE}, {", ".join(map(str, _WEIGHTS))}) LIMIT %s',
+            [expression, *kinds, limit]
+        )
+        return [
+            {'kind': kind, 'id': object_id, 'snippet': _highlight(snippet)}
+            for kind, object_id, snippet in cursor.fetchall()
+        ]
+
+
+def _highlight(snippet):
+    return mark_safe(escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
+
+
+def matching_ids(kind, query, limit=1000):
+    """
+    Returns the ids of the best matching objects of one kind.
+    """
+    return [hit['id'] for hit in search(query, [kind], limit)]
+
+
+def autocomplete(query, limit=8):
+    """
+    Returns up to limit (kind, id, title) suggestions whose title starts with the typed words.
+    """
+    if not is_available():
+        return [
+            (hit['kind'], hit['id'], hit['title'])
+            for hit in _fallback_search(query, ['movie', 'news'], limit, titles_only=True)
+        ]
+    expression = match_expression(query, column='title')
+    if not expression:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT kind, object_id, title FROM {SEARCH_TABLE} '
+            f"WHERE {SEARCH_TABLE} MATCH %s AND kind IN ('movie', 'news') "
+            f'ORDER BY bm25({SEARCH_TABLE}, {", ".join(map(str, _WEIGHTS))}) LIMIT %s',
+            [expression, limit]
+        )
+        return cursor.fetchall()
+
+
+def _fallback_search(query, kinds, limit, titles_only=False):
+    words = _WORD.findall(query)
+    if not words:
+        return []
+    fields = {
+        'movie': ('title',) if titles_only else ('title', 'description', 'country', 'genres__name'),
+        'news': ('title',) if titles_only else ('title', 'content'),
+        'review': ('text',),
+    }
+    hits = []
+    for kind in kinds:
+        queryset = KINDS[kind].objects.all()
+        if kind == 'news':
+            queryset = queryset.filter(is_published=True)
+        for word in words:
+            condition = Q()
+            for field in fields[kind]:
+                condition |= Q(**{f'{field}__icontains': word})
+            queryset = queryset.filter(condition)
+        title = 'text' if kind == 'review' else 'title'
+        for pk, text in queryset.distinct().values_list('pk', title)[:limit]:
+            hits.append({'kind': kind, 'id': pk, 'title': text, 'snippet': ''})
+    return hits[:limit]
@@ -0,0 +1,452 @@
+"""
+Seat reservation service.
+Keeps a compact bitmap of occupied seats per session and claims seats
+with a compare-and-set inside a transaction.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import idempotency, pricing, promos, rollups
+from .models import Booking, SeatEvent, Session, Ticket
+
+# Seconds a cached seat map is trusted before it is rebuilt from the database
+SEAT_MAP_TTL = getattr(settings, 'SEAT_MAP_TTL', 30)
+
+# Seat maps kept per process; the least recently used are dropped first
+SEAT_MAP_CACHE_SIZE = getattr(settings, 'SEAT_MAP_CACHE_SIZE', 1000)
+
+# How long a temporary booking holds a seat
+BOOKING_HOLD = timezone.timedelta(minutes=15)
+
+# Upper bound on the number of seats claimed in a single checkout
+MAX_SEATS_PER_CLAIM = getattr(settings, 'MAX_SEATS_PER_CLAIM', 10)
+
+# How long seat events are kept for reconnecting live seat streams
+SEAT_EVENT_RETENTION = timezone.timedelta(seconds=getattr(settings, 'SEAT_EVENT_RETENTION', 3600))
+
+# Per-seat conflict reasons
+SEAT_INVALID = 'invalid'
+SEAT_TAKEN = 'taken'
+
+_CONFLICT_MESSAGES = {
+    SEAT_INVALID: 'Invalid seat number.',
+    SEAT_TAKEN: 'This seat is already taken.',
+}
+
+_seat_maps = OrderedDict()
+_lock = threading.Lock()
+
+
+class SeatUnavailable(Exception):
+    """
+    Raised when a seat cannot be claimed because it is taken or out of range.
+    ``conflicts`` maps each offending seat number to its reason.
+    """
+    def __init__(self, message, conflicts=None):
+        super().__init__(message)
+        self.conflicts = conflicts or {}
+
+
+class SeatMap:
+    """
+    Bitmap of occupied seats for a single session, one bit per seat.
+    Bit N stands for seat number N; bit 0 is never used. event_id is the
+    latest SeatEvent of the session when the map was loaded: the map
+    reflects at least every seat change up to it.
+    """
+    __slots__ = ('total_seats', 'bits', 'valid_until', 'event_id')
+
+    def __init__(self, total_seats, valid_until, event_id=0):
+        self.total_seats = total_seats
+        self.bits = bytearray(total_seats // 8 + 1)
+        self.valid_until = valid_until
+        self.event_id = event_id
+
+    def is_valid_seat(self, seat_number):
+        return 1 <= seat_number <= self.total_seats
+
+    def is_taken(self, seat_number):
+        return bool(self.bits[seat_number >> 3] & (1 << (seat_number & 7)))
+
+    def mark(self, seat_number):
+        self.bits[seat_number >> 3] |= 1 << (seat_number & 7)
+
+    def clear(self, seat_number):
+        self.bits[seat_number >> 3] &= ~(1 << (seat_number & 7)) & 0xFF
+
+    @property
+    def taken_count(self):
+        return int.from_bytes(self.bits, 'little').bit_count()
+
+    @property
+    def free_count(self):
+        return self.total_seats - self.taken_count
+
+    def free_seats(self):
+        """
+        Returns the list of free seat numbers in ascending order.
+        Fully occupied bytes are skipped without testing individual bits.
+        """
+        free = []
+        for index, byte in enumerate(self.bits):
+            if byte == 0xFF:
+                continue
+            base = index << 3
+            for bit in range(8):
+                seat = base + bit
+                if not byte & (1 << bit) and 1 <= seat <= self.total_seats:
+                    free.append(seat)
+        return free
+
+
+def _build_seat_map(session, now):
+    """
+    Loads occupied seats for the session from sold tickets and unexpired
+    active bookings. Holds that ran out are left out even before the
+    expiry sweeper deactivates them, and the map is only valid until the
+    first of the loaded holds runs out.
+    """
+    # Read first, so that changes logged while the seats load are newer than it
+    event_id = SeatEvent.objects.filter(session_id=session.pk).order_by('-id').values_list('id', flat=True).first()
+    seat_map = SeatMap(session.total_seats, now + timezone.timedelta(seconds=SEAT_MAP_TTL), event_id or 0)
+    for seat_number in Ticket.objects.filter(session_id=session.pk).values_list('seat_number', flat=True):
+        if seat_map.is_valid_seat(seat_number):
+            seat_map.mark(seat_number)
+    for seat_number, expiry_date in Booking.objects.filter(
+        session_id=session.pk,
+        is_active=True,
+        expiry_date__gt=now
+    ).values_list('seat_number', 'expiry_date'):
+        if seat_map.is_valid_seat(seat_number):
+            seat_map.mark(seat_number)
+        seat_map.valid_until = min(seat_map.valid_until, expiry_date)
+    return seat_map
+
+
+def get_seat_map(session):
+    """
+    Returns the seat map for the session, rebuilding it from the database
+    on a cache miss or once the cached copy is no longer valid.
+    """
+    now = timezone.now()
+    seat_map = _seat_maps.get(session.pk)
+    if seat_map is None or seat_map.valid_until <= now or seat_map.total_seats != session.total_seats:
+        seat_map = _build_seat_map(session, now)
+        with _lock:
+            _seat_maps[session.pk] = seat_map
+            _seat_maps.move_to_end(session.pk)
+            while len(_seat_maps) > SEAT_MAP_CACHE_SIZE:
+                _seat_maps.popitem(last=False)
+    else:
+        with _lock:
+            if session.pk in _seat_maps:
+                _seat_maps.move_to_end(session.pk)
+    return seat_map
+
+
+def invalidate(session_id):
+    """
+    Drops the cached seat map so the next read rebuilds it.
+    """
+    with _lock:
+        _seat_maps.pop(session_id, None)
+
+
+def _set_seats(session_id, seat_numbers, taken):
+    seat_map = _seat_maps.get(session_id)
+    if seat_map is None:
+        return
+    with _lock:
+        for seat_number in seat_numbers:
+            if not seat_map.is_valid_seat(seat_number):
+                continue
+            if taken:
+                seat_map.mark(seat_number)
+            else:
+                seat_map.clear(seat_number)
+
+
+def record_seat_events(session_id, seat_numbers, taken):
+    """
+    Logs seats of a session as taken or released for the live seat streams.
+    Called inside the transaction that changes the seats, so the events
+    become visible together with the change.
+    """
+    kind = SeatEvent.TAKEN if taken else SeatEvent.RELEASED
+    SeatEvent.objects.bulk_create([
+        SeatEvent(session_id=session_id, seat_number=seat_number, kind=kind)
+        for seat_number in seat_numbers
+    ])
+
+
+def prune_seat_events(now=None):
+    """
+    Deletes seat events older than SEAT_EVENT_RETENTION. Returns the number deleted.
+    """
+    now = now or timezone.now()
+    return SeatEvent.objects.filter(created_at__lt=now - SEAT_EVENT_RETENTION).delete()[0]
+
+
+def release_holds(bookings, expired_before=None):
+    """
+    Deactivates the active bookings in the given queryset, decrements the
+    held counters of their sessions and frees the seats in the cached maps.
+    With expired_before, only holds expiring by then are released, so the
+    sweeper never ends a hold that was not due.
+    Returns the number of bookings released.
+    """
+    now = timezone.now()
+    total = 0
+    with transaction.atomic():
+        holds = bookings.filter(is_active=True)
+        if expired_before is not None:
+            holds = holds.filter(expiry_date__lte=expired_before)
+        # The rows are read under the write lock, so they are exactly the ones updated below
+        by_session = defaultdict(dict)
+        for pk, session_id, seat_number in holds.select_for_update().values_list('pk', 'session_id', 'seat_number'):
+            by_session[session_id][pk] = seat_number
+
+        for session_id, seats in by_session.items():
+            released = holds.filter(pk__in=list(seats)).update(is_active=False, updated_at=now)
+            if released:
+                Session.objects.filter(pk=session_id).update(
+                    held_count=F('held_count') - released, updated_at=now
+                )
+                record_seat_events(session_id, seats.values(), False)
+                transaction.on_commit(
+                    lambda session_id=session_id, seats=seats: _set_seats(session_id, seats.values(), False)
+                )
+            total += released
+    return total
+
+
+def expire_holds(batch_size=500, now=None):
+    """
+    Deactivates bookings whose hold has run out, oldest first, in batches
+    of at most batch_size rows. Each batch is picked through the partial
+    index on active bookings' expiry_date and released with release_holds.
+
+    Returns a dict with the number of bookings expired, batches run and
+    seconds spent.
+    """
+    now = now or timezone.now()
+    started = time.monotonic()
+    expired = batches = 0
+    while True:
+        batch = list(Booking.objects.filter(
+            is_active=True,
+            expiry_date__lte=now
+        ).order_by('expiry_date').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        expired += release_holds(Booking.objects.filter(pk__in=batch), expired_before=now)
+        batches += 1
+        if len(batch) < batch_size:
+            break
+    return {
+        'expired': expired,
+        'batches': batches,
+        'seconds': time.monotonic() - started,
+    }
+
+
+def _unavailable(seat_numbers, conflicts):
+    if len(seat_numbers) == 1 and conflicts:
+        return SeatUnavailable(_CONFLICT_MESSAGES[next(iter(conflicts.values()))], conflicts)
+    return SeatUnavailable('Some of the selected seats are not available.', conflicts)
+
+
+def claim_seats(session, user, seat_numbers, action, promo=None, idempotency_key=None):
+    """
+    Claims several seats for the user in one transaction, either as purchased
+    tickets ('buy') or as temporary bookings ('book'). All seats are checked
+    against one occupancy snapshot and inserted with a single bulk_create;
+    if any seat conflicts nothing is written.
+    A user may buy seats they are currently holding, and anyone may buy a
+    seat whose hold has run out.
+    Each seat is priced from the session's price table at the occupancy
+    read under the lock, less the discount of the promo code (a
+    cinema.promos.Promo). A purchase redeems the code in the same
+    transaction; a hold only quotes the discounted price, so the code is
+    still available when the held seats are bought.
+    A checkout repeated with the same idempotency_key returns the objects
+    claimed the first time without claiming anything.
+
+    Returns the created Ticket or Booking objects ordered by seat number.
+
+    Raises:
+        SeatUnavailable: if any seat is out of range or already taken
+        PromoUnavailable: if the promo code has run out or expired meanwhile
+        InvalidCheckoutKey: if the key is malformed or came with another checkout
+    """
+    if action not in ('buy', 'book'):
+        raise ValueError(f"Unknown seat claim action: {action!r}")
+    seat_numbers = sorted(set(seat_numbers))
+    if not seat_numbers:
+        raise SeatUnavailable('No seats selected.')
+    if len(seat_numbers) > MAX_SEATS_PER_CLAIM:
+        raise SeatUnavailable(f'No more than {MAX_SEATS_PER_CLAIM} seats can be claimed at once.')
+    if idempotency_key is not None:
+        idempotency.check_key(idempotency_key)
+        # A retry is answered before the seat map, which already shows its seats as taken
+        replayed = idempotency.replay(idempotency_key, user, session, action, seat_numbers)
+        if replayed is not None:
+            return replayed
+
+    # Fast reject from the bitmap; only a buyer's own holds may still be claimed
+    seat_map = get_seat_map(session)
+    conflicts = {}
+    for seat_number in seat_numbers:
+        if not seat_map.is_valid_seat(seat_number):
+            conflicts[seat_number] = SEAT_INVALID
+        elif action == 'book' and seat_map.is_taken(seat_number):
+            conflicts[seat_number] = SEAT_TAKEN
+    if conflicts:
+        raise _unavailable(seat_numbers, conflicts)
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            # Serialize concurrent claims for the same session
+            locked = Session.objects.select_for_update().only(
+                'id', 'total_seats', 'sold_count', 'held_count'
+            ).get(pk=session.pk)
+            if idempotency_key is not None:
+                # A duplicate submitted at the same time may have committed while this one waited
+                replayed = idempotency.replay(idempotency_key, user, session, action, seat_numbers)
+                if replayed is not None:
+                    return replayed
+            for seat_number in Ticket.objects.filter(
+                session=session,
+                seat_number__in=seat_numbers
+            ).values_list('seat_number', flat=True):
+                conflicts[seat_number] = SEAT_TAKEN
+            own_holds = []
+            for pk, seat_number, holder_id in Booking.objects.filter(
+                session=session,
+                seat_number__in=seat_numbers,
+                is_active=True,
+                expiry_date__gt=now
+            ).values_list('pk', 'seat_number', 'user_id'):
+                if action == 'buy' and holder_id == user.pk:
+                    own_holds.append(pk)
+                else:
+                    conflicts[seat_number] = SEAT_TAKEN
+            if conflicts:
+                raise _unavailable(seat_numbers, conflicts)
+
+            prices = pricing.seat_prices(session, seat_numbers, locked.occupancy_rate)
+            if promo is not None:
+                full_prices = prices
+                prices = {
+                    seat_number: pricing.discounted(price, promo.discount_percent)
+                    for seat_number, price in full_prices.items()
+                }
+                if action == 'buy':
+                    promos.redeem(
+                        promo, user, session, action, prices, sum(full_prices.values()) - sum(prices.values())
+                    )
+            if action == 'buy':
+                # The buyer's own holds end, and so do lapsed holds the sweeper has not
+                # reached yet, which would otherwise later release the sold seats
+                converted = Booking.objects.filter(
+                    Q(pk__in=own_holds) | Q(expiry_date__lte=now),
+                    session=session,
+                    seat_number__in=seat_numbers,
+                    is_active=True
+                ).update(is_active=False, updated_at=now)
+                claimed = Ticket.objects.bulk_create([
+                    Ticket(session=session, user=user, seat_number=seat_number, price=prices[seat_number])
+                    for seat_number in seat_numbers
+                ])
+                Session.objects.filter(pk=session.pk).update(
+                    sold_count=F('sold_count') + len(claimed),
+                    held_count=F('held_count') - converted,
+                    updated_at=now
+                )
+                rollups.record_sales(
+                    session.movie_id,
+                    session.hall_id,
+                    tickets=len(claimed),
+                    revenue=sum(prices.values())
+                )
+                rollups.record_activity(user.pk, tickets=len(claimed), spent=sum(prices.values()))
+            else:
+                # Every hold is a new row, so the booking history (and the rollups
+                # rebuilt from it) survives; lapsed holds the sweeper has not reached
+                # yet end first, as only one active hold per seat is allowed
+                lapsed = Booking.objects.filter(
+                    session=session,
+                    seat_number__in=seat_numbers,
+                    is_active=True,
+                    expiry_date__lte=now
+                ).update(is_active=False, updated_at=now)
+                claimed = Booking.objects.bulk_create([
+                    Booking(
+                        session=session,
+                        user=user,
+                        seat_number=seat_number,
+                        price=prices[seat_number],
+                        expiry_date=now + BOOKING_HOLD
+                    )
+                    for seat_number in seat_numbers
+                ])
+                Session.objects.filter(pk=session.pk).update(
+                    held_count=F('held_count') + len(claimed) - lapsed,
+                    updated_at=now
+                )
+                rollups.record_sales(session.movie_id, session.hall_id, bookings=len(claimed))
+                rollups.record_activity(user.pk, bookings=len(claimed))
+
+            if idempotency_key is not None:
+                idempotency.remember(idempotency_key, user, session, action, seat_numbers, claimed)
+            record_seat_events(session.pk, seat_numbers, True)
+            transaction.on_commit(lambda: _set_seats(session.pk, seat_numbers, True))
+    except IntegrityError:
+        # Lost the race to another request; report whatever the fresh map shows as taken
+        invalidate(session.pk)
+        seat_map = get_seat_map(session)
+        conflicts = {seat: SEAT_TAKEN for seat in seat_numbers if seat_map.is_taken(seat)}
+        raise _unavailable(seat_numbers, conflicts or dict.fromkeys(seat_numbers, SEAT_TAKEN))
+    except SeatUnavailable:
+        invalidate(session.pk)
+        raise
+    return claimed
+
+
+def _count_subquery(queryset):
+    return Coalesce(Subquery(
+        queryset.filter(session=OuterRef('pk')).order_by().values('session').annotate(n=Count('pk')).values('n')
+    ), 0)
+
+
+def reconcile_counters(sessions=None, dry_run=False):
+    """
+    Recomputes sold_count and held_count from tickets and active bookings
+    and fixes the sessions whose counters have drifted.
+    Returns the list of drifted sessions annotated with actual_sold and actual_held.
+    """
+    if sessions is None:
+        sessions = Session.objects.all()
+    drifted = list(sessions.annotate(
+        actual_sold=_count_subquery(Ticket.objects.all()),
+        actual_held=_count_subquery(Booking.objects.filter(is_active=True))
+    ).exclude(
+        sold_count=F('actual_sold'),
+        held_count=F('actual_held')
+    ).order_by('pk'))
+    if not dry_run:
+        for session in drifted:
+            Session.objects.filter(pk=session.pk).update(
+                sold_count=_count_subquery(Ticket.objects.all()),
+                held_count=_count_subquery(Booking.objects.filter(is_active=True)),
+                updated_at=timezone.now()
+            )
+    return drifted
@@ -0,0 +1,254 @@
+"""
+Signal handlers that keep the Session occupancy counters, the daily
+sales and user activity rollups and the seat event log in step with
+tickets and bookings saved or deleted outside cinema.seating (e.g. in the
+admin), and the activity rollup with reviews. The seating service writes with bulk_create and queryset updates,
+which send no signals, and maintains them itself.
+Saving or deleting catalog content also bumps the cinema.caching versions,
+drops this process's cinema.facets index and updates the cinema.search
+index. Pricing rules and hall layouts drop the cinema.pricing tables,
+promo codes the cinema.promos index, and new uploads get their resized
+variants from cinema.images.
+"""
+import logging
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image
+
+from . import caching, facets, images, pricing, promos, rollups, search, seating
+from .models import (
+    Booking, CompanyInfo, FAQ, Genre, Hall, HallLayout, Movie, News, PricingRule, PromoCode, Review, Session, Ticket,
+    User, Vacancy
+)
+
+logger = logging.getLogger(__name__)
+
+CACHED_MODELS = (Movie, Genre, News, FAQ, Review, Session, CompanyInfo, Vacancy)
+
+FACETED_MODELS = (Movie, Genre, Session)
+
+PRICING_MODELS = (PricingRule, HallLayout)
+
+
+def _movie_and_hall(session_id):
+    return Session.objects.filter(pk=session_id).values_list('movie_id', 'hall_id').first()
+
+
+def _deletes_session(origin):
+    """
+    Tells whether a deletion cascades from the session itself, in which case
+    no seat events are logged for a session that is about to disappear.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Session, Movie, Hall)
+
+
+def _deletes_user(origin):
+    """
+    Tells whether a deletion cascades from the user, whose activity rows go with it.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is User
+
+
+def _add_to_counter(session_id, counter, amount):
+    # Stamps updated_at too, which the API's Last-Modified follows
+    Session.objects.filter(pk=session_id).update(**{counter: F(counter) + amount}, updated_at=timezone.now())
+
+
+def _seat_taken(instance):
+    """
+    Returns the (session id, seat number) a ticket or an active booking
+    takes, or None for a booking that no longer holds its seat.
+    """
+    if not getattr(instance, 'is_active', True):
+        return None
+    return instance.session_id, instance.seat_number
+
+
+def _take_seat(instance, counter, taken, seat_events=True):
+    _add_to_counter(instance.session_id, counter, 1 if taken else -1)
+    if seat_events:
+        seating.record_seat_events(instance.session_id, [instance.seat_number], taken)
+
+
+def _record_ticket(ticket, sign, activity=True):
+    """
+    Adds (sign 1) or takes back (sign -1) a ticket's sale in the rollups.
+    """
+    date = timezone.localdate(ticket.purchase_date)
+    session = _movie_and_hall(ticket.session_id)
+    if session is not None:
+        rollups.record_sales(*session, tickets=sign, revenue=sign * ticket.price, date=date)
+    if activity:
+        rollups.record_activity(ticket.user_id, tickets=sign, spent=sign * ticket.price, date=date)
+
+
+def _record_booking(booking, sign):
+    date = timezone.localdate(booking.booking_date)
+    session = _movie_and_hall(booking.session_id)
+    if session is not None:
+        rollups.record_sales(*session, bookings=sign, date=date)
+    rollups.record_activity(booking.user_id, bookings=sign, date=date)
+
+
+@receiver(pre_save, sender=Ticket)
+@receiver(pre_save, sender=Booking)
+def seat_claim_saving(sender, instance, **kwargs):
+    # An edit may move the row to another session, seat, user or state; remember the stored row
+    instance._stored = None if instance._state.adding else sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_saved(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored', None)
+    if created:
+        _take_seat(instance, 'sold_count', True)
+        _record_ticket(instance, 1)
+        return
+    if stored is None:
+        return
+    if _seat_taken(stored) != _seat_taken(instance):
+        _take_seat(stored, 'sold_count', False)
+        _take_seat(instance, 'sold_count', True)
+    sale = ('session_id', 'user_id', 'price', 'purchase_date')
+    if any(getattr(stored, field) != getattr(instance, field) for field in sale):
+        _record_ticket(stored, -1)
+        _record_ticket(instance, 1)
+
+
+@receiver(post_delete, sender=Ticket)
+def ticket_deleted(sender, instance, **kwargs):
+    origin = kwargs.get('origin')
+    _take_seat(instance, 'sold_count', False, seat_events=not _deletes_session(origin))
+    _record_ticket(instance, -1, activity=not _deletes_user(origin))
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored', None)
+    if created:
+        _record_booking(instance, 1)
+        if instance.is_active:
+            _take_seat(instance, 'held_count', True)
+        return
+    if stored is None:
+        return
+    if _seat_taken(stored) != _seat_taken(instance):
+        if stored.is_active:
+            _take_seat(stored, 'held_count', False)
+        if instance.is_active:
+            _take_seat(instance, 'held_count', True)
+    if any(getattr(stored, field) != getattr(instance, field) for field in ('session_id', 'user_id', 'booking_date')):
+        _record_booking(stored, -1)
+        _record_booking(instance, 1)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    if instance.is_active:
+        _take_seat(instance, 'held_count', False, seat_events=not _deletes_session(kwargs.get('origin')))
+
+
+@receiver(post_save, sender=Review)
+def review_created(sender, instance, created, **kwargs):
+    if created:
+        rollups.record_activity(instance.user_id, reviews=1, date=timezone.localdate(instance.created_at))
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    if not _deletes_user(kwargs.get('origin')):
+        rollups.record_activity(instance.user_id, reviews=-1, date=timezone.localdate(instance.created_at))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def catalog_changed(sender, **kwargs):
+    if sender in CACHED_MODELS:
+        caching.bump(sender)
+    if sender in FACETED_MODELS:
+        facets.invalidate()
+    if sender in PRICING_MODELS:
+        caching.bump(sender)
+        pricing.invalidate()
+    if sender is PromoCode:
+        caching.bump(sender)
+        promos.invalidate()
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def movie_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # Cleared from the genre side: remember the movies before the links go
+        instance._search_movie_ids = list(instance.movies.values_list('pk', flat=True))
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        caching.bump(Movie)
+        facets.invalidate()
+        if not reverse:
+            search.index(instance)
+        else:
+            _reindex_movies(pk_set if pk_set is not None else instance._search_movie_ids)
+
+
+def _reindex_movies(movie_ids):
+    for movie in Movie.objects.filter(pk__in=movie_ids).prefetch_related('genres'):
+        search.index(movie)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=News)
+@receiver(post_save, sender=Review)
+def searchable_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index(instance)
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=News)
+@receiver(post_delete, sender=Review)
+def searchable_deleted(sender, instance, **kwargs):
+    search.remove(sender, instance.pk)
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved(sender, instance, created, **kwargs):
+    if not created:
+        _reindex_movies(instance.movies.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+def genre_deleting(sender, instance, **kwargs):
+    instance._search_movie_ids = list(instance.movies.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def genre_deleted(sender, instance, **kwargs):
+    _reindex_movies(instance._search_movie_ids)
+
+
+def _refresh_variants(instance, image_field, manifest_field):
+    try:
+        if images.refresh_variants(instance, image_field, manifest_field):
+            caching.bump(type(instance))
+    except Image.DecompressionBombError as error:
+        # Decoding would take more memory than any poster should; keep the original only
+        logger.warning('Skipped image variants for %r: %s', instance, error)
+    except (OSError, ValueError):
+        logger.exception('Could not generate image variants for %r', instance)
+
+
+@receiver(post_save)
+def image_uploaded(sender, instance, raw=False, **kwargs):
+    for model, image_field, manifest_field in images.IMAGE_FIELDS:
+        if sender is not model or raw:
+            continue
+        field_file = getattr(instance, image_field)
+        manifest = getattr(instance, manifest_field) or {}
+        if (field_file.name or None) != manifest.get('source'):
+            transaction.on_commit(partial(_refresh_variants, instance, image_field, manifest_field))
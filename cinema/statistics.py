@@ -0,0 +1,147 @@
+"""
+Statistics querysets shared by the staff dashboards and the data exports.
+Every per-row figure is a correlated subquery, so joins never multiply
+rows, or comes from the daily rollups.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Avg, Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Booking, DailySalesRollup, DailyUserActivity, Movie, Review, Session, Ticket, User
+
+
+def date_range(start_date=None, end_date=None, days=30):
+    """
+    Returns the aware datetimes bounding the local days from start_date to
+    end_date inclusive, both given as YYYY-MM-DD. end_date defaults to today
+    in the current time zone and start_date to the given number of days before.
+
+    Raises:
+        ValueError: if a date is not YYYY-MM-DD
+    """
+    today = timezone.localdate()
+    first = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else today - timedelta(days=days)
+    last = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
+    return (
+        timezone.make_aware(datetime.combine(first, time.min)),
+        timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min))
+    )
+
+
+def per_user(queryset, aggregate, default=0):
+    """
+    Returns a subquery expression aggregating the queryset for the outer user.
+    """
+    return Coalesce(Subquery(
+        queryset.filter(user=OuterRef('pk')).order_by().values('user').annotate(value=aggregate).values('value')
+    ), Value(default))
+
+
+def rolled_up_activity(start_date, end_date):
+    """
+    One row per user active in the range, with ticket_count, total_spent,
+    booking_count, review_count and their sum actions, from the daily
+    activity rollup rather than the ticket, booking and review history.
+    """
+    return DailyUserActivity.objects.filter(
+        date__range=[start_date.date(), (end_date - timedelta(days=1)).date()]
+    ).values('user').annotate(
+        ticket_count=Sum('tickets'),
+        total_spent=Sum('spent'),
+        booking_count=Sum('bookings'),
+        review_count=Sum('reviews')
+    ).annotate(
+        actions=F('ticket_count') + F('booking_count') + F('review_count')
+    ).filter(actions__gt=0)
+
+
+class RankedUsers:
+    """
+    Every user, for a Paginator: first the users active in the range in
+    the order of their rolled-up figures, then the others by id. Slicing
+    loads the users of that slice only, with the figures set on them.
+    """
+    FIGURES = ('ticket_count', 'total_spent', 'booking_count', 'review_count', 'actions')
+
+    def __init__(self, activity, active_count, total_users):
+        self.activity = activity
+        self.active_count = active_count
+        self.total_users = total_users
+
+    def __len__(self):
+        return self.total_users
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, min(index.stop, self.total_users)
+        rows = list(self.activity[start:min(stop, self.active_count)]) if start < self.active_count else []
+        users = User.objects.in_bulk([row['user'] for row in rows])
+        page = []
+        for row in rows:
+            user = users[row['user']]
+            for figure in self.FIGURES:
+                setattr(user, figure, row[figure])
+            page.append(user)
+        if stop > self.active_count:
+            others = User.objects.exclude(pk__in=self.activity.values('user')).order_by('pk')
+            for user in others[max(start - self.active_count, 0):stop - self.active_count]:
+                for figure in self.FIGURES:
+                    setattr(user, figure, Decimal('0') if figure == 'total_spent' else 0)
+                page.append(user)
+        return page
+
+
+def movie_statistics(start_date, end_date):
+    """
+    Movies with tickets sold, revenue, active bookings and average rating.
+    Sales come from the daily rollup, so their cost depends on the range only.
+    """
+    movie_sales = DailySalesRollup.objects.filter(
+        date__range=[start_date.date(), (end_date - timedelta(days=1)).date()],
+        movie=OuterRef('pk')
+    ).order_by().values('movie')
+    return Movie.objects.annotate(
+        tickets_sold=Coalesce(Subquery(movie_sales.annotate(n=Sum('tickets')).values('n')), 0),
+        revenue=Subquery(movie_sales.annotate(total=Sum('revenue')).values('total')),
+        active_bookings=Coalesce(Subquery(
+            Booking.objects.filter(
+                session__movie=OuterRef('pk'),
+                booking_date__range=[start_date, end_date],
+                is_active=True
+            ).order_by().values('session__movie').annotate(n=Count('id')).values('n')
+        ), 0),
+        avg_rating=Subquery(
+            Review.objects.filter(movie=OuterRef('pk')).order_by().values('movie').annotate(
+                avg=Avg('rating')
+            ).values('avg')
+        )
+    ).order_by('-tickets_sold', 'pk')
+
+
+def session_statistics(start_date, end_date):
+    """
+    Sessions starting in the range. Occupancy comes from the per-session
+    counters, so no aggregation is needed.
+    """
+    return Session.objects.filter(
+        start_time__range=[start_date, end_date]
+    ).select_related('movie', 'hall').order_by('start_time', 'pk')
+
+
+def user_activity(start_date, end_date):
+    """
+    Users who bought, held or reviewed anything in the range, with their figures.
+    """
+    tickets = Ticket.objects.filter(purchase_date__range=[start_date, end_date])
+    return User.objects.annotate(
+        tickets_bought=per_user(tickets, Count('id')),
+        active_bookings=per_user(
+            Booking.objects.filter(booking_date__range=[start_date, end_date], is_active=True), Count('id')
+        ),
+        total_spent=per_user(tickets, Sum('price'), Decimal('0')),
+        reviews_count=per_user(Review.objects.filter(created_at__range=[start_date, end_date]), Count('id'))
+    ).filter(
+        Q(tickets_bought__gt=0) | Q(active_bookings__gt=0) | Q(reviews_count__gt=0)
+    ).order_by('-tickets_bought', 'pk')
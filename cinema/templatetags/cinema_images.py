@@ -0,0 +1,44 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+def _srcset(storage, sizes):
+    return ', '.join(
+        f'{storage.url(name)} {width}w'
+        for width, name in sorted(sizes.items(), key=lambda item: int(item[0]))
+    )
+
+
+@register.simple_tag
+def responsive_image(field_file, manifest, sizes='100vw', **attrs):
+    """
+    Renders a <picture> with WebP and JPEG srcsets from an image variant
+    manifest (see cinema.images), falling back to the original file while
+    the variants have not been generated yet.
+    Usage: {% responsive_image movie.poster movie.poster_variants sizes="33vw" alt=movie.title class="card-img-top" %}
+    """
+    if not field_file:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    if not manifest or manifest.get('source') != field_file.name:
+        return format_html('<img src="{}"{}>', field_file.url, flatatt(attrs))
+
+    storage = field_file.storage
+    variants = manifest['variants']
+    jpeg = variants['jpeg']
+    largest = jpeg[max(jpeg, key=int)]
+    attrs.update({
+        'srcset': _srcset(storage, jpeg),
+        'sizes': sizes,
+        'width': manifest['width'],
+        'height': manifest['height'],
+    })
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((name, _srcset(storage, widths), sizes) for name, widths in variants.items() if name != 'jpeg')
+    )
+    return format_html('<picture>{}<img src="{}"{}></picture>', sources, storage.url(largest), flatatt(attrs))
@@ -1,3 +1,1784 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, F
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    exports, facets, idempotency, layouts, live, loadtest, pagination, pricing, profiling, promos, rollups, scheduling,
+    search, seating, statistics
+)
+from .forms import PromoCodeForm
+from .models import (
+    Booking, CheckoutKey, DailySalesRollup, DailyUserActivity, FAQ, Genre, Hall, HallLayout, Movie, News, PricingRule,
+    PromoCode, PromoRedemption, Review, SeatEvent, Session, Ticket, User
+)
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class CinemaDataMixin:
+    """
+    Creates a small catalog with sessions, tickets and bookings shared by the tests.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.user = User.objects.create_user('viewer', password='secret')
+        cls.staff = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        cls.hall = Hall.objects.create(name='Hall 1', capacity=50)
+        cls.movies = [
+            Movie.objects.create(
+                title=f'Movie {i}',
+                country='Беларусь',
+                duration=90 + i,
+                budget=1000,
+                description='Description',
+                rating=7,
+                release_date=now + timezone.timedelta(days=i - 2)
+            )
+            for i in range(4)
+        ]
+        cls.sessions = [
+            Session.objects.create(
+                movie=movie,
+                hall=cls.hall,
+                start_time=now + timezone.timedelta(days=1, hours=i),
+                price=10,
+                total_seats=50
+            )
+            for i, movie in enumerate(cls.movies)
+        ]
+        for i, session in enumerate(cls.sessions):
+            Ticket.objects.create(session=session, user=cls.user, seat_number=i + 1, price=10)
+            Booking.objects.create(
+                session=session,
+                user=cls.user,
+                seat_number=i + 20,
+                price=10,
+                expiry_date=now + timezone.timedelta(minutes=15)
+            )
+        Review.objects.create(movie=cls.movies[0], user=cls.user, rating=9, text='Great')
+        for i in range(3):
+            News.objects.create(title=f'News {i}', content='Content')
+
+
+class SeatClaimTests(CinemaDataMixin, TestCase):
+    """
+    Checks the seat bitmap and that a seat can only be claimed once.
+    """
+    def setUp(self):
+        self.session = self.sessions[0]
+        seating.invalidate(self.session.pk)
+        self.addCleanup(seating.invalidate, self.session.pk)
+
+    def test_seat_map(self):
+        seat_map = seating.get_seat_map(self.session)
+        self.assertEqual((seat_map.taken_count, seat_map.free_count), (2, 48))
+        self.assertEqual(seat_map.free_seats(), [seat for seat in range(1, 51) if seat not in (1, 20)])
+        self.assertFalse(seat_map.is_valid_seat(0) or seat_map.is_valid_seat(51))
+        seat_map.mark(16)
+        seat_map.clear(20)
+        self.assertEqual((seat_map.is_taken(16), seat_map.is_taken(20)), (True, False))
+        with self.assertNumQueries(0):
+            self.assertIs(seating.get_seat_map(self.session), seat_map)
+
+    def test_cache_bounded(self):
+        for session in self.sessions:
+            seating.invalidate(session.pk)
+            self.addCleanup(seating.invalidate, session.pk)
+        with mock.patch.object(seating, 'SEAT_MAP_CACHE_SIZE', 2):
+            first, second, third = (seating.get_seat_map(session) for session in self.sessions[:3])
+            # The least recently used map is dropped
+            self.assertIs(seating.get_seat_map(self.sessions[2]), third)
+            with self.assertNumQueries(0):
+                self.assertIs(seating.get_seat_map(self.sessions[1]), second)
+            self.assertIsNot(seating.get_seat_map(self.sessions[0]), first)
+            self.assertIsNot(seating.get_seat_map(self.sessions[2]), third)
+
+    def test_double_claim(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket, = seating.claim_seats(self.session, self.user, [30], 'buy')
+        self.assertEqual((ticket.seat_number, ticket.user), (30, self.user))
+        self.assertTrue(seating.get_seat_map(self.session).is_taken(30))
+        for action in ('buy', 'book'):
+            with self.subTest(action=action), self.assertRaises(seating.SeatUnavailable) as raised:
+                seating.claim_seats(self.session, self.staff, [30], action)
+            self.assertEqual(raised.exception.conflicts, {30: seating.SEAT_TAKEN})
+        # A stale seat map does not let a second claim through: the database check still refuses it
+        seating.get_seat_map(self.session).clear(30)
+        with self.assertRaises(seating.SeatUnavailable):
+            seating.claim_seats(self.session, self.staff, [30], 'buy')
+        self.assertEqual(Ticket.objects.filter(session=self.session, seat_number=30).count(), 1)
+
+        with self.assertRaises(seating.SeatUnavailable) as raised:
+            seating.claim_seats(self.session, self.user, [51], 'buy')
+        self.assertEqual(raised.exception.conflicts, {51: seating.SEAT_INVALID})
+
+    def test_buy_own_hold(self):
+        seating.claim_seats(self.session, self.user, [31], 'book')
+        with self.assertRaises(seating.SeatUnavailable):
+            seating.claim_seats(self.session, self.staff, [31], 'buy')
+        seating.claim_seats(self.session, self.user, [31], 'buy')
+        self.assertFalse(Booking.objects.filter(session=self.session, seat_number=31, is_active=True).exists())
+        self.assertTrue(Ticket.objects.filter(session=self.session, seat_number=31, user=self.user).exists())
+
+
+class CheckoutTests(CinemaDataMixin, TestCase):
+    """
+    Checks that multi-seat checkouts claim all seats or none.
+    """
+    def setUp(self):
+        self.session = self.sessions[1]
+        seating.invalidate(self.session.pk)
+        self.addCleanup(seating.invalidate, self.session.pk)
+        self.url = reverse('cinema:checkout', args=[self.session.pk])
+        self.client.force_login(self.staff)
+
+    def checkout(self, action, seats):
+        return self.client.post(self.url, {'action': action, 'seats': seats}, content_type='application/json')
+
+    def test_all_or_nothing(self):
+        # Seat 2 is sold and seat 21 held by the fixture
+        for action, taken in (('buy', 2), ('book', 21)):
+            with self.subTest(action=action):
+                response = self.checkout(action, [35, taken, 36])
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.json()['seats'], [
+                    {'seat': taken, 'status': 'taken'},
+                    {'seat': 35, 'status': 'rolled_back'},
+                    {'seat': 36, 'status': 'rolled_back'},
+                ])
+        self.assertFalse(Ticket.objects.filter(session=self.session, seat_number__in=[35, 36]).exists())
+        self.assertFalse(Booking.objects.filter(session=self.session, seat_number__in=[35, 36]).exists())
+
+        response = self.checkout('buy', [36, 35])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([(seat['seat'], seat['status']) for seat in response.json()['seats']], [(35, 'claimed'), (36, 'claimed')])
+        self.assertEqual(Ticket.objects.filter(session=self.session, seat_number__in=[35, 36], user=self.staff).count(), 2)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.checkout('steal', [35]).status_code, 400)
+        self.assertEqual(self.checkout('buy', ['A1']).status_code, 400)
+        self.assertEqual(self.checkout('buy', []).status_code, 400)
+        response = self.checkout('buy', list(range(30, 31 + seating.MAX_SEATS_PER_CLAIM)))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_form_mode(self):
+        url = reverse('cinema:buy_ticket', args=[self.session.pk])
+        response = self.client.post(url, {'action': 'book', 'seat_numbers': ['37', '38']})
+        self.assertRedirects(response, reverse('cinema:booking_list'))
+        self.assertEqual(Booking.objects.filter(session=self.session, seat_number__in=[37, 38], is_active=True).count(), 2)
+        response = self.client.post(url, {'action': 'buy', 'seat_numbers': ['39', '2']}, follow=True)
+        self.assertContains(response, 'Some of the selected seats are not available.')
+        self.assertFalse(Ticket.objects.filter(session=self.session, seat_number=39).exists())
+
+
+class OccupancyCounterTests(CinemaDataMixin, TestCase):
+    """
+    Checks the sold and held counters kept on Session.
+    """
+    def setUp(self):
+        self.session = self.sessions[3]
+        seating.invalidate(self.session.pk)
+        self.addCleanup(seating.invalidate, self.session.pk)
+
+    def assertCounters(self, sold, held):
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.sold_count, self.session.held_count), (sold, held))
+        self.assertEqual(self.session.available_seats, self.session.total_seats - sold - held)
+
+    def test_buy_book_cancel(self):
+        self.assertCounters(1, 1)
+        bookings = seating.claim_seats(self.session, self.user, [40, 41, 42], 'book')
+        self.assertCounters(1, 4)
+        self.assertEqual(self.session.occupancy_rate, 10)
+        seating.claim_seats(self.session, self.user, [40, 43], 'buy')
+        self.assertCounters(3, 3)
+
+        self.client.force_login(self.user)
+        self.client.get(reverse('cinema:cancel_booking', args=[bookings[1].pk]))
+        self.assertCounters(3, 2)
+        # Cancelling twice changes nothing, and a freed seat can be held again
+        self.client.get(reverse('cinema:cancel_booking', args=[bookings[1].pk]))
+        self.assertCounters(3, 2)
+        seating.claim_seats(self.session, self.staff, [41], 'book')
+        self.assertCounters(3, 3)
+        self.assertFalse(seating.reconcile_counters(Session.objects.filter(pk=self.session.pk)))
+
+    def test_available_seats(self):
+        # Counted against the session's own seats (its hall layout), not the hall capacity
+        Session.objects.filter(pk=self.session.pk).update(total_seats=40)
+        self.assertCounters(1, 1)
+        self.assertEqual(self.session.available_seats, 38)
+        Session.objects.filter(pk=self.session.pk).update(sold_count=45)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.available_seats, 0)
+        cache.clear()
+        response = self.client.get(reverse('cinema:movie_detail', args=[self.session.movie_id]))
+        self.assertContains(response, 'Доступно мест:</strong> 0 из 40')
+
+    def assertReconciled(self, *sessions):
+        self.assertFalse(seating.reconcile_counters(Session.objects.filter(pk__in=[s.pk for s in sessions])))
+
+    def test_ticket_moved(self):
+        other = self.sessions[2]
+        ticket = Ticket.objects.get(session=self.session)
+        ticket.session = other
+        ticket.seat_number = 45
+        ticket.save()
+        self.assertCounters(0, 1)
+        other.refresh_from_db()
+        self.assertEqual(other.sold_count, 2)
+        self.assertReconciled(self.session, other)
+
+    def test_booking_deactivated(self):
+        booking = Booking.objects.get(session=self.session)
+        booking.is_active = False
+        booking.save()
+        self.assertCounters(1, 0)
+        # Saving again without a change leaves the counters alone
+        booking.save()
+        self.assertCounters(1, 0)
+        booking.is_active = True
+        booking.save()
+        self.assertCounters(1, 1)
+        self.assertReconciled(self.session)
+
+    def test_booking_moved(self):
+        other = self.sessions[2]
+        booking = Booking.objects.get(session=self.session)
+        booking.session = other
+        booking.seat_number = 45
+        booking.save()
+        self.assertCounters(1, 0)
+        other.refresh_from_db()
+        self.assertEqual(other.held_count, 2)
+        self.assertReconciled(self.session, other)
+
+    def test_counters_stamp_updated_at(self):
+        for change in (
+            lambda: seating.claim_seats(self.session, self.user, [40], 'book'),
+            lambda: seating.release_holds(Booking.objects.filter(session=self.session, seat_number=40)),
+            lambda: Ticket.objects.create(session=self.session, user=self.user, seat_number=41, price=10),
+        ):
+            self.session.refresh_from_db()
+            stamped = self.session.updated_at
+            change()
+            self.session.refresh_from_db()
+            self.assertGreater(self.session.updated_at, stamped)
+
+    def test_reconcile(self):
+        Session.objects.filter(pk=self.session.pk).update(sold_count=7, held_count=0)
+        output = StringIO()
+        call_command('reconcile_occupancy', '--dry-run', stdout=output)
+        self.assertIn(f'Session {self.session.pk}: sold 7 -> 1, held 0 -> 1', output.getvalue())
+        self.assertCounters(7, 0)
+        call_command('reconcile_occupancy', '--session', str(self.session.pk), stdout=StringIO())
+        self.assertCounters(1, 1)
+
+
+class HoldExpiryTests(CinemaDataMixin, TestCase):
+    """
+    Checks that the expiry sweeper releases exactly the holds that have run out.
+    """
+    def setUp(self):
+        self.session = self.sessions[0]
+        seating.invalidate(self.session.pk)
+        self.addCleanup(seating.invalidate, self.session.pk)
+        self.now = timezone.now()
+        self.expired = Booking.objects.get(session=self.session, seat_number=20)
+        Booking.objects.filter(pk=self.expired.pk).update(expiry_date=self.now - timezone.timedelta(minutes=1))
+
+    def released_seats(self):
+        return list(SeatEvent.objects.filter(
+            session=self.session, kind=SeatEvent.RELEASED
+        ).values_list('seat_number', flat=True))
+
+    def test_expire_holds(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seating.claim_seats(self.session, self.staff, [40, 41], 'book')
+        active = set(Booking.objects.filter(is_active=True).values_list('pk', flat=True)) - {self.expired.pk}
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = seating.expire_holds(batch_size=1, now=self.now)
+        self.assertEqual((stats['expired'], stats['batches']), (1, 1))
+        self.assertEqual(set(Booking.objects.filter(is_active=True).values_list('pk', flat=True)), active)
+        self.assertEqual(self.released_seats(), [20])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.held_count, 2)
+        seat_map = seating.get_seat_map(self.session)
+        self.assertEqual((seat_map.is_taken(20), seat_map.is_taken(40)), (False, True))
+        self.assertEqual(seating.expire_holds(now=self.now)['expired'], 0)
+
+    def test_renewed_hold_kept(self):
+        # Picked by a sweep, then replaced by a new hold (claimed through a
+        # worker whose seat map still shows the seat free) before the update
+        batch = Booking.objects.filter(pk=self.expired.pk)
+        seating.get_seat_map(self.session).clear(20)
+        renewed, = seating.claim_seats(self.session, self.staff, [20], 'book')
+        self.assertEqual(seating.release_holds(batch, expired_before=self.now), 0)
+        self.expired.refresh_from_db()
+        self.assertFalse(self.expired.is_active)
+        self.assertNotEqual(renewed.pk, self.expired.pk)
+        self.assertEqual(
+            list(Booking.objects.filter(session=self.session, seat_number=20, is_active=True).values_list('user')),
+            [(self.staff.pk,)]
+        )
+        self.assertEqual(self.released_seats(), [])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.held_count, 1)
+
+    def test_lapsed_hold_hidden_before_sweep(self):
+        seat_map = seating.get_seat_map(self.session)
+        self.assertFalse(seat_map.is_taken(20))
+        hold, = seating.claim_seats(self.session, self.staff, [40], 'book')
+        lapses = timezone.now() + timezone.timedelta(seconds=1)
+        Booking.objects.filter(pk=hold.pk).update(expiry_date=lapses)
+        seating.invalidate(self.session.pk)
+        # The map is rebuilt once the hold it shows runs out
+        self.assertEqual(seating.get_seat_map(self.session).valid_until, lapses)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('cinema:booking_list'))
+        self.assertNotIn(self.expired, response.context['active_bookings'])
+        self.assertEqual(len(response.context['active_bookings']), len(self.sessions) - 1)
+
+    def test_command(self):
+        output = StringIO()
+        call_command('expire_bookings', stdout=output)
+        self.assertIn('Expired 1 booking(s)', output.getvalue())
+        self.expired.refresh_from_db()
+        self.assertFalse(self.expired.is_active)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Relies on SQLite EXPLAIN QUERY PLAN output')
+@override_settings(CACHES=NO_CACHE)
+class QueryPlanTests(CinemaDataMixin, TestCase):
+    """
+    Checks that the hot view queries are answered from indexes rather than table scans.
+    """
+    full_scan = re.compile(r'^SCAN (\w+)$')
+
+    def assertIndexed(self, url, tables):
+        """
+        Requests the page and runs EXPLAIN QUERY PLAN on every SELECT it issued,
+        failing if any of the given tables is read with a full table scan.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        seen = set()
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    scan = self.full_scan.match(detail)
+                    self.assertFalse(
+                        scan and scan.group(1) in tables,
+                        f'Full table scan in {url}: {detail}\n{query["sql"]}'
+                    )
+                    seen.update(table for table in tables if table in detail)
+        self.assertEqual(seen, set(tables), f'{url} did not query all of {tables}')
+
+    def test_home(self):
+        self.assertIndexed(reverse('cinema:home'), ['cinema_movie', 'cinema_news'])
+
+    def test_news_list(self):
+        self.assertIndexed(reverse('cinema:news_list'), ['cinema_news'])
+
+    def test_session_list(self):
+        self.assertIndexed(reverse('cinema:session_list'), ['cinema_session'])
+
+    def test_movie_detail_sessions(self):
+        self.assertIndexed(reverse('cinema:movie_detail', args=[self.movies[0].pk]), ['cinema_session'])
+
+    def test_ticket_list(self):
+        self.client.force_login(self.user)
+        self.assertIndexed(reverse('cinema:ticket_list'), ['cinema_ticket'])
+
+    def test_booking_list(self):
+        self.client.force_login(self.user)
+        self.assertIndexed(reverse('cinema:booking_list'), ['cinema_booking'])
+
+    def test_buy_ticket_seat_map(self):
+        self.client.force_login(self.user)
+        self.assertIndexed(
+            reverse('cinema:buy_ticket', args=[self.sessions[0].pk]),
+            ['cinema_ticket', 'cinema_booking']
+        )
+
+    def test_review_list_cursor(self):
+        first = self.client.get(reverse('cinema:review_feed')).json()['results'][0]
+        cursor = pagination.encode_cursor([first['created_at'], first['id']])
+        self.assertIndexed(f"{reverse('cinema:review_list')}?after={cursor}", ['cinema_review'])
+
+    def test_admin_statistics_rollup_range(self):
+        self.client.force_login(self.staff)
+        self.assertIndexed(reverse('cinema:admin_statistics'), ['cinema_dailysalesrollup'])
+
+
+@override_settings(CACHES=NO_CACHE)
+class QueryCountTests(CinemaDataMixin, TestCase):
+    """
+    Checks that listing pages issue the same number of queries however many rows they show.
+    """
+    def add_rows(self):
+        """
+        Adds another movie with a genre, sessions, tickets, bookings and reviews.
+        """
+        now = timezone.now()
+        genre = Genre.objects.create(name=f'Genre {Genre.objects.count()}')
+        movie = Movie.objects.create(
+            title='Extra movie',
+            country='Беларусь',
+            duration=100,
+            budget=1000,
+            description='Description',
+            rating=8,
+            release_date=now + timezone.timedelta(days=3)
+        )
+        movie.genres.add(genre)
+        self.movies[0].genres.add(genre)
+        hall = Hall.objects.create(name='Extra hall', capacity=30)
+        for target in (movie, self.movies[0]):
+            session = Session.objects.create(
+                movie=target,
+                hall=hall,
+                start_time=now + timezone.timedelta(days=2),
+                price=12,
+                total_seats=30
+            )
+            Ticket.objects.create(session=session, user=self.user, seat_number=1, price=12)
+            Booking.objects.create(
+                session=session,
+                user=self.user,
+                seat_number=2,
+                price=12,
+                expiry_date=now + timezone.timedelta(minutes=15)
+            )
+            reviewer = User.objects.create_user(f'reviewer{session.pk}', password='secret')
+            Review.objects.create(movie=target, user=reviewer, rating=8, text='Good')
+        News.objects.create(title='Extra news', content='Content')
+
+    def assertConstantQueries(self, url, user=None):
+        """
+        Renders the page before and after adding rows and compares the query counts.
+        """
+        if user is not None:
+            self.client.force_login(user)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        self.add_rows()
+        # The new rows invalidated the facet index, which is rebuilt once per change, not per request
+        facets.get_index()
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(before), len(after),
+            f'{url} went from {len(before)} to {len(after)} queries:\n'
+            + '\n'.join(query['sql'] for query in after.captured_queries)
+        )
+
+    def test_home(self):
+        self.assertConstantQueries(reverse('cinema:home'))
+
+    def test_movie_list(self):
+        self.assertConstantQueries(reverse('cinema:movie_list'))
+
+    def test_movie_detail(self):
+        self.assertConstantQueries(reverse('cinema:movie_detail', args=[self.movies[0].pk]))
+
+    def test_session_list(self):
+        self.assertConstantQueries(reverse('cinema:session_list'))
+
+    def test_news_list(self):
+        self.assertConstantQueries(reverse('cinema:news_list'))
+
+    def test_review_list(self):
+        self.assertConstantQueries(reverse('cinema:review_list'))
+
+    def test_ticket_list(self):
+        self.assertConstantQueries(reverse('cinema:ticket_list'), self.user)
+
+    def test_booking_list(self):
+        self.assertConstantQueries(reverse('cinema:booking_list'), self.user)
+
+    def test_admin_dashboard(self):
+        self.assertConstantQueries(reverse('cinema:admin_dashboard'), self.staff)
+
+    def test_admin_changelists(self):
+        for model in ('ticket', 'booking', 'review'):
+            with self.subTest(model=model):
+                self.assertConstantQueries(reverse(f'admin:cinema_{model}_changelist'), self.admin)
+
+
+class SalesRollupTests(CinemaDataMixin, TestCase):
+    """
+    Checks that the incrementally maintained rollup matches a full rebuild.
+    """
+    def snapshot(self):
+        return sorted(DailySalesRollup.objects.values_list('date', 'movie', 'hall', 'tickets', 'revenue', 'bookings'))
+
+    def test_incremental_matches_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seating.claim_seats(self.sessions[1], self.user, [30, 31], 'buy')
+            seating.claim_seats(self.sessions[2], self.user, [32], 'book')
+        Ticket.objects.filter(session=self.sessions[3]).delete()
+        incremental = (self.snapshot(), self.activity())
+        rollups.rebuild()
+        self.assertEqual(incremental, (self.snapshot(), self.activity()))
+
+    def activity(self):
+        return sorted(DailyUserActivity.objects.values_list('date', 'user', 'tickets', 'spent', 'bookings'))
+
+    def test_rebuild_after_seat_held_again(self):
+        session = self.sessions[2]
+        self.addCleanup(seating.invalidate, session.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking, = seating.claim_seats(session, self.user, [33], 'book')
+        seating.release_holds(Booking.objects.filter(pk=booking.pk))
+        # The seat is held again the next day by another user
+        tomorrow = timezone.now() + timezone.timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=tomorrow):
+            with self.captureOnCommitCallbacks(execute=True):
+                seating.claim_seats(session, self.staff, [33], 'book')
+        booking.refresh_from_db()
+        self.assertEqual((booking.user, booking.is_active), (self.user, False))
+        incremental = (self.snapshot(), self.activity())
+        rollups.rebuild()
+        self.assertEqual(incremental, (self.snapshot(), self.activity()))
+
+    def test_dashboard_totals(self):
+        self.client.force_login(self.staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            seating.claim_seats(self.sessions[1], self.user, [30], 'buy')
+        self.addCleanup(seating.invalidate, self.sessions[1].pk)
+        response = self.client.get(reverse('cinema:admin_dashboard'))
+        self.assertEqual(response.context['total_tickets'], Ticket.objects.count())
+        self.assertEqual(
+            [(row['user__username'], row['ticket_count']) for row in response.context['active_users']],
+            [
+                (username, count) for username, count in User.objects.annotate(count=Count('tickets'))
+                .filter(count__gt=0).order_by('-count').values_list('username', 'count')
+            ][:5]
+        )
+
+
+class UserStatisticsTests(CinemaDataMixin, TestCase):
+    """
+    Checks the user statistics figures and that the page cost does not grow with the user count.
+    """
+    def test_figures(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('cinema:user_statistics'), {'sort_by': 'spent'})
+        self.assertEqual(response.status_code, 200)
+        top = response.context['users'][0]
+        self.assertEqual((top, top.ticket_count, top.booking_count, top.review_count), (self.user, 4, 4, 1))
+        self.assertEqual(top.activity_percentage, 100)
+        self.assertEqual(response.context['avg_activity'], round(9 / 3, 1))
+        self.assertEqual(response.context['conversion_rate'], round(100 / 3, 1))
+
+    def test_constant_queries(self):
+        self.client.force_login(self.staff)
+        url = reverse('cinema:user_statistics')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        User.objects.bulk_create(User(username=f'extra{i}') for i in range(60))
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(len(before), len(after))
+        # The active user leads, the others follow by id
+        users = list(response.context['users'])
+        self.assertEqual(users[:2], [self.user, self.staff])
+        self.assertEqual((users[1].ticket_count, users[1].activity_percentage), (0, 0))
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(len(response.context['users']), 13)
+
+    def test_figures_from_rollup(self):
+        # The page reads the rollup, not the ticket history
+        DailyUserActivity.objects.filter(user=self.user).update(tickets=F('tickets') + 5)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('cinema:user_statistics'))
+        self.assertEqual(response.context['users'][0].ticket_count, 9)
+        rollups.rebuild()
+        response = self.client.get(reverse('cinema:user_statistics'))
+        self.assertEqual(response.context['users'][0].ticket_count, 4)
+
+
+class ExportTests(CinemaDataMixin, TestCase):
+    """
+    Checks the streaming exports for staff.
+    """
+    def test_csv_tickets(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('cinema:export_data', args=['tickets']))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'session_id'])
+        self.assertEqual(len(lines), 1 + Ticket.objects.count())
+
+    def test_jsonl_statistics(self):
+        self.client.force_login(self.staff)
+        for dataset in ('movies', 'sessions', 'users', 'bookings', 'reviews'):
+            with self.subTest(dataset=dataset):
+                response = self.client.get(
+                    reverse('cinema:export_data', args=[dataset]),
+                    {'format': 'jsonl', 'end_date': f'{timezone.localdate() + timezone.timedelta(days=2):%Y-%m-%d}'}
+                )
+                rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+                self.assertTrue(rows)
+
+    def test_csv_formulas_escaped(self):
+        Review.objects.create(movie=self.movies[1], user=self.user, rating=1, text='=HYPERLINK("http://x","y")')
+        User.objects.filter(pk=self.user.pk).update(username='@viewer')
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('cinema:export_data', args=['reviews']))
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[-1][3:6], ["'@viewer", '1', '\'=HYPERLINK("http://x","y")'])
+        # Numbers keep their sign
+        self.assertEqual(exports._csv_cell(-5), -5)
+
+    def test_requires_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('cinema:export_data', args=['tickets']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_date_range(self):
+        start, end = statistics.date_range('2026-03-01', '2026-03-02')
+        # Local midnights in Europe/Moscow, UTC+3
+        self.assertEqual(start, timezone.datetime(2026, 2, 28, 21, tzinfo=timezone.get_fixed_timezone(0)))
+        self.assertEqual(end, timezone.datetime(2026, 3, 2, 21, tzinfo=timezone.get_fixed_timezone(0)))
+        start, end = statistics.date_range()
+        self.assertTrue(start <= timezone.now() < end)
+        self.assertEqual(timezone.localtime(end).date(), timezone.localdate() + timezone.timedelta(days=1))
+
+    def test_command(self):
+        output = StringIO()
+        call_command('export_data', 'users', '--format', 'jsonl', stdout=output)
+        self.assertEqual(json.loads(output.getvalue().splitlines()[0])['username'], self.user.username)
+
+
+class CachingTests(CinemaDataMixin, TestCase):
+    """
+    Checks that catalog pages are served from the cache and invalidated by model changes.
+    """
+    def setUp(self):
+        cache.clear()
+
+    def assertCached(self, url):
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_anonymous_pages_cached(self):
+        for url in (
+            reverse('cinema:home'),
+            reverse('cinema:movie_list'),
+            reverse('cinema:movie_detail', args=[self.movies[0].pk]),
+            reverse('cinema:news_list'),
+            reverse('cinema:faq_list'),
+            reverse('cinema:vacancy_list'),
+        ):
+            with self.subTest(url=url):
+                self.assertCached(url)
+
+    def test_invalidated_on_save(self):
+        url = reverse('cinema:faq_list')
+        self.assertCached(url)
+        FAQ.objects.create(question='Parking?', answer='Yes')
+        self.assertContains(self.client.get(url), 'Parking?')
+
+    def test_review_fragment_invalidated(self):
+        self.client.force_login(self.user)
+        url = reverse('cinema:movie_detail', args=[self.movies[0].pk])
+        self.client.get(url)
+        Review.objects.create(movie=self.movies[0], user=self.staff, rating=4, text='Too long')
+        self.assertContains(self.client.get(url), 'Too long')
+
+    def test_signed_in_not_cached(self):
+        self.client.force_login(self.user)
+        url = reverse('cinema:news_list')
+        self.client.get(url)
+        News.objects.filter(pk=News.objects.first().pk).update(title='Quietly renamed')
+        self.assertContains(self.client.get(url), 'Quietly renamed')
+
+
+class ImageVariantTests(TestCase):
+    """
+    Checks that uploaded posters get resized variants and a srcset.
+    """
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def create_movie(self, width):
+        buffer = BytesIO()
+        Image.new('RGB', (width, width * 3 // 2), 'navy').save(buffer, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            return Movie.objects.create(
+                title='Poster test',
+                country='Беларусь',
+                duration=100,
+                budget=1000,
+                description='Description',
+                rating=7,
+                release_date=timezone.now(),
+                poster=SimpleUploadedFile('poster.jpg', buffer.getvalue(), content_type='image/jpeg')
+            )
+
+    def test_variants_generated_on_upload(self):
+        movie = self.create_movie(800)
+        movie.refresh_from_db()
+        manifest = movie.poster_variants
+        self.assertEqual(manifest['source'], movie.poster.name)
+        self.assertEqual(sorted(manifest['variants']), ['jpeg', 'webp'])
+        self.assertEqual(sorted(manifest['variants']['webp'], key=int), ['320', '640', '800'])
+        for name in manifest['variants']['webp'].values():
+            self.assertTrue(movie.poster.storage.exists(name))
+            self.assertEqual(os.path.dirname(name), os.path.dirname(movie.poster.name))
+            with movie.poster.storage.open(name) as variant:
+                self.assertLessEqual(Image.open(variant).width, 800)
+
+    def test_decompression_bomb_skipped(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000), self.assertLogs('cinema.signals', 'WARNING') as logs:
+            movie = self.create_movie(400)
+        self.assertIn('Skipped image variants', logs.output[0])
+        movie.refresh_from_db()
+        self.assertEqual(movie.poster_variants, {})
+        self.assertTrue(movie.poster.storage.exists(movie.poster.name))
+
+    def test_srcset(self):
+        movie = self.create_movie(400)
+        movie.refresh_from_db()
+        html = Template(
+            '{% load cinema_images %}{% responsive_image movie.poster movie.poster_variants alt=movie.title %}'
+        ).render(Context({'movie': movie}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(' 320w', html)
+        self.assertIn('alt="Poster test"', html)
+
+    def test_process_media(self):
+        movie = self.create_movie(400)
+        storage = movie.poster.storage
+        orphan = storage.save('movie_posters/orphan.jpg', SimpleUploadedFile('orphan.jpg', b'not an image'))
+        Movie.objects.filter(pk=movie.pk).update(poster_variants={})
+        output = StringIO()
+        call_command(
+            'process_media', workers=1, state=storage.path('state.json'), stdout=output, stderr=StringIO()
+        )
+        self.assertIn(f'Orphaned file: {orphan}', output.getvalue())
+        self.assertIn('1 generated', output.getvalue())
+        movie.refresh_from_db()
+        self.assertEqual(movie.poster_variants['source'], movie.poster.name)
+
+        output = StringIO()
+        call_command('process_media', workers=1, state=storage.path('state.json'), stdout=output)
+        self.assertIn('0 file(s) checked', output.getvalue())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The full-text index uses SQLite FTS5')
+class SearchTests(CinemaDataMixin, TestCase):
+    """
+    Checks the full-text index, its signal maintenance and the search endpoints.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.brother = Movie.objects.create(
+            title='Брат',
+            country='Россия',
+            duration=96,
+            budget=1000,
+            description='Данила Багров приезжает в Петербург',
+            rating=8,
+            release_date=timezone.now()
+        )
+        cls.brother.genres.add(Genre.objects.create(name='Криминал'))
+        Review.objects.create(movie=cls.brother, user=cls.user, rating=10, text='Лучший фильм про ПЕТЕРБУРГ')
+
+    def kinds(self, query):
+        return [(hit['kind'], hit['id']) for hit in search.search(query)]
+
+    def test_cyrillic_prefix_and_case(self):
+        self.assertEqual(self.kinds('бра')[0], ('movie', self.brother.pk))
+        self.assertEqual({kind for kind, _ in self.kinds('петербург')}, {'movie', 'review'})
+        self.assertIn(('movie', self.brother.pk), self.kinds('криминал'))
+
+    def test_index_follows_changes(self):
+        self.brother.title = 'Брат 2'
+        self.brother.description = 'Данила едет в Америку'
+        self.brother.save()
+        self.assertIn(('movie', self.brother.pk), self.kinds('америку'))
+        Genre.objects.filter(name='Криминал').get().delete()
+        self.assertNotIn(('movie', self.brother.pk), self.kinds('криминал'))
+        self.brother.delete()
+        self.assertEqual(self.kinds('данила'), [])
+
+    def test_documents_replaced_by_rowid(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.brother.save()
+        deletes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + deletes[0])
+            # A lookup by rowid, not a scan of the whole index
+            self.assertTrue(cursor.fetchone()[-1].endswith(':='))
+            cursor.execute(f'SELECT rowid, kind, object_id FROM {search.SEARCH_TABLE} WHERE title MATCH %s', ['брат'])
+            self.assertEqual(cursor.fetchall(), [(search.rowid('movie', self.brother.pk), 'movie', self.brother.pk)])
+
+    def test_unpublished_news_hidden(self):
+        news = News.objects.create(title='Премьера сезона', content='Скоро', is_published=False)
+        self.assertEqual(self.kinds('премьера'), [])
+        news.is_published = True
+        news.save()
+        self.assertEqual(self.kinds('премьера'), [('news', news.pk)])
+
+    def test_views(self):
+        response = self.client.get(reverse('cinema:search'), {'q': 'петер'})
+        self.assertContains(response, '<mark>')
+        self.assertEqual(len(response.context['results']), 2)
+        response = self.client.get(reverse('cinema:search_autocomplete'), {'q': 'Бр'})
+        self.assertEqual(response.json()['results'][0]['title'], 'Брат')
+
+
+@override_settings(CACHES=NO_CACHE)
+class FacetTests(CinemaDataMixin, TestCase):
+    """
+    Checks the facet index: filtering by intersection, the option counts and refreshing on changes.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.drama = Genre.objects.create(name='Драма')
+        cls.comedy = Genre.objects.create(name='Комедия')
+        cls.short = Movie.objects.create(
+            title='Короткий', country='Россия', duration=80, budget=1000,
+            description='Description', rating=5.5, release_date=timezone.now()
+        )
+        cls.long = Movie.objects.create(
+            title='Длинный', country='США', duration=150, budget=1000,
+            description='Description', rating=9, release_date=timezone.now()
+        )
+        cls.short.genres.add(cls.drama)
+        cls.long.genres.add(cls.drama, cls.comedy)
+        for movie in cls.movies[:2]:
+            movie.genres.add(cls.comedy)
+
+    def setUp(self):
+        # The index outlives the rolled back transactions of earlier tests
+        facets.invalidate()
+
+    def counts(self, options):
+        return {option['value']: option['count'] for option in options}
+
+    def test_intersection_and_counts(self):
+        drama, comedy = str(self.drama.pk), str(self.comedy.pk)
+        movie_ids, counts = facets.browse({'genre': {drama, comedy}, 'this_week': {'1'}})
+        self.assertEqual(movie_ids, [movie.pk for movie in reversed(self.movies[:2])])
+        # Each facet is counted with the other facets applied, so alternatives stay visible
+        self.assertEqual(self.counts(counts['genre']), {drama: 0, comedy: 2})
+        self.assertEqual(self.counts(counts['this_week']), {'1': 2})
+        self.assertEqual(self.counts(counts['country']), {'Беларусь': 2, 'Россия': 0, 'США': 0})
+
+        movie_ids, counts = facets.browse({'genre': {drama}})
+        self.assertEqual(set(movie_ids), {self.short.pk, self.long.pk})
+        self.assertEqual(self.counts(counts['duration']), {'short': 1, 'medium': 0, 'long': 1})
+        self.assertEqual(self.counts(counts['rating']), {'9+': 1, '7-9': 0, '5-7': 1, '0-5': 0})
+
+    def test_refreshed_on_save(self):
+        self.assertEqual(facets.browse({'country': {'Франция'}})[0], [])
+        self.short.country = 'Франция'
+        self.short.save()
+        self.assertEqual(facets.browse({'country': {'Франция'}})[0], [self.short.pk])
+        self.long.genres.remove(self.drama)
+        self.assertEqual(facets.browse({'genre': {str(self.drama.pk)}})[0], [self.short.pk])
+
+    def test_view(self):
+        url = reverse('cinema:movie_list')
+        facets.get_index()
+        # The genre name lookup and the movies of the page
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'genre': 'Драма', 'duration': ['short', 'long']})
+        self.assertEqual({movie.pk for movie in response.context['movies']}, {self.short.pk, self.long.pk})
+        self.assertContains(response, 'Комедия <span class="text-muted">(1)</span>', html=False)
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=NO_CACHE)
+class KeysetPaginationTests(CinemaDataMixin, TestCase):
+    """
+    Checks cursor pagination of the listings and their JSON feeds.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        start = timezone.now() + timezone.timedelta(days=3)
+        # Pairs of sessions share a start time, so the id has to break the ties
+        for i in range(45):
+            Session.objects.create(
+                movie=cls.movies[i % 4],
+                hall=cls.hall,
+                start_time=start + timezone.timedelta(hours=i // 2),
+                price=10,
+                total_seats=50
+            )
+
+    def walk(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [item['id'] for item in data['results']]
+            url = data['next']
+        return ids
+
+    def test_feed_walks_every_row_once(self):
+        expected = list(
+            Session.objects.filter(start_time__gte=timezone.now(), is_active=True)
+            .order_by('start_time', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(self.walk(reverse('cinema:session_feed')), expected)
+        self.assertEqual(
+            self.walk(reverse('cinema:news_feed')),
+            list(News.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        )
+        self.assertEqual(
+            self.walk(reverse('cinema:movie_feed')),
+            list(Movie.objects.order_by('-release_date', '-id').values_list('id', flat=True))
+        )
+
+    def test_deep_pages_without_count(self):
+        url = reverse('cinema:session_list')
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(url, {'after': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(first), len(second))
+        self.assertFalse(any('COUNT(' in query['sql'] for query in second.captured_queries))
+
+        page = response.context['page_obj']
+        back = self.client.get(url, {'before': page.previous_cursor}).context['sessions']
+        self.assertEqual(len(back), 20)
+        self.assertContains(response, 'before=')
+
+    def test_page_numbers_and_bad_cursors(self):
+        url = reverse('cinema:session_list')
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertEqual(self.client.get(url, {'after': 'not-a-cursor'}).status_code, 404)
+        response = self.client.get(reverse('cinema:session_feed'), {'sort': 'occupancy'})
+        self.assertIn('page=2', response.json()['next'])
+
+
+class ApiTests(CinemaDataMixin, TestCase):
+    """
+    Checks the JSON API payloads and their conditional GET handling.
+    """
+    def setUp(self):
+        cache.clear()
+        self.drop_seat_maps()
+        # Session ids are reused by later tests, which expect to build their own maps
+        self.addCleanup(self.drop_seat_maps)
+
+    def drop_seat_maps(self):
+        for session in self.sessions:
+            seating.invalidate(session.pk)
+
+    def assertNotModified(self, url, response, **params):
+        """
+        Repeats a request with its validators and expects an empty 304 answered from the validator query alone.
+        """
+        self.assertTrue(response['ETag'].startswith('"'))
+        with self.assertNumQueries(1):
+            repeated = self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated.content, b'')
+        return response['ETag']
+
+    def test_movies(self):
+        url = reverse('cinema:api_movies')
+        response = self.client.get(url)
+        self.assertEqual([movie['id'] for movie in response.json()['results']], [movie.pk for movie in reversed(self.movies)])
+        etag = self.assertNotModified(url, response)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        self.movies[0].genres.add(Genre.objects.create(name='Драма'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][-1]['genres'], [Genre.objects.get(name='Драма').pk])
+
+        detail = self.client.get(reverse('cinema:api_movie', args=[self.movies[0].pk])).json()
+        self.assertEqual(detail['description'], 'Description')
+        self.assertEqual(self.client.get(reverse('cinema:api_movie', args=[0])).status_code, 404)
+
+    def test_sessions(self):
+        url = reverse('cinema:api_sessions')
+        day = timezone.localtime(self.sessions[0].start_time).strftime('%Y-%m-%d')
+        response = self.client.get(url, {'date': day, 'hall': self.hall.pk})
+        results = response.json()['results']
+        self.assertEqual({row['id'] for row in results}, {session.pk for session in self.sessions if
+                         timezone.localtime(session.start_time).strftime('%Y-%m-%d') == day})
+        self.assertEqual(results[0]['free_seats'], 48)
+        etag = self.assertNotModified(url, response, date=day, hall=self.hall.pk)
+
+        seating.claim_seats(self.sessions[0], self.user, [5], 'buy')
+        response = self.client.get(url, {'date': day, 'hall': self.hall.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['free_seats'], 47)
+        self.assertEqual(self.client.get(url, {'date': 'tomorrow'}).status_code, 400)
+
+    def test_seat_map(self):
+        session = self.sessions[0]
+        url = reverse('cinema:api_seat_map', args=[session.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['taken'], [1, 20])
+        etag = self.assertNotModified(url, response)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            seating.claim_seats(session, self.user, [7], 'book')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['taken'], [1, 7, 20])
+        self.assertEqual(self.client.get(reverse('cinema:api_seat_map', args=[0])).status_code, 404)
+
+
+class SeatEventTests(CinemaDataMixin, TestCase):
+    """
+    Checks the seat event log and the Server-Sent Events stream built on it.
+    """
+    def setUp(self):
+        self.session = self.sessions[0]
+        seating.invalidate(self.session.pk)
+        self.addCleanup(seating.invalidate, self.session.pk)
+        # The fixture's own tickets and bookings were logged too
+        self.first_event_id = SeatEvent.objects.order_by('-id').values_list('id', flat=True).first()
+
+    def events(self, messages):
+        return [
+            (re.search(r'^event: (\w+)$', message, re.M).group(1), json.loads(re.search(r'^data: (.*)$', message, re.M).group(1)))
+            for message in messages if 'data: ' in message
+        ]
+
+    def test_claims_and_releases_stream(self):
+        stream = live.SeatEventStream(self.session)
+        self.assertEqual(self.events(stream.start()), [('snapshot', {'total_seats': 50, 'taken': [1, 20]})])
+        self.assertEqual(stream.poll(), [])
+
+        bookings = seating.claim_seats(self.session, self.user, [5, 6], 'book')
+        seating.claim_seats(self.session, self.user, [7], 'buy')
+        seating.release_holds(Booking.objects.filter(pk=bookings[0].pk))
+        self.assertEqual(self.events(stream.poll()), [('seats', {'taken': [6, 7], 'released': [5]})])
+
+        # A reconnecting browser gets what it missed instead of a snapshot
+        resumed = live.SeatEventStream(self.session, last_event_id=self.first_event_id)
+        self.assertEqual(self.events(resumed.start()), [('seats', {'taken': [6, 7], 'released': [5]})])
+
+    def test_snapshot_from_cached_map(self):
+        seating.get_seat_map(self.session)
+        # Logged by another process after this one loaded its seat map
+        SeatEvent.objects.create(session=self.session, seat_number=8, kind=SeatEvent.TAKEN)
+        stream = live.SeatEventStream(self.session)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.events(stream.start()), [('snapshot', {'total_seats': 50, 'taken': [1, 20]})])
+        self.assertEqual(self.events(stream.poll()), [('seats', {'taken': [8], 'released': []})])
+
+    async def test_shared_feed(self):
+        with mock.patch.object(live, 'FEED_BUFFER_SIZE', 3):
+            feed = live.SessionFeed.follow(self.session.pk, 10)
+        self.assertIs(live.SessionFeed.follow(self.session.pk, 12), feed)
+        self.assertEqual(feed.streams, 2)
+        feed.add([(11, 5, 'taken'), (12, 6, 'taken')])
+        self.assertEqual(feed.since(10), [(11, 5, 'taken'), (12, 6, 'taken')])
+        feed.add([(13, 5, 'released'), (14, 7, 'taken')])
+        # Event 11 no longer fits in the buffer, so a stream before it reads on its own
+        self.assertIsNone(feed.since(10))
+        self.assertEqual(feed.since(12), [(13, 5, 'released'), (14, 7, 'taken')])
+
+        feed.unfollow()
+        feed.unfollow()
+        await asyncio.sleep(0)
+        self.assertTrue(feed.task.cancelled())
+        other = live.SessionFeed.follow(self.session.pk, 14)
+        self.assertIsNot(other, feed)
+        other.unfollow()
+
+    def test_lapsed_hold_bought(self):
+        # A hold past its expiry that the sweeper has not reached yet
+        Booking.objects.filter(session=self.session, seat_number=20).update(
+            expiry_date=timezone.now() - timezone.timedelta(minutes=1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            seating.claim_seats(self.session, self.staff, [20], 'buy')
+            self.assertEqual(seating.expire_holds()['expired'], 0)
+        self.assertFalse(SeatEvent.objects.filter(session=self.session, kind=SeatEvent.RELEASED).exists())
+        self.assertTrue(seating.get_seat_map(self.session).is_taken(20))
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.sold_count, self.session.held_count), (2, 0))
+
+    def test_signals_and_pruning(self):
+        ticket = Ticket.objects.create(session=self.session, user=self.user, seat_number=9, price=10)
+        ticket.delete()
+        self.assertEqual(
+            list(SeatEvent.objects.filter(id__gt=self.first_event_id).values_list('seat_number', 'kind')),
+            [(9, SeatEvent.TAKEN), (9, SeatEvent.RELEASED)]
+        )
+        seating.prune_seat_events(timezone.now() + seating.SEAT_EVENT_RETENTION * 2)
+        self.assertFalse(SeatEvent.objects.exists())
+        Ticket.objects.create(session=self.session, user=self.user, seat_number=9, price=10)
+        # Deleting a session does not log releases for its own seats
+        session_id = self.session.pk
+        self.session.delete()
+        self.assertFalse(SeatEvent.objects.filter(session_id=session_id).exists())
+
+    def test_view(self):
+        # Under WSGI nothing is streamed and the buy page polls the seat map
+        response = self.client.get(reverse('cinema:seat_events', args=[self.session.pk]))
+        self.assertEqual(response.status_code, 204)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('cinema:buy_ticket', args=[self.session.pk]))
+        self.assertContains(response, reverse('cinema:api_seat_map', args=[self.session.pk]))
+        self.assertNotContains(response, 'data-events-url')
+
+    async def test_async_view(self):
+        response = await self.async_client.get(reverse('cinema:seat_events', args=[self.session.pk]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b'retry: 2000\n\n')
+        self.assertIn(b'"taken":[1,20]', await anext(content))
+        await content.aclose()
+        response = await self.async_client.get(reverse('cinema:seat_events', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncViewTests(CinemaDataMixin, TestCase):
+    """
+    Checks the async views of the read-heavy pages under the ASGI handler.
+    """
+    def setUp(self):
+        cache.clear()
+        FAQ.objects.create(question='Question', answer='Answer')
+
+    def urls(self):
+        return [
+            reverse('cinema:home'),
+            reverse('cinema:movie_detail', args=[self.movies[0].pk]),
+            reverse('cinema:session_list'),
+            reverse('cinema:news_list'),
+            reverse('cinema:news_detail', args=[News.objects.first().pk]),
+            reverse('cinema:faq_list'),
+        ]
+
+    async def test_pages(self):
+        for url in await sync_to_async(self.urls)():
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('cinema:movie_detail', args=[self.movies[0].pk]))
+        self.assertContains(response, 'Great')
+        response = await self.async_client.get(reverse('cinema:session_list'), {'sort': 'occupancy', 'page': 1})
+        self.assertEqual(len(response.context['sessions']), 4)
+
+    async def test_cached_response(self):
+        url = reverse('cinema:news_list')
+        await self.async_client.get(url)
+        # A queryset update sends no signal, so the cached page is still served
+        await News.objects.filter(title='News 2').aupdate(title='Renamed')
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'News 2')
+        self.assertNotContains(response, 'Renamed')
+
+
+@override_settings(CACHES=NO_CACHE)
+class LoadTestTests(TestCase):
+    """
+    Checks the synthetic dataset and one simulated visitor of the load test harness.
+    """
+    def test_seed(self):
+        created = loadtest.seed(movies=5, sessions=8, tickets=120, users=6, halls=2, rng=random.Random(1))
+        self.assertEqual(created['tickets'], Ticket.objects.count())
+        self.assertEqual((Movie.objects.count(), Session.objects.count()), (5, 8))
+        self.assertEqual(User.objects.filter(username__startswith=loadtest.USERNAME_PREFIX, is_staff=False).count(), 6)
+        # The counters written by the seeder match the tickets
+        for session in Session.objects.annotate(tickets_count=Count('tickets')):
+            self.assertEqual(session.sold_count, session.tickets_count)
+            self.assertLessEqual(session.sold_count, session.total_seats)
+
+    def test_funnel(self):
+        loadtest.seed(movies=2, sessions=4, tickets=0, users=1, halls=1, rng=random.Random(2))
+        session = Session.objects.first()
+        Session.objects.filter(pk=session.pk).update(start_time=timezone.now() + timezone.timedelta(days=1))
+        recorder = loadtest.Recorder()
+        visitor = loadtest.SimulatedUser(
+            User.objects.get(username__startswith=loadtest.USERNAME_PREFIX, is_staff=False),
+            [session.pk], recorder, 1, random.Random(3), double_submit_rate=1
+        )
+        visitor.client.force_login(visitor.user)
+        visitor.funnel()
+        report = recorder.report()
+        self.assertEqual(
+            sorted(report), ['booking_list', 'buy', 'buy_retry', 'buy_ticket', 'hold', 'seat_map', 'session_list']
+        )
+        self.assertEqual((report['hold']['conflicts'], report['buy']['errors']), (0, 0))
+        # The repeated purchase is answered from its idempotency key
+        self.assertEqual(report['buy_retry']['conflicts'], 0)
+        self.assertEqual(Ticket.objects.filter(session=session, user=visitor.user).count(), 1)
+        
+
+@override_settings(CACHES=NO_CACHE)
+class ProfilingTests(CinemaDataMixin, TestCase):
+    """
+    Checks the request profiling middleware and the staff profiling page.
+    """
+    def setUp(self):
+        profiling.clear()
+        self.addCleanup(profiling.clear)
+
+    def test_sync_request(self):
+        response = self.client.get(reverse('cinema:movie_list'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        [profile] = profiling.profiles()
+        self.assertEqual((profile.view, profile.method, profile.status), ('cinema:movie_list', 'GET', 200))
+        self.assertEqual(profile.db_count, sum(count for count, _ in profile.queries.values()))
+        self.assertGreater(profile.db_count, 0)
+        self.assertGreater(profile.template_time, 0)
+        self.assertLessEqual(profile.db_time + profile.template_time, profile.total)
+
+    async def test_async_request(self):
+        response = await self.async_client.get(reverse('cinema:news_list'))
+        self.assertIn('Server-Timing', response)
+        [profile] = profiling.profiles()
+        # Queries run in the async ORM's worker thread are counted too
+        self.assertEqual(profile.view, 'cinema:news_list')
+        self.assertGreater(profile.db_count, 0)
+        self.assertGreater(profile.template_time, 0)
+
+    def test_dashboard(self):
+        for _ in range(2):
+            self.client.get(reverse('cinema:session_list'))
+        self.assertEqual(profiling.slowest_views()[0]['requests'], 2)
+        self.assertEqual(profiling.repeated_queries()[0]['executions'] % 2, 0)
+        self.assertEqual(profiling.repeated_queries()[0]['views'], ['cinema:session_list'])
+
+        url = reverse('cinema:profiling_dashboard')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertContains(response, 'cinema:session_list')
+        # The two session lists and the redirected visitor; the page itself is recorded after rendering
+        self.assertEqual(response.context['request_count'], 3)
+        self.client.post(url)
+        # Only the redirect to the page itself is left
+        self.assertEqual([profile.view for profile in profiling.profiles()], ['cinema:profiling_dashboard'])
+
+
+@override_settings(CACHES=NO_CACHE)
+class HallLayoutTests(CinemaDataMixin, TestCase):
+    """
+    Checks hall layouts and best-available seat selection.
+    """
+    PLAN = '\n'.join([
+        'SSS.SSSS.SSS',
+        'SSS.SSSS.SSS',
+        'SSS.VVVV.SSS',
+        'SSS.VVVV.SSS',
+        'AAX.SSSS.XAA',
+    ])
+
+    def setUp(self):
+        self.hall = Hall.objects.create(name='Hall 2', capacity=50)
+        rows, columns, cells = HallLayout.parse_plan(self.PLAN)
+        self.layout = HallLayout.objects.create(hall=self.hall, rows=rows, columns=columns, cells=cells)
+        self.session = Session.objects.create(
+            movie=self.movies[0],
+            hall=self.hall,
+            start_time=timezone.now() + timezone.timedelta(days=2),
+            price=10
+        )
+        self.addCleanup(seating.invalidate, self.session.pk)
+        self.addCleanup(layouts.invalidate)
+        self.plan = layouts.get_plan(self.layout)
+
+    def test_layout(self):
+        self.assertEqual(self.layout.plan, self.PLAN)
+        # Aisles and blocked seats are not numbered
+        self.assertEqual((self.layout.seat_count, self.session.total_seats, self.plan.seat_count), (48, 48, 48))
+        self.assertEqual(self.plan.seat(11), {'seat': 11, 'row': 2, 'place': 1, 'category': 'standard'})
+        self.assertEqual(self.plan.seat(48), {'seat': 48, 'row': 5, 'place': 8, 'category': 'accessible'})
+        with self.assertRaises(ValueError):
+            HallLayout.parse_plan('SS?S')
+
+    def test_hall_plan_cached(self):
+        self.assertEqual(layouts.plan_for_session(self.session), (self.plan, True))
+        with self.assertNumQueries(0):
+            self.assertEqual(layouts.plan_for_session(self.session), (self.plan, True))
+        # Saving the layout reads it again; it no longer matches the session's seats
+        self.layout.cells = bytes([HallLayout.BLOCKED]) + bytes(self.layout.cells)[1:]
+        self.layout.save()
+        self.assertEqual(layouts.hall_plan(self.hall.pk).seat_count, 47)
+        self.assertEqual(layouts.plan_for_session(self.session), (layouts.single_row_plan(48), False))
+
+    def test_best_seats(self):
+        seat_map = seating.get_seat_map(self.session)
+        # Centre of the fourth row (two thirds back) first
+        self.assertEqual(self.plan.best_seats(seat_map, 2), [35, 36])
+        self.assertEqual(self.plan.best_seats(seat_map, 2, (HallLayout.ACCESSIBLE,)), [41, 42])
+        self.assertEqual(self.plan.best_seats(seat_map, 5), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            seating.claim_seats(self.session, self.user, [35], 'buy')
+        seat_map = seating.get_seat_map(self.session)
+        picked = self.plan.best_seats(seat_map, 2)
+        self.assertNotIn(35, picked)
+        self.assertEqual(picked, self.plan._best_seats_python(seat_map, 2, layouts.DEFAULT_CATEGORIES))
+        self.assertEqual(self.plan.best_seats(seat_map, 4, (HallLayout.VIP,)), [24, 25, 26, 27])
+
+    def test_views(self):
+        self.client.force_login(self.user)
+        url = reverse('cinema:buy_ticket', args=[self.session.pk])
+        response = self.client.post(url, {'action': 'pick', 'count': '4', 'category': 'vip'})
+        self.assertEqual(response.context['picked'], [34, 35, 36, 37])
+        self.assertContains(response, 'title="Ряд 3, место 5"')
+        response = self.client.get(reverse('cinema:api_best_seats', args=[self.session.pk]), {'count': 2})
+        self.assertEqual(
+            [seat['seat'] for seat in response.json()['seats']], [35, 36]
+        )
+        response = self.client.get(reverse('cinema:api_best_seats', args=[self.sessions[0].pk]), {'count': 2})
+        # Without a layout the middle of the seat numbers is suggested
+        self.assertEqual(response.json()['seats'], [{'seat': 25}, {'seat': 26}])
+        self.assertEqual(
+            self.client.get(reverse('cinema:api_best_seats', args=[self.session.pk]), {'count': 0}).status_code, 400
+        )
+
+
+class SchedulingTests(CinemaDataMixin, TestCase):
+    """
+    Checks hall conflict detection and bulk session generation.
+    """
+    def setUp(self):
+        self.hall = Hall.objects.create(name='Hall 3', capacity=80)
+        today = timezone.localdate()
+        self.week = today + timezone.timedelta(days=7 - today.weekday())
+        self.movie = self.movies[0]
+
+    def at(self, days, hour, minute=0):
+        return timezone.make_aware(
+            timezone.datetime.combine(self.week + timezone.timedelta(days=days), timezone.datetime.min.time())
+        ) + timezone.timedelta(hours=hour, minutes=minute)
+
+    def slot(self, weekday, start, hall=None):
+        return scheduling.Slot.from_dict({
+            'weekday': weekday, 'time': start, 'hall': (hall or self.hall).pk, 'movie': self.movie.pk, 'price': '12.50',
+        })
+
+    def test_hall_schedule(self):
+        schedule = scheduling.HallSchedule()
+        first = Session(start_time=self.at(0, 10), end_time=self.at(0, 12))
+        second = Session(start_time=self.at(0, 13), end_time=self.at(0, 14))
+        schedule.add(second)
+        schedule.add(first)
+        self.assertIs(schedule.conflict(self.at(0, 11), self.at(0, 11, 30)), first)
+        # Intervals are half-open
+        self.assertIsNone(schedule.conflict(self.at(0, 12), self.at(0, 13)))
+        self.assertIs(schedule.conflict(self.at(0, 13, 30), self.at(0, 15)), second)
+        # A long interval starting earlier is still found behind shorter ones
+        long = Session(start_time=self.at(0, 9), end_time=self.at(0, 16))
+        schedule.add(long)
+        self.assertIs(schedule.conflict(self.at(0, 15), self.at(0, 15, 30)), long)
+        self.assertIsNone(schedule.conflict(self.at(0, 16), self.at(0, 17)))
+
+        # Against a linear scan over overlapping legacy data
+        rng = random.Random(7)
+        schedule = scheduling.HallSchedule()
+        sessions = []
+        for _ in range(200):
+            start = self.at(0, 0) + timezone.timedelta(minutes=rng.randrange(10000))
+            session = Session(start_time=start, end_time=start + timezone.timedelta(minutes=rng.randrange(1, 300)))
+            schedule.add(session)
+            sessions.append(session)
+        for _ in range(500):
+            start = self.at(0, 0) + timezone.timedelta(minutes=rng.randrange(-300, 10300))
+            end = start + timezone.timedelta(minutes=rng.randrange(1, 60))
+            found = schedule.conflict(start, end)
+            overlapping = [session for session in sessions if session.start_time < end and session.end_time > start]
+            self.assertEqual(found is None, not overlapping)
+            self.assertTrue(found is None or found in overlapping)
+
+    def test_clean(self):
+        session = Session.objects.create(movie=self.movie, hall=self.hall, start_time=self.at(0, 10), price=10)
+        self.assertEqual(session.end_time, self.at(0, 10) + timezone.timedelta(minutes=90 + 15))
+        overlapping = Session(movie=self.movies[1], hall=self.hall, start_time=self.at(0, 11, 30), price=10, total_seats=80)
+        with self.assertRaises(ValidationError):
+            overlapping.clean()
+        # The previous session ends at 11:45 with the cleaning buffer
+        overlapping.start_time = self.at(0, 11, 45)
+        overlapping.clean()
+        # An inactive session does not take the hall
+        Session(movie=self.movie, hall=self.hall, start_time=self.at(0, 10), price=10, is_active=False).clean()
+
+    def test_create_sessions(self):
+        count = Session.objects.count()
+        existing = Session.objects.create(movie=self.movie, hall=self.hall, start_time=self.at(1, 18), price=10)
+        # The Tuesday session overlaps the existing one; nothing of the week is created
+        sessions = scheduling.build_sessions([self.slot(0, '10:00'), self.slot(1, '17:00')], self.week)
+        with self.assertRaises(scheduling.ScheduleConflict) as raised:
+            scheduling.create_sessions(sessions)
+        self.assertEqual([(new.start_time, old) for new, old in raised.exception.conflicts], [(self.at(1, 17), existing)])
+        self.assertEqual(Session.objects.count(), count + 1)
+        # Sessions of the same batch conflict with each other too
+        sessions = scheduling.build_sessions([self.slot(2, '10:00'), self.slot(2, '11:00')], self.week)
+        self.assertEqual(len(scheduling.find_conflicts(sessions)), 1)
+
+        slots = [self.slot(day, start) for day in range(7) for start in ('10:00', '12:00', '14:00', '17:00')]
+        with self.assertNumQueries(3):
+            sessions = scheduling.build_sessions(slots, self.week)
+        with self.assertRaises(scheduling.ScheduleConflict):
+            scheduling.create_sessions(sessions)
+        created = scheduling.create_sessions([
+            session for session in sessions if timezone.localtime(session.start_time).weekday() != 1
+        ])
+        self.assertEqual(len(created), 24)
+        session = Session.objects.get(hall=self.hall, start_time=self.at(0, 12))
+        self.assertEqual((session.total_seats, session.price), (80, Decimal('12.50')))
+        self.assertEqual(session.end_time, self.at(0, 13, 45))
+
+    def test_command(self):
+        Session.objects.create(movie=self.movie, hall=self.hall, start_time=self.at(0, 10), price=10)
+        Session.objects.create(movie=self.movie, hall=self.hall, start_time=self.at(2, 20), price=10)
+        target = self.week + timezone.timedelta(days=7)
+        out = StringIO()
+        call_command(
+            'generate_sessions', week=target.isoformat(), copy_from=self.week.isoformat(),
+            halls=[self.hall.pk], stdout=out
+        )
+        self.assertIn('Created 2 sessions', out.getvalue())
+        self.assertEqual(
+            list(Session.objects.filter(hall=self.hall, start_time__gte=self.at(7, 0)).values_list('start_time', flat=True)),
+            [self.at(7, 10), self.at(9, 20)]
+        )
+        # Copying again overlaps the copies
+        with self.assertRaises(CommandError):
+            call_command(
+                'generate_sessions', week=target.isoformat(), copy_from=self.week.isoformat(),
+                halls=[self.hall.pk], stdout=StringIO(), stderr=StringIO()
+            )
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as template:
+            json.dump([{'weekday': 3, 'time': '19:30', 'hall': self.hall.pk, 'movie': self.movie.pk, 'price': 9}], template)
+        self.addCleanup(os.remove, template.name)
+        out = StringIO()
+        call_command('generate_sessions', week=target.isoformat(), template=template.name, dry_run=True, stdout=out)
+        self.assertIn('Would create 1 sessions', out.getvalue())
+        self.assertFalse(Session.objects.filter(start_time=self.at(10, 19, 30)).exists())
+
+    def test_week_not_starting_on_monday(self):
+        # Monday and Wednesday sessions, copied from a week that starts on Wednesday
+        Session.objects.create(movie=self.movie, hall=self.hall, start_time=self.at(2, 10), price=10)
+        Session.objects.create(movie=self.movie, hall=self.hall, start_time=self.at(7, 20), price=10)
+        wednesday = self.week + timezone.timedelta(days=2)
+        slots = scheduling.week_template(wednesday, [self.hall.pk])
+        sessions = scheduling.build_sessions(slots, wednesday + timezone.timedelta(days=14))
+        self.assertEqual([s.start_time for s in sessions], [self.at(16, 10), self.at(21, 20)])
+        self.assertEqual([timezone.localtime(s.start_time).weekday() for s in sessions], [2, 0])
+
+        # A Monday slot of a template filled from a Friday lands on the next Monday
+        friday = self.week + timezone.timedelta(days=4)
+        sessions = scheduling.build_sessions([self.slot(0, '10:00'), self.slot(4, '12:00')], friday)
+        self.assertEqual([s.start_time for s in sessions], [self.at(7, 10), self.at(4, 12)])
+
+    def test_admin(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('admin:cinema_session_changelist')).status_code, 200)
+        response = self.client.get(reverse('admin:cinema_session_change', args=[self.sessions[0].pk]))
+        self.assertContains(response, 'end_time')
+
+
+class PricingTests(CinemaDataMixin, TestCase):
+    """
+    Checks pricing rules, cached price tables and promo code discounts.
+    """
+    def setUp(self):
+        self.addCleanup(pricing.invalidate)
+        self.addCleanup(promos.invalidate)
+        hall = Hall.objects.create(name='Hall 4', capacity=4)
+        rows, columns, cells = HallLayout.parse_plan('SSVV')
+        HallLayout.objects.create(hall=hall, rows=rows, columns=columns, cells=cells)
+        today = timezone.localdate()
+        saturday = today + timezone.timedelta(days=12 - today.weekday())
+        self.session = Session.objects.create(
+            movie=self.movies[0],
+            hall=hall,
+            start_time=timezone.make_aware(timezone.datetime.combine(saturday, timezone.datetime.min.time()))
+            + timezone.timedelta(hours=19),
+            price=10
+        )
+        self.addCleanup(seating.invalidate, self.session.pk)
+        PricingRule.objects.create(name='Weekend', weekdays='56', percent=20)
+        PricingRule.objects.create(name='Evening', time_from='18:00', time_to='23:00', percent=10, priority=1)
+        PricingRule.objects.create(name='VIP', seat_category=HallLayout.VIP, percent=50, priority=2)
+        PricingRule.objects.create(name='Surge', min_occupancy=50, percent=25, priority=3)
+        # Neither matches a Saturday evening session
+        PricingRule.objects.create(name='Weekday', weekdays='01234', percent=-30)
+        PricingRule.objects.create(name='Late night', time_from='23:00', time_to='02:00', percent=-10)
+        PromoCode.objects.create(code='SPRING10', discount_percent=10, expiry_date=timezone.now() + timezone.timedelta(days=1))
+        PromoCode.objects.create(code='OLD', discount_percent=50, expiry_date=timezone.now() - timezone.timedelta(days=1))
+
+    def test_table(self):
+        table = pricing.get_table(self.session)
+        self.assertEqual(table.tiers, [0, 50])
+        self.assertEqual(table.current(0), {'standard': Decimal('13.20'), 'vip': Decimal('19.80')})
+        self.assertEqual(table.current(75), {'standard': Decimal('16.50'), 'vip': Decimal('24.75')})
+        self.assertEqual(table.seat_price(3, 50, discount_percent=10), Decimal('22.28'))
+        # Served from the process cache until a rule changes
+        with self.assertNumQueries(0):
+            self.assertIs(pricing.get_table(self.session), table)
+        PricingRule.objects.filter(name='Surge').get().delete()
+        table = pricing.get_table(self.session)
+        self.assertEqual(table.tiers, [0])
+        self.assertEqual(table.current(75), {'standard': Decimal('13.20'), 'vip': Decimal('19.80')})
+
+    def test_cache_bounded(self):
+        with mock.patch.object(pricing, 'PRICE_TABLE_CACHE_SIZE', 2):
+            first = pricing.get_table(self.session)
+            pricing.get_table(self.sessions[0])
+            # Using the first table makes the second the least recently used
+            self.assertIs(pricing.get_table(self.session), first)
+            pricing.get_table(self.sessions[1])
+            self.assertEqual(list(pricing._tables), [self.session.pk, self.sessions[1].pk])
+
+    def test_checkout(self):
+        self.client.force_login(self.user)
+        url = reverse('cinema:checkout', args=[self.session.pk])
+        response = self.client.post(url, {'action': 'buy', 'seats': [1, 3]}, content_type='application/json')
+        self.assertEqual([seat['price'] for seat in response.json()['seats']], ['13.20', '19.80'])
+        response = self.client.post(
+            url, {'action': 'buy', 'seats': [2], 'promo_code': 'OLD'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        # Half of the seats are sold, so the surge applies
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url, {'action': 'buy', 'seats': [2, 4], 'promo_code': 'spring10'}, content_type='application/json'
+            )
+        self.assertEqual([seat['price'] for seat in response.json()['seats']], ['14.85', '22.28'])
+        self.assertEqual(
+            DailySalesRollup.objects.filter(hall=self.session.hall).get().revenue, Decimal('70.13')
+        )
+
+    def test_buy_page(self):
+        self.client.force_login(self.user)
+        url = reverse('cinema:buy_ticket', args=[self.session.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.context['prices'], {'standard': Decimal('13.20'), 'vip': Decimal('19.80')})
+        self.assertContains(response, 'VIP &mdash; 19,80 BYN')
+        response = self.client.post(url, {'action': 'buy', 'seat_numbers': ['1'], 'promo_code': 'nope'}, follow=True)
+        self.assertContains(response, 'Invalid or expired promo code.')
+        self.client.post(url, {'action': 'book', 'seat_numbers': ['1'], 'promo_code': 'SPRING10'})
+        self.assertEqual(Booking.objects.get(session=self.session).price, Decimal('11.88'))
+
+
+class PromoTests(CinemaDataMixin, TestCase):
+    """
+    Checks the promo code index, redemption limits and the ledger.
+    """
+    def setUp(self):
+        self.addCleanup(promos.invalidate)
+        self.other = User.objects.create_user('other', password='secret')
+        self.promo = PromoCode.objects.create(
+            code='Autumn20', discount_percent=20, expiry_date=timezone.now() + timezone.timedelta(days=1),
+            max_uses=2, max_uses_per_user=1
+        )
+        PromoCode.objects.create(code='OLD', discount_percent=50, expiry_date=timezone.now() - timezone.timedelta(days=1))
+        self.session = self.sessions[1]
+        self.addCleanup(seating.invalidate, self.session.pk)
+
+    def test_lookup(self):
+        self.assertEqual(promos.lookup(' autumn20 ').discount_percent, 20)
+        with self.assertNumQueries(0):
+            promos.lookup('AUTUMN20')
+            self.assertTrue(promos.code_exists('old'))
+            self.assertFalse(promos.code_exists('autumn20', exclude_pk=self.promo.pk))
+        for code in ('OLD', 'UNKNOWN'):
+            with self.assertRaises(promos.PromoUnavailable):
+                promos.lookup(code)
+        # Saving a code refreshes the index, and so does the first expiry
+        PromoCode.objects.create(code='NEW', discount_percent=5, expiry_date=timezone.now() + timezone.timedelta(hours=1))
+        self.assertEqual(promos.lookup('new').discount_percent, 5)
+        later = timezone.now() + timezone.timedelta(hours=2)
+        with self.assertRaises(promos.PromoUnavailable):
+            promos.lookup('new', now=later)
+        self.assertEqual(promos.get_index(later).next_expiry, self.promo.expiry_date)
+
+    def checkout(self, user, seats, code='autumn20'):
+        self.client.force_login(user)
+        return self.client.post(
+            reverse('cinema:checkout', args=[self.session.pk]),
+            {'action': 'buy', 'seats': seats, 'promo_code': code},
+            content_type='application/json'
+        )
+
+    def test_limits(self):
+        response = self.checkout(self.user, [30, 31])
+        self.assertEqual([seat['price'] for seat in response.json()['seats']], ['8.00', '8.00'])
+        # One use per user; the failed checkout neither counts nor claims seats
+        response = self.checkout(self.user, [32])
+        self.assertEqual((response.status_code, response.json()['error']), (409, 'You have already used this promo code.'))
+        self.assertFalse(Ticket.objects.filter(session=self.session, seat_number=32).exists())
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.used_count, 1)
+        self.assertEqual(self.checkout(self.other, [32]).status_code, 201)
+        response = self.checkout(self.staff, [33])
+        self.assertEqual((response.status_code, response.json()['error']), (409, 'This promo code is no longer available.'))
+        self.assertEqual(self.checkout(self.staff, [33], code='OLD').status_code, 400)
+
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.used_count, 2)
+        redemption = PromoRedemption.objects.get(user=self.user)
+        self.assertEqual(
+            (redemption.seats, redemption.amount, redemption.discount, redemption.action), (2, Decimal('16.00'), Decimal('4.00'), 'buy')
+        )
+        start = timezone.now() - timezone.timedelta(days=1)
+        columns, rows = exports.export_rows('promo_redemptions', start, timezone.now() + timezone.timedelta(days=1))
+        self.assertEqual([dict(zip(columns, row))['user__username'] for row in rows], ['viewer', 'other'])
+
+    def test_hold_then_buy(self):
+        promo = promos.lookup('autumn20')
+        booking, = seating.claim_seats(self.session, self.user, [34], 'book', promo)
+        self.assertEqual(booking.price, Decimal('8.00'))
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.used_count, 0)
+        # The hold did not use up the buyer's one redemption
+        ticket, = seating.claim_seats(self.session, self.user, [34], 'buy', promo)
+        self.assertEqual(ticket.price, Decimal('8.00'))
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.used_count, 1)
+        self.assertEqual(list(PromoRedemption.objects.values_list('action', 'seats')), [('buy', 1)])
+
+    def test_promo_page(self):
+        response = self.client.get(reverse('cinema:promo_codes'))
+        self.assertEqual([promo.code for promo in response.context['active_promos']], ['Autumn20'])
+        self.assertEqual([promo.code for promo in response.context['expired_promos']], ['OLD'])
+        self.assertContains(response, 'Скидка: 20%')
+
+    def test_form(self):
+        data = {'code': 'autumn20', 'discount_percent': 10, 'expiry_date': '2030-01-01T00:00'}
+        form = PromoCodeForm(data)
+        self.assertIn('code', form.errors)
+        form = PromoCodeForm({**data, 'code': 'Autumn20'}, instance=self.promo)
+        self.assertTrue(form.is_valid(), form.errors)
+
+
+class IdempotencyTests(CinemaDataMixin, TestCase):
+    """
+    Checks that repeated checkouts with the same key claim their seats once.
+    """
+    def setUp(self):
+        self.session = self.sessions[2]
+        self.addCleanup(seating.invalidate, self.session.pk)
+        self.client.force_login(self.user)
+
+    def test_double_submit(self):
+        url = reverse('cinema:buy_ticket', args=[self.session.pk])
+        key = self.client.get(url).context['idempotency_key']
+        data = {'action': 'buy', 'seat_numbers': ['10', '11'], 'idempotency_key': key}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertRedirects(self.client.post(url, data), reverse('cinema:ticket_list'))
+        events = SeatEvent.objects.count()
+        response = self.client.post(url, data)
+        self.assertRedirects(response, reverse('cinema:ticket_list'))
+        self.assertEqual(Ticket.objects.filter(session=self.session, seat_number__in=[10, 11]).count(), 2)
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.sold_count, SeatEvent.objects.count()), (3, events))
+        # A new form gets a new key
+        self.assertNotEqual(self.client.get(url).context['idempotency_key'], key)
+
+    def test_checkout_retry(self):
+        url = reverse('cinema:checkout', args=[self.session.pk])
+        key = idempotency.new_key()
+        first = self.client.post(
+            url, {'action': 'book', 'seats': [12]}, content_type='application/json', headers={'Idempotency-Key': key}
+        )
+        retry = self.client.post(
+            url, {'action': 'book', 'seats': [12]}, content_type='application/json', headers={'Idempotency-Key': key}
+        )
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json()['seats'], first.json()['seats'])
+        # The same key cannot be used for other seats, and malformed keys are refused
+        response = self.client.post(
+            url, {'action': 'book', 'seats': [13], 'idempotency_key': key}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 422)
+        response = self.client.post(
+            url, {'action': 'book', 'seats': [13], 'idempotency_key': 'x' * 65}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 422)
+        # Another user's key space is separate
+        self.client.force_login(self.staff)
+        response = self.client.post(
+            url, {'action': 'book', 'seats': [12]}, content_type='application/json', headers={'Idempotency-Key': key}
+        )
+        self.assertEqual(response.status_code, 409)
+
+    def test_stale_key(self):
+        key = idempotency.new_key()
+        booking, = seating.claim_seats(self.session, self.user, [14], 'book', idempotency_key=key)
+        seating.release_holds(Booking.objects.filter(pk=booking.pk))
+        # A released hold is not replayed
+        self.assertIsNone(idempotency.replay(key, self.user, self.session, 'book', [14]))
+        # The freed seat is held by another user
+        seating.get_seat_map(self.session).clear(14)
+        other, = seating.claim_seats(self.session, self.staff, [14], 'book')
+        self.assertIsNone(idempotency.replay(key, self.user, self.session, 'book', [14]))
+        with self.assertRaises(seating.SeatUnavailable):
+            seating.claim_seats(self.session, self.user, [14], 'book', idempotency_key=key)
+
+        # Held again by the same user, with a new key
+        seating.release_holds(Booking.objects.filter(pk=other.pk))
+        seating.get_seat_map(self.session).clear(14)
+        seating.claim_seats(self.session, self.user, [14], 'book')
+        self.assertIsNone(idempotency.replay(key, self.user, self.session, 'book', [14]))
+
+    def test_failed_claim_and_expiry(self):
+        key = idempotency.new_key()
+        with self.assertRaises(seating.SeatUnavailable):
+            seating.claim_seats(self.session, self.user, [1, 3], 'buy', idempotency_key=key)
+        self.assertFalse(CheckoutKey.objects.exists())
+        # Nothing was stored, so the key is still free for the corrected request
+        claimed = seating.claim_seats(self.session, self.user, [1, 2], 'buy', idempotency_key=key)
+        with self.assertNumQueries(2):
+            self.assertEqual(seating.claim_seats(self.session, self.user, [2, 1], 'buy', idempotency_key=key), claimed)
+
+        later = timezone.now() + idempotency.CHECKOUT_KEY_TTL + timezone.timedelta(seconds=1)
+        self.assertIsNone(idempotency.replay(key, self.user, self.session, 'buy', [1, 2], now=later))
+        self.assertEqual(idempotency.prune(now=later), 1)
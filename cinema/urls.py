@@ -9,11 +9,15 @@ urlpatterns = [
 
     # Movie-related URLs
     path('movies/', views.MovieListView.as_view(), name='movie_list'),
+    path('movies/feed/', views.MovieListView.as_view(feed=True), name='movie_feed'),
     path('movies/<int:pk>/', views.MovieDetailView.as_view(), name='movie_detail'),
 
     # Session-related URLs
     path('sessions/', views.SessionListView.as_view(), name='session_list'),
+    path('sessions/feed/', views.SessionListView.as_view(feed=True), name='session_feed'),
     path('sessions/<int:session_id>/buy/', views.buy_ticket, name='buy_ticket'),
+    path('sessions/<int:session_id>/checkout/', views.checkout, name='checkout'),
+    path('sessions/<int:session_id>/seats/events/', views.seat_events, name='seat_events'),
 
     # Ticket-related URLs
     path('tickets/', views.TicketListView.as_view(), name='ticket_list'),
@@ -23,29 +27,49 @@ urlpatterns = [
     path('bookings/<int:booking_id>/cancel/', views.cancel_booking, name='cancel_booking'),
 
     # Review-related URLs
+    path('reviews/', views.ReviewListView.as_view(), name='review_list'),
+    path('reviews/feed/', views.ReviewListView.as_view(feed=True), name='review_feed'),
     path('movies/<int:movie_id>/review/', views.ReviewCreateView.as_view(), name='create_review'),
 
     # News-related URLs
     path('news/', views.NewsListView.as_view(), name='news_list'),
+    path('news/feed/', views.NewsListView.as_view(feed=True), name='news_feed'),
     path('news/<int:pk>/', views.NewsDetailView.as_view(), name='news_detail'),
 
+    # Search URLs
+    path('search/', views.site_search, name='search'),
+    path('search/autocomplete/', views.search_autocomplete, name='search_autocomplete'),
+
     # FAQ-related URLs
     path('faq/', views.FAQListView.as_view(), name='faq_list'),
 
     # Company information URLs
     path('about/', views.CompanyInfoView.as_view(), name='company_info'),
     path('vacancies/', views.VacancyListView.as_view(), name='vacancy_list'),
-    path('vacancies/<int:pk>/', views.VacancyDetailView.as_view(), name='vacancy_detail'),
+
+    # Promo codes
+    path('promo/', views.promo_codes, name='promo_codes'),
 
     # Contact-related URLs
-    path('contacts/', views.ContactView.as_view(), name='contacts'),
-    path('privacy-policy/', views.PrivacyPolicyView.as_view(), name='privacy_policy'),
+    path('contacts/', views.contacts, name='contacts'),
+    path('privacy-policy/', views.privacy_policy, name='privacy_policy'),
 
     # Authentication URLs
     path('register/', views.RegisterView.as_view(), name='register'),
-    path('logout/', views.logout_view, name='logout'),
+    path('logout/', views.custom_logout, name='logout'),
 
     # Admin dashboard URLs
     path('dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('dashboard/statistics/', views.admin_statistics, name='admin_statistics'),
+    path('dashboard/users/', views.user_statistics, name='user_statistics'),
+    path('dashboard/profiling/', views.profiling_dashboard, name='profiling_dashboard'),
+    path('dashboard/export/<str:dataset>/', views.export_data, name='export_data'),
+
+    # Read-only JSON API
+    path('api/v1/movies/', views.api_movies, name='api_movies'),
+    path('api/v1/movies/<int:pk>/', views.api_movie, name='api_movie'),
+    path('api/v1/genres/', views.api_genres, name='api_genres'),
+    path('api/v1/sessions/', views.api_sessions, name='api_sessions'),
+    path('api/v1/sessions/<int:pk>/seats/', views.api_seat_map, name='api_seat_map'),
+    path('api/v1/sessions/<int:pk>/best-seats/', views.api_best_seats, name='api_best_seats'),
 ] 
\ No newline at end of file
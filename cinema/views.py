@@ -1,60 +1,117 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
+from django.template.response import TemplateResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
-from django.db.models import Avg, Count, Sum, Q
+from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.utils.text import Truncator
+from django.db.models import Avg, Count, F, Max, Sum, Q
 from django.utils import timezone
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import logout
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_GET, require_http_methods
 from django.contrib import messages
-from django.db.models.functions import TruncDate, TruncMonth
-from django.http import JsonResponse
+from django.db.models.functions import TruncMonth
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Paginator
 from .models import (
-    Movie, Session, Ticket, Review, News, FAQ,
-    CompanyInfo, Vacancy, PromoCode, User, Booking
+    Movie, Genre, Session, Ticket, Review, News, FAQ,
+    CompanyInfo, Vacancy, PromoCode, User, Booking, DailySalesRollup,
+    DailyUserActivity
 )
 from .forms import CustomUserCreationForm
+from .pagination import AsyncListMixin, KeysetPaginationMixin
+from . import (
+    api, caching, exports, facets, idempotency, layouts, live, pricing, profiling, promos, search, seating, statistics
+)
 from datetime import timedelta
+import asyncio
+import json
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
 
-def home(request):
+@caching.cache_anonymous(Movie, News)
+async def home(request):
     """
     Home page view that displays latest news and upcoming movies.
     Returns a context with the latest news and upcoming movies for the next 5 days.
     """
-    # Get the latest published news
-    latest_news = News.objects.filter(is_published=True).order_by('-created_at')[:1]
-    # Get upcoming movies for the next 5 days
-    upcoming_movies = Movie.objects.filter(release_date__gte=timezone.now()).order_by('release_date')[:5]
+    # Get the latest published news and upcoming movies for the next 5 days
+    latest_news, upcoming_movies, fragments = await asyncio.gather(
+        _alist(News.objects.filter(is_published=True).order_by('-created_at')[:1]),
+        _alist(Movie.objects.filter(release_date__gte=timezone.now()).order_by('release_date')[:5]),
+        caching.afragment_context(Movie),
+    )
     
     context = {
         'latest_news': latest_news,
         'upcoming_movies': upcoming_movies,
+        **fragments,
     }
-    return render(request, 'cinema/home.html', context)
+    # Rendered by the handler in a worker thread, where the template may still load the user and messages
+    return TemplateResponse(request, 'cinema/home.html', context)
 
-class MovieListView(ListView):
+@method_decorator(caching.cache_anonymous(Movie, Genre, Session), name='dispatch')
+class MovieListView(KeysetPaginationMixin, ListView):
     """
-    View for displaying a list of all movies with optional genre filtering.
-    Supports pagination and genre filtering through URL parameters.
+    View for displaying a list of all movies with faceted filtering.
+    Genres, countries, rating and duration bands and "sessions this week" can be
+    combined through URL parameters; the counts next to every option come from
+    the precomputed facet index in cinema.facets.
     """
     model = Movie
     template_name = 'cinema/movie_list.html'
     context_object_name = 'movies'
     paginate_by = 12  # Number of movies per page
+    # The facet index already lists the ids in this order; the cursor is the last movie id
+    keyset_ordering = ('-release_date', '-id')
 
     def get_queryset(self):
         """
-        Returns a filtered queryset of movies based on genre parameter.
-        If no genre is specified, returns all movies ordered by release date.
+        Returns the ids of the matching movies, newest first.
+        Only the current page is loaded from the database, in get_context_data.
         """
-        queryset = Movie.objects.all()
-        genre = self.request.GET.get('genre')
-        if genre:
-            queryset = queryset.filter(genres__name=genre)
-        return queryset.order_by('-release_date')
+        self.selection = facets.parse_selection(self.request.GET)
+        movie_ids, self.facet_counts = facets.browse(self.selection)
+        return movie_ids
 
+    def get_context_data(self, **kwargs):
+        """
+        Loads the movies of the current page and adds the facet counts and
+        the cache settings for the movie card fragments.
+        """
+        context = super().get_context_data(**kwargs)
+        page_ids = list(context['object_list'])
+        # Only the fields rendered on the movie cards are loaded
+        movies = Movie.objects.only(
+            'id', 'title', 'description', 'poster', 'poster_variants', 'release_date'
+        ).in_bulk(page_ids)
+        context['object_list'] = context['movies'] = [movies[pk] for pk in page_ids if pk in movies]
+        context['facets'] = [
+            {'name': name, 'title': title, 'options': self.facet_counts[name]}
+            for name, title in facets.FACETS.items()
+        ]
+        context['has_filters'] = bool(self.selection)
+        context['movie_count'] = len(self.object_list)
+        context.update(caching.fragment_context(Movie))
+        return context
+
+    def feed_item(self, movie):
+        return {
+            'id': movie.pk,
+            'title': movie.title,
+            'release_date': movie.release_date,
+            'poster': movie.poster.url if movie.poster else None,
+            'url': reverse('cinema:movie_detail', args=[movie.pk]),
+        }
+
+# Seat counts change with every sale and send no signals, so detail pages are kept briefly
+@method_decorator(caching.cache_anonymous(Movie, Genre, Session, Review, timeout=30), name='get')
 class MovieDetailView(DetailView):
     """
     View for displaying detailed information about a specific movie.
@@ -63,23 +120,37 @@ class MovieDetailView(DetailView):
     model = Movie
     template_name = 'cinema/movie_detail.html'
     context_object_name = 'movie'
+    queryset = Movie.objects.prefetch_related('genres')
 
-    def get_context_data(self, **kwargs):
+    async def get(self, request, *args, **kwargs):
         """
-        Adds additional context data including active sessions and reviews.
+        Loads the movie, then its active sessions, reviews and average rating concurrently.
         """
-        context = super().get_context_data(**kwargs)
-        # Get active sessions for the movie
-        context['sessions'] = Session.objects.filter(
-            movie=self.object,
-            start_time__gte=timezone.now(),
-            is_active=True
-        ).order_by('start_time')
-        # Get all reviews for the movie
-        context['reviews'] = Review.objects.filter(movie=self.object).order_by('-created_at')
-        return context
-
-class SessionListView(ListView):
+        self.object = await aget_object_or_404(self.get_queryset(), pk=kwargs['pk'])
+        reviews = Review.objects.filter(movie=self.object).select_related('user').order_by('-created_at')
+        fragments = await caching.afragment_context(Review)
+        # While the reviews fragment is cached the reviews are not loaded; should it
+        # expire before rendering, the template falls back to the lazy queryset
+        reviews_cached = await cache.ahas_key(
+            make_template_fragment_key('movie_reviews', [self.object.pk, fragments['cache_version']])
+        )
+        sessions, rating, *loaded_reviews = await asyncio.gather(
+            _alist(Session.objects.filter(
+                movie=self.object,
+                start_time__gte=timezone.now(),
+                is_active=True
+            ).select_related('hall').order_by('start_time')),
+            Review.objects.filter(movie=self.object).aaggregate(average=Avg('rating')),
+            *([] if reviews_cached else [_alist(reviews)]),
+        )
+        context = self.get_context_data(object=self.object)
+        context.update(fragments)
+        context['sessions'] = sessions
+        context['reviews'] = loaded_reviews[0] if loaded_reviews else reviews
+        context['average_rating'] = rating['average'] if rating['average'] is not None else self.object.rating
+        return self.render_to_response(context)
+
+class SessionListView(KeysetPaginationMixin, AsyncListMixin, ListView):
     """
     View for displaying a list of all active movie sessions.
     Shows only future sessions that are marked as active.
@@ -88,15 +159,43 @@ class SessionListView(ListView):
     template_name = 'cinema/session_list.html'
     context_object_name = 'sessions'
     paginate_by = 20  # Number of sessions per page
+    keyset_ordering = ('start_time', 'id')
 
     def get_queryset(self):
         """
         Returns a queryset of active future sessions.
+        Supports hiding sold-out sessions (?available=1) and sorting by
+        occupancy (?sort=occupancy) straight from the occupancy counters.
         """
-        return Session.objects.filter(
+        queryset = Session.objects.filter(
             start_time__gte=timezone.now(),
             is_active=True
-        ).order_by('start_time')
+        ).select_related('movie', 'hall').only(
+            'id', 'start_time', 'price', 'movie__title', 'hall__name'
+        )
+        if self.request.GET.get('available'):
+            queryset = queryset.filter(total_seats__gt=F('sold_count') + F('held_count'))
+        if self.request.GET.get('sort') == 'occupancy':
+            return queryset.alias(
+                occupied=F('sold_count') + F('held_count')
+            ).order_by('-occupied', 'start_time')
+        return queryset.order_by('start_time')
+
+    def get_keyset_ordering(self):
+        # Occupancy changes with every sale, so that order is paginated by page number
+        if self.request.GET.get('sort') == 'occupancy':
+            return None
+        return self.keyset_ordering
+
+    def feed_item(self, session):
+        return {
+            'id': session.pk,
+            'movie': session.movie.title,
+            'hall': session.hall.name,
+            'start_time': session.start_time,
+            'price': session.price,
+            'url': reverse('cinema:buy_ticket', args=[session.pk]),
+        }
 
 class TicketListView(LoginRequiredMixin, ListView):
     """
@@ -111,7 +210,9 @@ class TicketListView(LoginRequiredMixin, ListView):
         """
         Returns a queryset of tickets for the current user.
         """
-        return Ticket.objects.filter(user=self.request.user).order_by('-purchase_date')
+        return Ticket.objects.filter(
+            user=self.request.user
+        ).select_related('session__movie', 'session__hall').order_by('-purchase_date')
 
 @login_required
 def buy_ticket(request, session_id):
@@ -124,88 +225,175 @@ def buy_ticket(request, session_id):
         session_id: ID of the session to buy/book tickets for
     """
     # Get the session or return 404
-    session = get_object_or_404(Session, id=session_id)
+    session = get_object_or_404(Session.objects.select_related('movie', 'hall'), id=session_id)
     
     # Check if the session hasn't started yet
     if session.start_time <= timezone.now():
         messages.error(request, 'This session has already started or ended.')
         return redirect('cinema:movie_detail', pk=session.movie.id)
     
-    # Get list of taken seats (both tickets and active bookings)
-    taken_seats = set(Ticket.objects.filter(session=session).values_list('seat_number', flat=True))
-    active_bookings = Booking.objects.filter(
-        session=session,
-        is_active=True,
-        expiry_date__gt=timezone.now()
-    )
-    booked_seats = set(active_bookings.values_list('seat_number', flat=True))
-    taken_seats.update(booked_seats)
-    
-    # Create list of available seats
-    available_seats = [seat for seat in range(1, session.total_seats + 1) if seat not in taken_seats]
-    
+    plan, has_layout = layouts.plan_for_session(session)
+    picked = []
     if request.method == 'POST':
         action = request.POST.get('action')
-        seat_number = request.POST.get('seat_number')
+        # Several seats can be selected at once; a single seat_number is still accepted
+        seat_numbers = request.POST.getlist('seat_numbers') or request.POST.getlist('seat_number')
+        promo_code = request.POST.get('promo_code', '').strip()
         
-        if seat_number:
+        if action == 'pick':
+            # Suggests the best adjacent seats; the buyer still confirms them below
+            count = request.POST.get('count', '')
+            categories = layouts.parse_categories(request.POST.get('category'))
+            if count.isdigit() and 1 <= int(count) <= seating.MAX_SEATS_PER_CLAIM and categories:
+                picked = plan.best_seats(seating.get_seat_map(session), int(count), categories)
+            if picked:
+                messages.info(request, 'The best available seats are selected.')
+            else:
+                messages.error(request, 'No adjacent seats of this kind are available.')
+        elif seat_numbers and action in ('book', 'buy'):
             try:
-                seat_number = int(seat_number)
-                if seat_number in taken_seats:
-                    messages.error(request, 'This seat is already taken.')
-                elif seat_number < 1 or seat_number > session.total_seats:
-                    messages.error(request, 'Invalid seat number.')
-                else:
-                    if action == 'book':
-                        # Create a booking with 15-minute expiry
-                        booking = Booking.objects.create(
-                            session=session,
-                            user=request.user,
-                            seat_number=seat_number,
-                            price=session.price,
-                            expiry_date=timezone.now() + timezone.timedelta(minutes=15)
-                        )
-                        messages.success(request, 'Seat successfully booked for 15 minutes!')
-                        return redirect('cinema:booking_list')
-                    elif action == 'buy':
-                        # Create a ticket
-                        ticket = Ticket.objects.create(
-                            session=session,
-                            user=request.user,
-                            seat_number=seat_number,
-                            price=session.price
-                        )
-                        messages.success(request, 'Ticket successfully purchased!')
-                        return redirect('cinema:ticket_list')
+                seat_numbers = [int(seat_number) for seat_number in seat_numbers]
+                promo = promos.lookup(promo_code) if promo_code else None
+                # Taken seats are rejected from the cached seat map before touching the database
+                seating.claim_seats(
+                    session, request.user, seat_numbers, action, promo,
+                    idempotency_key=request.POST.get('idempotency_key') or None
+                )
             except ValueError:
                 messages.error(request, 'Invalid seat number format.')
+            except (seating.SeatUnavailable, promos.PromoUnavailable, idempotency.InvalidCheckoutKey) as exc:
+                messages.error(request, str(exc))
+            else:
+                if action == 'book':
+                    if len(seat_numbers) == 1:
+                        messages.success(request, 'Seat successfully booked for 15 minutes!')
+                    else:
+                        messages.success(request, 'Seats successfully booked for 15 minutes!')
+                    return redirect('cinema:booking_list')
+                if len(seat_numbers) == 1:
+                    messages.success(request, 'Ticket successfully purchased!')
+                else:
+                    messages.success(request, 'Tickets successfully purchased!')
+                return redirect('cinema:ticket_list')
     
+    seat_map = seating.get_seat_map(session)
     context = {
         'session': session,
-        'available_seats': available_seats,
+        'available_seats': seat_map.free_seats(),
+        'seat_rows': plan.grid(seat_map) if has_layout else None,
+        'picked': picked,
+        'max_seats': seating.MAX_SEATS_PER_CLAIM,
+        'prices': pricing.get_table(session).current(session.occupancy_rate),
+        # Seat events are only streamed under ASGI; under WSGI the page polls the seat map
+        'live_seats': isinstance(request, ASGIRequest),
+        # A new key per rendered form, so that submitting it twice claims the seats once
+        'idempotency_key': idempotency.new_key(),
     }
     return render(request, 'cinema/buy_ticket.html', context)
 
+@login_required
+@require_http_methods(["POST"])
+def checkout(request, session_id):
+    """
+    JSON endpoint for multi-seat checkout.
+    Accepts either a JSON body {"action": "buy" | "book", "seats": [...],
+    "promo_code": ..., "idempotency_key": ...} or the form fields action,
+    seat_numbers, promo_code and idempotency_key, claims all seats in one
+    transaction and returns a result per seat. If any seat conflicts,
+    nothing is written and the remaining seats are reported as rolled back.
+    A request repeated with the same key (or Idempotency-Key header) gets
+    the original result again.
+    """
+    session = get_object_or_404(Session, id=session_id)
+    
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body)
+            action = payload.get('action')
+            seats = payload.get('seats') or []
+            promo_code = str(payload.get('promo_code') or '').strip()
+            key = payload.get('idempotency_key')
+        except (ValueError, AttributeError):
+            return JsonResponse({'ok': False, 'error': 'Invalid JSON body.'}, status=400)
+    else:
+        action = request.POST.get('action')
+        seats = request.POST.getlist('seat_numbers')
+        promo_code = request.POST.get('promo_code', '').strip()
+        key = request.POST.get('idempotency_key')
+    key = request.headers.get('Idempotency-Key') or key or None
+    
+    if action not in ('book', 'buy'):
+        return JsonResponse({'ok': False, 'error': 'Unknown action.'}, status=400)
+    try:
+        promo = promos.lookup(promo_code) if promo_code else None
+    except promos.PromoUnavailable as exc:
+        return JsonResponse({'ok': False, 'error': str(exc)}, status=400)
+    try:
+        seat_numbers = sorted({int(seat) for seat in seats})
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'Invalid seat number format.'}, status=400)
+    if session.start_time <= timezone.now():
+        return JsonResponse({'ok': False, 'error': 'This session has already started or ended.'}, status=400)
+    
+    try:
+        claimed = seating.claim_seats(session, request.user, seat_numbers, action, promo, idempotency_key=key)
+    except idempotency.InvalidCheckoutKey as exc:
+        return JsonResponse({'ok': False, 'error': str(exc)}, status=422)
+    except promos.PromoUnavailable as exc:
+        return JsonResponse({'ok': False, 'error': str(exc)}, status=409)
+    except seating.SeatUnavailable as exc:
+        return JsonResponse({
+            'ok': False,
+            'error': str(exc),
+            'seats': [
+                {'seat': seat, 'status': exc.conflicts.get(seat, 'rolled_back')}
+                for seat in seat_numbers
+            ],
+        }, status=409 if exc.conflicts else 400)
+    
+    return JsonResponse({
+        'ok': True,
+        'action': action,
+        'seats': [
+            {'seat': obj.seat_number, 'status': 'claimed', 'id': obj.pk, 'price': str(obj.price)}
+            for obj in claimed
+        ],
+    }, status=201)
+
+async def seat_events(request, session_id):
+    """
+    Server-Sent Events stream of seat claims and releases for a session,
+    used by the buy_ticket page to keep its seat list current.
+    Browsers resume after a reconnect through the Last-Event-ID header.
+    Under WSGI a stream would hold a worker thread for its whole lifetime,
+    so the view answers 204, which stops EventSource from reconnecting,
+    and the page polls the JSON seat map instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    session = await Session.objects.only('id', 'total_seats').filter(pk=session_id).afirst()
+    if session is None:
+        raise Http404('Session not found')
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    stream = live.SeatEventStream(session, int(last_event_id) if last_event_id.isdigit() else None)
+    response = StreamingHttpResponse(aiter(stream), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def booking_list(request):
     """
-    View for displaying user's active and expired bookings.
-    Automatically deactivates expired bookings.
+    View for displaying user's active bookings.
+    Holds that ran out are hidden even before the expire_bookings sweeper
+    deactivates them.
     """
     # Get active bookings
     active_bookings = Booking.objects.filter(
         user=request.user,
         is_active=True,
         expiry_date__gt=timezone.now()
-    ).order_by('expiry_date')
-    
-    # Get and deactivate expired bookings
-    expired_bookings = Booking.objects.filter(
-        user=request.user,
-        is_active=True,
-        expiry_date__lte=timezone.now()
-    )
-    expired_bookings.update(is_active=False)
+    ).select_related('session__movie', 'session__hall').order_by('expiry_date')
     
     context = {
         'active_bookings': active_bookings,
@@ -220,32 +408,48 @@ def cancel_booking(request, booking_id):
     """
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
     if booking.is_active and booking.expiry_date > timezone.now():
-        booking.is_active = False
-        booking.save()
+        seating.release_holds(Booking.objects.filter(pk=booking.pk))
         messages.success(request, 'Booking successfully canceled.')
     else:
         messages.error(request, 'Cannot cancel this booking.')
     return redirect('cinema:booking_list')
 
-class NewsListView(ListView):
+@method_decorator(caching.cache_anonymous(News), name='get')
+class NewsListView(KeysetPaginationMixin, AsyncListMixin, ListView):
     model = News
     template_name = 'cinema/news_list.html'
     context_object_name = 'news'
     paginate_by = 10
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         return News.objects.filter(is_published=True).order_by('-created_at')
 
+    def feed_item(self, news):
+        return {
+            'id': news.pk,
+            'title': news.title,
+            'created_at': news.created_at,
+            'summary': Truncator(news.content).words(30),
+            'url': reverse('cinema:news_detail', args=[news.pk]),
+        }
+
 class NewsDetailView(DetailView):
     model = News
     template_name = 'cinema/news_detail.html'
     context_object_name = 'news'
 
-class FAQListView(ListView):
+    async def get(self, request, *args, **kwargs):
+        self.object = await aget_object_or_404(News, pk=kwargs['pk'])
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+@method_decorator(caching.cache_anonymous(FAQ), name='get')
+class FAQListView(AsyncListMixin, ListView):
     model = FAQ
     template_name = 'cinema/faq_list.html'
     context_object_name = 'faqs'
 
+@method_decorator(caching.cache_anonymous(CompanyInfo), name='dispatch')
 class CompanyInfoView(DetailView):
     model = CompanyInfo
     template_name = 'cinema/company_info.html'
@@ -254,6 +458,7 @@ class CompanyInfoView(DetailView):
     def get_object(self):
         return CompanyInfo.objects.first()
 
+@method_decorator(caching.cache_anonymous(Vacancy), name='dispatch')
 class VacancyListView(ListView):
     model = Vacancy
     template_name = 'cinema/vacancy_list.html'
@@ -289,14 +494,12 @@ class ReviewCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy('cinema:movie_detail', kwargs={'pk': self.kwargs['movie_id']})
 
 def promo_codes(request):
-    active_promos = PromoCode.objects.filter(
-        is_active=True,
-        start_date__lte=timezone.now(),
-        end_date__gte=timezone.now()
-    )
-    expired_promos = PromoCode.objects.filter(
-        end_date__lt=timezone.now()
-    )
+    """
+    View for the current and archived promo codes.
+    """
+    now = timezone.now()
+    active_promos = PromoCode.objects.filter(is_active=True, expiry_date__gt=now).order_by('expiry_date')
+    expired_promos = PromoCode.objects.filter(expiry_date__lte=now).order_by('-expiry_date')
     context = {
         'active_promos': active_promos,
         'expired_promos': expired_promos,
@@ -310,14 +513,73 @@ def contacts(request):
 def privacy_policy(request):
     return render(request, 'cinema/privacy_policy.html')
 
-class ReviewListView(ListView):
+def site_search(request):
+    """
+    Full-text search over movies, news and reviews, best matches first.
+    An optional kind parameter limits the results to one kind.
+    """
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind')
+    hits = search.search(query, [kind] if kind in search.KINDS else None, limit=50) if query else []
+
+    # One query per kind to load the matched objects
+    objects = {}
+    for hit_kind, model in search.KINDS.items():
+        ids = [hit['id'] for hit in hits if hit['kind'] == hit_kind]
+        if ids:
+            queryset = model.objects.select_related('movie', 'user') if model is Review else model.objects.all()
+            objects[hit_kind] = queryset.in_bulk(ids)
+    results = [
+        dict(hit, object=objects[hit['kind']][hit['id']])
+        for hit in hits
+        if hit['id'] in objects.get(hit['kind'], {})
+    ]
+
+    context = {
+        'query': query,
+        'kind': kind,
+        'results': results,
+    }
+    return render(request, 'cinema/search.html', context)
+
+def search_autocomplete(request):
+    """
+    JSON suggestions of movie and news titles for the search box.
+    """
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'results': []})
+    results = []
+    for kind, object_id, title in search.autocomplete(query):
+        view_name = 'cinema:movie_detail' if kind == 'movie' else 'cinema:news_detail'
+        results.append({
+            'kind': kind,
+            'id': object_id,
+            'title': title,
+            'url': reverse(view_name, args=[object_id]),
+        })
+    return JsonResponse({'results': results})
+
+class ReviewListView(KeysetPaginationMixin, ListView):
     model = Review
     template_name = 'cinema/review_list.html'
     context_object_name = 'reviews'
     paginate_by = 10
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        return Review.objects.order_by('-created_at')
+        return Review.objects.select_related('user').only(
+            'id', 'rating', 'text', 'created_at', 'user__username'
+        ).order_by('-created_at')
+
+    def feed_item(self, review):
+        return {
+            'id': review.pk,
+            'user': review.user.username,
+            'rating': review.rating,
+            'text': review.text,
+            'created_at': review.created_at,
+        }
 
 class RegisterView(CreateView):
     form_class = CustomUserCreationForm
@@ -344,41 +606,50 @@ def admin_dashboard(request):
     # Overall statistics
     total_users = User.objects.count()
     total_movies = Movie.objects.count()
-    total_tickets = Ticket.objects.count()
-    total_revenue = Ticket.objects.aggregate(total=Sum('price'))['total'] or 0
+    # Sales figures come from the daily rollup rather than the ticket history
+    totals = DailySalesRollup.objects.aggregate(tickets=Sum('tickets'), revenue=Sum('revenue'))
+    total_tickets = totals['tickets'] or 0
+    total_revenue = totals['revenue'] or 0
 
     # Movie statistics
-    top_movies = Movie.objects.annotate(
-        ticket_count=Count('sessions__tickets'),
-        revenue=Sum('sessions__tickets__price')
+    top_movies = DailySalesRollup.objects.values('movie').annotate(
+        title=F('movie__title'),
+        ticket_count=Sum('tickets'),
+        revenue=Sum('revenue')
     ).order_by('-ticket_count')[:5]
 
     # Session statistics
     upcoming_sessions = Session.objects.filter(
         start_time__gte=timezone.now()
-    ).order_by('start_time')[:5]
+    ).select_related('movie', 'hall').order_by('start_time')[:5]
 
     # Sales statistics for the last 7 days
-    daily_sales = Ticket.objects.filter(
-        purchase_date__gte=timezone.now() - timezone.timedelta(days=7)
-    ).annotate(
-        date=TruncDate('purchase_date')
+    daily_sales = DailySalesRollup.objects.filter(
+        date__gte=timezone.localdate() - timezone.timedelta(days=7)
     ).values('date').annotate(
-        total=Count('id'),
-        revenue=Sum('price')
+        total=Sum('tickets'),
+        revenue=Sum('revenue')
     ).order_by('date')
 
-    # User activity statistics
-    active_users = User.objects.annotate(
-        ticket_count=Count('tickets')
+    # User activity statistics, from the per-user rollup
+    active_users = DailyUserActivity.objects.values('user', 'user__username').annotate(
+        ticket_count=Sum('tickets')
     ).filter(ticket_count__gt=0).order_by('-ticket_count')[:5]
 
     # Hall statistics
-    hall_stats = Session.objects.values('hall__name').annotate(
-        session_count=Count('id'),
-        ticket_count=Count('tickets'),
-        revenue=Sum('tickets__price')
-    ).order_by('-revenue')
+    hall_sales = {
+        row['hall']: row
+        for row in DailySalesRollup.objects.values('hall').annotate(
+            ticket_count=Sum('tickets'),
+            revenue=Sum('revenue')
+        )
+    }
+    hall_stats = Session.objects.values('hall', 'hall__name').annotate(session_count=Count('id'))
+    for hall in hall_stats:
+        sales = hall_sales.get(hall['hall'], {})
+        hall['ticket_count'] = sales.get('ticket_count', 0)
+        hall['revenue'] = sales.get('revenue', 0)
+    hall_stats = sorted(hall_stats, key=lambda hall: hall['revenue'], reverse=True)
 
     context = {
         'total_users': total_users,
@@ -397,63 +668,85 @@ def admin_dashboard(request):
 @user_passes_test(lambda u: u.is_staff)
 def user_statistics(request):
     # Получаем параметры фильтрации
-    start_date = request.GET.get('start_date', (timezone.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    end_date = request.GET.get('end_date', timezone.now().strftime('%Y-%m-%d'))
     sort_by = request.GET.get('sort_by', 'tickets')
 
-    # Преобразуем строки в объекты datetime
-    start_date = timezone.datetime.strptime(start_date, '%Y-%m-%d')
-    end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    # Границы периода: полночь по местному времени
+    start_date, end_date = statistics.date_range(request.GET.get('start_date'), request.GET.get('end_date'))
 
-    # Получаем всех пользователей с их статистикой
-    users = User.objects.annotate(
-        ticket_count=Count('ticket', filter=Q(ticket__purchase_date__range=[start_date, end_date])),
-        total_spent=Sum('ticket__price', filter=Q(ticket__purchase_date__range=[start_date, end_date])),
-        booking_count=Count('booking', filter=Q(booking__booking_date__range=[start_date, end_date])),
-        review_count=Count('review', filter=Q(review__created_at__range=[start_date, end_date]))
+    # Показатели за период берём из дневного свода активности, а не из истории
+    activity = statistics.rolled_up_activity(start_date, end_date)
+    activity_totals = activity.aggregate(
+        converted_users=Count('user'),
+        total_actions=Sum('actions'),
+        max_actions=Max('actions')
     )
+    # Общая статистика по пользователям одним агрегирующим запросом
+    totals = User.objects.aggregate(
+        total_users=Count('id'),
+        active_users_count=Count('id', filter=Q(last_login__range=[start_date, end_date])),
+        new_users_count=Count('id', filter=Q(date_joined__range=[start_date, end_date])),
+    )
+    total_users = totals['total_users']
+    avg_activity = round((activity_totals['total_actions'] or 0) / total_users if total_users else 0, 1)
+    # Конверсия: процент пользователей, совершивших хотя бы одно действие
+    conversion_rate = round(activity_totals['converted_users'] / total_users * 100 if total_users else 0, 1)
 
     # Сортируем пользователей
-    if sort_by == 'tickets':
-        users = users.order_by('-ticket_count')
-    elif sort_by == 'spent':
-        users = users.order_by('-total_spent')
-    elif sort_by == 'bookings':
-        users = users.order_by('-booking_count')
-    elif sort_by == 'reviews':
-        users = users.order_by('-review_count')
-
-    # Рассчитываем общую статистику
-    active_users_count = users.filter(last_login__range=[start_date, end_date]).count()
-    new_users_count = users.filter(date_joined__range=[start_date, end_date]).count()
-    
-    # Рассчитываем среднюю активность
-    total_actions = sum(user.ticket_count + user.booking_count + user.review_count for user in users)
-    avg_activity = round(total_actions / users.count() if users.count() > 0 else 0, 1)
-    
-    # Рассчитываем конверсию (процент пользователей, совершивших хотя бы одно действие)
-    active_users = users.filter(Q(ticket_count__gt=0) | Q(booking_count__gt=0) | Q(review_count__gt=0)).count()
-    conversion_rate = round((active_users / users.count() * 100) if users.count() > 0 else 0, 1)
+    sort_fields = {
+        'tickets': 'ticket_count',
+        'spent': 'total_spent',
+        'bookings': 'booking_count',
+        'reviews': 'review_count',
+    }
+    if sort_by not in sort_fields:
+        sort_by = 'tickets'
+    users = statistics.RankedUsers(
+        activity.order_by(f'-{sort_fields[sort_by]}', 'user'), activity_totals['converted_users'], total_users
+    )
+
+    paginator = Paginator(users, 50)  # Number of users per page
+    page_obj = paginator.get_page(request.GET.get('page'))
 
-    # Добавляем процент активности для каждого пользователя
-    max_actions = max((user.ticket_count + user.booking_count + user.review_count for user in users), default=1)
-    for user in users:
-        user_actions = user.ticket_count + user.booking_count + user.review_count
-        user.activity_percentage = round((user_actions / max_actions * 100) if max_actions > 0 else 0, 1)
+    # Процент активности считаем только для пользователей текущей страницы
+    max_actions = activity_totals['max_actions'] or 0
+    for user in page_obj:
+        user.activity_percentage = round(user.actions / max_actions * 100 if max_actions else 0, 1)
 
     context = {
-        'users': users,
+        'users': page_obj,
+        'page_obj': page_obj,
         'start_date': start_date,
         'end_date': end_date,
         'sort_by': sort_by,
-        'active_users_count': active_users_count,
-        'new_users_count': new_users_count,
+        'active_users_count': totals['active_users_count'],
+        'new_users_count': totals['new_users_count'],
         'avg_activity': avg_activity,
         'conversion_rate': conversion_rate,
     }
 
     return render(request, 'cinema/user_statistics.html', context)
 
+@login_required
+@user_passes_test(is_admin)
+def profiling_dashboard(request):
+    """
+    Staff view summarizing the recent requests of this process: the slowest
+    views and the most repeated SQL. POST clears the collected requests.
+    """
+    if request.method == 'POST':
+        profiling.clear()
+        messages.success(request, 'Profiling data cleared.')
+        return redirect('cinema:profiling_dashboard')
+
+    context = {
+        'enabled': profiling.PROFILING_ENABLED,
+        'buffer_size': profiling.PROFILING_BUFFER_SIZE,
+        'request_count': len(profiling.profiles()),
+        'slowest_views': profiling.slowest_views(),
+        'repeated_queries': profiling.repeated_queries(),
+    }
+    return render(request, 'cinema/admin_profiling.html', context)
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def admin_statistics(request):
@@ -462,67 +755,25 @@ def admin_statistics(request):
     Only accessible to staff users.
     """
     # Get filter parameters
-    start_date = request.GET.get('start_date', (timezone.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    end_date = request.GET.get('end_date', timezone.now().strftime('%Y-%m-%d'))
     stat_type = request.GET.get('stat_type', 'tickets')
 
-    # Convert strings to datetime objects
-    start_date = timezone.datetime.strptime(start_date, '%Y-%m-%d')
-    end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    # Local midnights bounding the selected days
+    start_date, end_date = statistics.date_range(request.GET.get('start_date'), request.GET.get('end_date'))
 
-    # Overall statistics
-    total_tickets = Ticket.objects.filter(purchase_date__range=[start_date, end_date]).count()
+    # Overall statistics, sales from the daily rollup
+    totals = DailySalesRollup.objects.filter(
+        date__range=[start_date.date(), (end_date - timedelta(days=1)).date()]
+    ).aggregate(tickets=Sum('tickets'), revenue=Sum('revenue'))
+    total_tickets = totals['tickets'] or 0
     active_bookings = Booking.objects.filter(
         booking_date__range=[start_date, end_date],
-        is_active=True,
-        expiry_date__gt=timezone.now()
+        is_active=True
     ).count()
-    total_revenue = Ticket.objects.filter(
-        purchase_date__range=[start_date, end_date]
-    ).aggregate(total=Sum('price'))['total'] or 0
+    total_revenue = totals['revenue'] or 0
 
-    # Movie statistics
-    movie_stats = Movie.objects.annotate(
-        tickets_sold=Count('sessions__tickets', filter=Q(sessions__tickets__purchase_date__range=[start_date, end_date])),
-        active_bookings=Count('sessions__bookings', filter=Q(
-            sessions__bookings__booking_date__range=[start_date, end_date],
-            sessions__bookings__is_active=True,
-            sessions__bookings__expiry_date__gt=timezone.now()
-        )),
-        revenue=Sum('sessions__tickets__price', filter=Q(sessions__tickets__purchase_date__range=[start_date, end_date])),
-        avg_rating=Avg('review__rating')
-    ).order_by('-tickets_sold')
-
-    # Session statistics
-    session_stats = Session.objects.filter(
-        start_time__range=[start_date, end_date]
-    ).annotate(
-        tickets_sold=Count('tickets'),
-        active_bookings=Count('bookings', filter=Q(
-            bookings__is_active=True,
-            bookings__expiry_date__gt=timezone.now()
-        ))
-    ).select_related('movie', 'hall')
-
-    # Calculate available seats and occupancy rate for each session
-    for session in session_stats:
-        occupied_seats = session.tickets_sold + session.active_bookings
-        session.remaining_seats = session.total_seats - occupied_seats
-        session.occupancy_rate = round((occupied_seats / session.total_seats * 100) if session.total_seats > 0 else 0)
-
-    # User activity statistics
-    user_activity = User.objects.annotate(
-        tickets_bought=Count('tickets', filter=Q(tickets__purchase_date__range=[start_date, end_date])),
-        active_bookings=Count('bookings', filter=Q(
-            bookings__booking_date__range=[start_date, end_date],
-            bookings__is_active=True,
-            bookings__expiry_date__gt=timezone.now()
-        )),
-        total_spent=Sum('tickets__price', filter=Q(tickets__purchase_date__range=[start_date, end_date])),
-        reviews_count=Count('review', filter=Q(review__created_at__range=[start_date, end_date]))
-    ).filter(
-        Q(tickets_bought__gt=0) | Q(active_bookings__gt=0) | Q(reviews_count__gt=0)
-    ).order_by('-tickets_bought')
+    movie_stats = statistics.movie_statistics(start_date, end_date)
+    session_stats = statistics.session_statistics(start_date, end_date)
+    user_activity = statistics.user_activity(start_date, end_date)
 
     # Calculate conversion rate
     total_users = User.objects.filter(date_joined__range=[start_date, end_date]).count()
@@ -532,7 +783,9 @@ def admin_statistics(request):
     context = {
         'start_date': start_date,
         'end_date': end_date,
+        'last_date': end_date - timedelta(days=1),
         'stat_type': stat_type,
+        'export_datasets': exports.DATASETS,
         'total_tickets': total_tickets,
         'active_bookings': active_bookings,
         'total_revenue': total_revenue,
@@ -543,3 +796,89 @@ def admin_statistics(request):
     }
 
     return render(request, 'cinema/admin_statistics.html', context)
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def export_data(request, dataset):
+    """
+    Streams a dataset for the selected period as CSV or JSON lines.
+    Only accessible to staff users.
+    """
+    if dataset not in exports.DATASETS:
+        raise Http404('Unknown dataset')
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.FORMATS:
+        return HttpResponseBadRequest('Unknown export format.')
+    try:
+        start_date, end_date = statistics.date_range(request.GET.get('start_date'), request.GET.get('end_date'))
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be given as YYYY-MM-DD.')
+
+    content_type, extension = exports.FORMATS[export_format]
+    response = StreamingHttpResponse(
+        exports.stream(dataset, export_format, start_date, end_date),
+        content_type=f'{content_type}; charset=utf-8'
+    )
+    filename = f"{dataset}_{start_date:%Y%m%d}_{end_date - timedelta(days=1):%Y%m%d}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@require_GET
+@api.conditional(api.movies_state)
+def api_movies(request):
+    """
+    JSON list of movies with their genre ids, newest first.
+    An optional genre parameter (a genre id) narrows the list.
+    """
+    return JsonResponse({'results': api.movie_rows(api.movie_queryset(request.GET))})
+
+@require_GET
+@api.conditional(api.movie_state)
+def api_movie(request, pk):
+    rows = api.movie_rows(Movie.objects.filter(pk=pk), api.MOVIE_DETAIL_FIELDS)
+    if not rows:
+        raise Http404('Movie not found')
+    return JsonResponse(rows[0])
+
+@require_GET
+@api.conditional(api.genres_state)
+def api_genres(request):
+    return JsonResponse({'results': api.genre_rows()})
+
+@require_GET
+@api.conditional(api.sessions_state)
+def api_sessions(request):
+    """
+    JSON schedule of one day, filtered by the date, hall and movie parameters.
+    """
+    queryset = api.session_queryset(request.GET)
+    if queryset is None:
+        return JsonResponse({'error': 'Dates must be given as YYYY-MM-DD.'}, status=400)
+    return JsonResponse({'results': api.session_rows(queryset)})
+
+@require_GET
+@api.conditional(api.seat_map_state)
+def api_seat_map(request, pk):
+    """
+    JSON seat map of a session: the taken seat numbers, from sold tickets and active holds.
+    """
+    session = getattr(request, '_api_session', None) or get_object_or_404(
+        Session.objects.only('id', 'total_seats'), pk=pk
+    )
+    return JsonResponse(api.seat_map_data(session))
+
+@require_GET
+def api_best_seats(request, pk):
+    """
+    JSON suggestion of the best ?count= adjacent free seats of a session,
+    optionally of one ?category= (standard, vip or accessible). Not cached,
+    since it follows every sale.
+    """
+    session = get_object_or_404(Session.objects.only('id', 'hall', 'total_seats'), pk=pk)
+    count = request.GET.get('count', '1')
+    categories = layouts.parse_categories(request.GET.get('category'))
+    if not count.isdigit() or not 1 <= int(count) <= seating.MAX_SEATS_PER_CLAIM:
+        return JsonResponse({'error': f'count must be between 1 and {seating.MAX_SEATS_PER_CLAIM}.'}, status=400)
+    if categories is None:
+        return JsonResponse({'error': 'Unknown seat category.'}, status=400)
+    return JsonResponse(api.best_seats_data(session, int(count), categories))
@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that its timings cover the rest of the stack
+    'cinema.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +57,8 @@ ROOT_URLCONF = 'cinema_app.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for cinema.profiling
+        'BACKEND': 'cinema.profiling.ProfiledTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,11 +81,38 @@ WSGI_APPLICATION = 'cinema_app.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # Point CINEMA_DB_NAME at a scratch copy for load tests
+        'NAME': os.environ.get('CINEMA_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        # Transactions take the write lock up front and wait for it, instead of
+        # failing with "database is locked" when concurrent requests write
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
     }
 }
 
 
+# Cache
+# Local memory by default; set CINEMA_CACHE_BACKEND=file to share the cache
+# between worker processes through CINEMA_CACHE_DIR.
+
+if os.environ.get('CINEMA_CACHE_BACKEND') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CINEMA_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cinema',
+        }
+    }
+
+# Seconds catalog pages and fragments stay cached (cinema.caching)
+CINEMA_CACHE_TIMEOUT = int(os.environ.get('CINEMA_CACHE_TIMEOUT', 300))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -132,6 +162,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Custom user model
+AUTH_USER_MODEL = 'cinema.User'
+
 # Login URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'cinema:home'
@@ -149,16 +182,18 @@ LOGGING = {
     },
     'handlers': {
         'file': {
-            'level': 'DEBUG',
+            'level': os.environ.get('DJANGO_LOG_LEVEL', 'WARNING'),
             'class': 'logging.FileHandler',
             'filename': os.path.join(BASE_DIR, 'debug.log'),
             'formatter': 'verbose',
         },
     },
     'loggers': {
+        # Writing every DEBUG record to the file cost time on each request;
+        # request timings are collected by cinema.profiling instead
         'django': {
             'handlers': ['file'],
-            'level': 'DEBUG',
+            'level': os.environ.get('DJANGO_LOG_LEVEL', 'WARNING'),
             'propagate': True,
         },
     },